@@ -210,7 +210,9 @@ CREATE TABLE node_components (
     confidence_score FLOAT DEFAULT 0.5,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     last_modified TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    version INTEGER DEFAULT 1
+    version INTEGER DEFAULT 1,
+    status VARCHAR(20) DEFAULT 'final',  -- 'provisional' while written page-by-page by a running PDF analysis
+    source_page INTEGER                  -- PDF page that produced a provisional component
 );
 
 -- Create indexes for node_components performance
@@ -222,4 +224,22 @@ CREATE INDEX idx_node_components_type ON node_components(component_type);
 CREATE TRIGGER update_node_components_last_modified
     BEFORE UPDATE ON node_components
     FOR EACH ROW
-    EXECUTE FUNCTION update_last_modified();
\ No newline at end of file
+    EXECUTE FUNCTION update_last_modified();
+
+-- Session Relationships table - Track node connections within sessions
+CREATE TABLE session_relationships (
+    id SERIAL PRIMARY KEY,
+    session_id UUID NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+    from_node_id VARCHAR(20) NOT NULL,
+    to_node_id VARCHAR(20) NOT NULL,
+    relationship_type VARCHAR(50) NOT NULL DEFAULT 'LEADS_TO',
+    explanation TEXT DEFAULT '',
+    created_by VARCHAR(100) DEFAULT 'CSV_IMPORT',
+    confidence_score FLOAT DEFAULT 1.0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE(session_id, from_node_id, to_node_id, relationship_type)
+);
+
+CREATE INDEX idx_session_relationships_session_id ON session_relationships(session_id);
+CREATE INDEX idx_session_relationships_from_node ON session_relationships(from_node_id);
+CREATE INDEX idx_session_relationships_to_node ON session_relationships(to_node_id);
@@ -90,7 +90,9 @@ CREATE TABLE IF NOT EXISTS node_components (
     confidence_score REAL DEFAULT 0.5,
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     last_modified DATETIME DEFAULT CURRENT_TIMESTAMP,
-    version INTEGER DEFAULT 1
+    version INTEGER DEFAULT 1,
+    status TEXT DEFAULT 'final',  -- 'provisional' while written page-by-page by a running PDF analysis
+    source_page INTEGER           -- PDF page that produced a provisional component
 );
 
 -- Session Relationships table - Track node connections within sessions
@@ -27,6 +27,7 @@ class UploadManager {
         this.componentManager = componentManager;
         this.cmsInstance = cmsInstance;
         this.domElements = domElements;
+        this.resetPageStream(null);
     }
 
     // ============================================================================
@@ -84,13 +85,15 @@ class UploadManager {
         // Show progress and start animation
         editorCanvas.classList.add('ai-processing');
         uploadText.textContent = 'Starting PDF analysis...';
+        this.resetPageStream(selectedNode);
 
         try {
             const formData = new FormData();
             formData.append('file', file);
 
-            // Use streaming endpoint for real-time progress
-            const response = await fetch(`${this.apiBaseUrl}/nodes/${selectedNode}/analyze-pdf-vision-stream`, {
+            // Use streaming endpoint for real-time progress (session scopes the per-page writes and tags the call metrics)
+            const sessionQuery = this.cmsInstance.sessionId ? `?session_id=${encodeURIComponent(this.cmsInstance.sessionId)}` : '';
+            const response = await fetch(`${this.apiBaseUrl}/nodes/${selectedNode}/analyze-pdf-vision-stream${sessionQuery}`, {
                 method: 'POST',
                 body: formData
             });
@@ -160,6 +163,9 @@ class UploadManager {
             case 'page_completed':
                 uploadText.textContent = data.message || `Completed page ${data.current_page}`;
                 break;
+            case 'page_components':
+                this.handlePageComponents(data);
+                break;
             case 'completed':
                 uploadText.textContent = data.message || 'Analysis completed!';
                 break;
@@ -208,11 +214,63 @@ class UploadManager {
         }
     }
 
+    /**
+     * Reset per-page streaming state at the start of an upload
+     * @param {string|null} nodeId - Node the upload's components belong to
+     */
+    resetPageStream(nodeId) {
+        this.pageStream = {
+            nodeId: nodeId,
+            nextPage: 1,
+            pending: {},
+            streamedComponents: 0,
+            started: false
+        };
+    }
+
+    /**
+     * Add one page's provisional components to the editor as soon as they arrive
+     * Pages can finish out of order, so they are buffered and appended in page order.
+     * @param {Object} data - page_components event
+     */
+    handlePageComponents(data) {
+        const stream = this.pageStream;
+        stream.started = true;
+        stream.pending[data.current_page] = data.component_sequence || [];
+
+        // Node changed mid-upload - components are still persisted server-side as provisional rows
+        if (this.cmsInstance.selectedNode !== stream.nodeId) {
+            return;
+        }
+
+        while (stream.pending[stream.nextPage] !== undefined) {
+            const pageComponents = stream.pending[stream.nextPage];
+            delete stream.pending[stream.nextPage];
+            stream.nextPage++;
+            if (pageComponents.length > 0) {
+                this.componentManager.createComponentsFromSequence(pageComponents);
+                stream.streamedComponents += pageComponents.length;
+            }
+        }
+
+        this.domElements.getUploadText().textContent = `Page ${data.current_page} of ${data.total_pages} ready`;
+    }
+
     /**
      * Handle PDF processing completion
      * @param {Object} response - Final AI response with component sequence
      */
     handlePDFComplete(response) {
+        if (this.pageStream.started) {
+            // Components were already added page by page - the final result only confirms them
+            if (this.pageStream.streamedComponents === 0) {
+                alert('No content could be extracted from the PDF');
+            }
+            console.log(`AI generated ${this.pageStream.streamedComponents} components (streamed per page)`);
+            this.resetPageStream(null);
+            return;
+        }
+
         if (response.component_sequence && response.component_sequence.length > 0) {
             // Create components directly from AI response using ComponentManager
             this.componentManager.createComponentsFromSequence(response.component_sequence);
@@ -265,7 +323,7 @@ class UploadManager {
     }
 
     /**
-     * Process CSV files (identify and parse node/relationship files)
+     * Process CSV files (identify node/relationship files and import them server-side)
      * @param {FileList} files - Selected CSV files
      */
     async processCsvFiles(files) {
@@ -285,309 +343,110 @@ class UploadManager {
             throw new Error('Node CSV file not found. Please include a file with "node-export" or "nodes" in the name.');
         }
 
-        // Parse CSV files
-        const csvParser = new CSVParser();
-        const nodeData = await csvParser.parseFile(nodeFile);
-        let relationshipData = [];
-
-        if (relationshipFile) {
-            relationshipData = await csvParser.parseFile(relationshipFile);
-        }
-
-        // Process and import data
-        await this.importCsvData(nodeData, relationshipData);
+        await this.importCsvFiles(nodeFile, relationshipFile);
     }
 
     /**
-     * Import CSV data (orchestrates multi-step import process)
-     * @param {Array} nodeData - Parsed node data
-     * @param {Array} relationshipData - Parsed relationship data
+     * Import CSV files in one request (orchestrates upload, progress and reload)
+     * The server parses and upserts the rows in batches and streams progress back.
+     * @param {File} nodeFile - Node CSV file
+     * @param {File|null} relationshipFile - Relationship CSV file (optional)
      */
-    async importCsvData(nodeData, relationshipData) {
-        console.log('🚀 === CSV IMPORT STARTED ===');
-        console.log('Input data:', { nodes: nodeData.length, relationships: relationshipData.length });
-
-        // Clear existing nodes and visual network
-        console.log('🧹 Clearing existing visual network...');
-        this.cmsInstance.clearVisualNetwork();
-        const nodeList = this.domElements.getNodeList();
-        nodeList.innerHTML = '';
-        this.cmsInstance.nodeCounter = 1;
-
-        // Create session nodes first (database persistence)
-        console.log('💾 Creating session nodes in database...');
-        await this.createSessionNodes(nodeData);
-        console.log(`✅ Created ${nodeData.length} session nodes in database`);
-
-        // Then create DOM nodes using session node creation
-        console.log('📝 Creating DOM nodes from session data...');
-        await this.cmsInstance.loadSessionNodes();
-        console.log(`✅ Created ${nodeData.length} DOM nodes from session`);
-
-        // Build relationship data
-        console.log('🔗 Processing relationships...');
-        this.processRelationships(nodeData, relationshipData);
-        console.log(`✅ Processed relationships: ${this.cmsInstance.relationships ? this.cmsInstance.relationships.length : 0} final relationships`);
-
-        // Persist relationships to database
-        if (this.cmsInstance.relationships && this.cmsInstance.relationships.length > 0) {
-            console.log('💾 Persisting relationships to database...');
-            await this.createSessionRelationships();
-            console.log(`✅ Persisted ${this.cmsInstance.relationships.length} relationships to database`);
-        } else {
-            console.log('ℹ️ No relationships to persist');
-        }
-
-        // Rebuild visual network with new data
-        console.log('🎨 Rebuilding visual network...');
-        if (this.cmsInstance.viewMode === 'visual') {
-            console.log('  Mode: VISUAL - Initializing visual network');
-            await this.cmsInstance.initializeVisualNetwork();
-        } else {
-            console.log('  Mode: LIST - Visual network not initialized');
+    async importCsvFiles(nodeFile, relationshipFile) {
+        const sessionId = this.cmsInstance.sessionId;
+        if (!sessionId) {
+            throw new Error('Session must be initialized before importing CSV files');
         }
 
-        // Select first node if available
-        if (nodeData.length > 0) {
-            const firstNodeId = nodeData[0].node_id || 'N001';
-            console.log(`🎯 Selecting first node: ${firstNodeId}`);
-            this.cmsInstance.selectNode(firstNodeId);
+        console.log('🚀 === CSV IMPORT STARTED ===');
+        const formData = new FormData();
+        formData.append('nodes_file', nodeFile);
+        if (relationshipFile) {
+            formData.append('relationships_file', relationshipFile);
         }
 
-        console.log('🎉 CSV import completed successfully');
-        console.log('📊 Final state:', {
-            visualNodes: this.cmsInstance.visualNodes.size,
-            relationships: this.cmsInstance.relationships ? this.cmsInstance.relationships.length : 0,
-            viewMode: this.cmsInstance.viewMode
+        const response = await fetch(`${this.apiBaseUrl}/session/${sessionId}/import-csv`, {
+            method: 'POST',
+            body: formData
         });
-        console.log('=== CSV IMPORT COMPLETE ===');
-    }
 
-    /**
-     * Extract node type from CSV data
-     * @param {Object} csvNode - CSV node data
-     * @returns {string} - Node type (core, support, enrichment)
-     */
-    extractNodeType(csvNode) {
-        // Primary: use 'type' field
-        if (csvNode.type) return csvNode.type;
-
-        // Secondary: parse from '~labels' field
-        if (csvNode['~labels']) {
-            const labels = csvNode['~labels'];
-            if (labels.includes('support')) return 'support';
-            if (labels.includes('enrichment')) return 'enrichment';
-            if (labels.includes('core')) return 'core';
+        if (!response.ok) {
+            const errorData = await response.json();
+            throw new Error(errorData.detail || 'Failed to start CSV import');
         }
 
-        // Default fallback
-        return 'core';
-    }
+        // Read the progress stream until the completed (or error) event
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let summary = null;
 
-    /**
-     * Create session nodes from CSV data in database
-     * @param {Array} nodeData - Parsed node data
-     */
-    async createSessionNodes(nodeData) {
-        const sessionId = this.cmsInstance.sessionId;
-
-        if (!sessionId) {
-            console.error('No session ID available for creating CSV nodes');
-            throw new Error('Session must be initialized before importing CSV nodes');
-        }
-
-        const creationPromises = nodeData.map(async (csvNode, index) => {
-            const nodeId = csvNode.node_id || `N${String(index + 1).padStart(3, '0')}`;
-            const title = csvNode.name || csvNode.title || nodeId;
-
-            // Extract metadata for database storage
-            const nodeType = this.extractNodeType(csvNode);
-            const difficulty = csvNode.difficulty ? parseInt(csvNode.difficulty) : null;
-            const timeMinutes = csvNode.time_minutes ? parseInt(csvNode.time_minutes) : null;
-            const description = csvNode.description || '';
-            const textbookPages = csvNode.textbook_pages || '';
-
-            const sessionNodeData = {
-                node_id: nodeId,
-                title: title,
-                raw_content: JSON.stringify({
-                    type: nodeType,
-                    difficulty: difficulty,
-                    time_minutes: timeMinutes,
-                    description: description,
-                    textbook_pages: textbookPages,
-                    original_csv_data: csvNode
-                }),
-                chapter_id: 1
-            };
-
-            try {
-                const response = await fetch(`${this.apiBaseUrl}/session/${sessionId}/nodes`, {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json'
-                    },
-                    body: JSON.stringify(sessionNodeData)
-                });
-
-                if (!response.ok) {
-                    const errorData = await response.json();
-
-                    // Handle duplicate node conflicts gracefully
-                    if (response.status === 400 && errorData.detail && errorData.detail.includes('already exists')) {
-                        console.warn(`⚠️ Node ${nodeId} already exists in session, skipping`);
-                        return { success: true, skipped: true, message: `Node ${nodeId} already exists` };
-                    }
+        while (true) {
+            const { done, value } = await reader.read();
 
-                    console.error(`Failed to create session node ${nodeId}:`, errorData);
-                    throw new Error(`Failed to create session node ${nodeId}: ${errorData.detail || 'Unknown error'}`);
-                }
+            if (done) {
+                break;
+            }
 
-                const result = await response.json();
-                console.log(`✅ Created session node ${nodeId}:`, result);
-                return result;
-            } catch (error) {
-                console.error(`Error creating session node ${nodeId}:`, error);
+            buffer += decoder.decode(value, { stream: true });
+            let lines = buffer.split('\n');
+            buffer = lines.pop(); // Keep incomplete line in buffer
 
-                // Allow CSV import to continue even if some nodes fail
-                console.warn(`⚠️ Continuing CSV import despite error with node ${nodeId}`);
-                return { success: false, error: error.message, nodeId: nodeId };
-            }
-        });
+            for (let line of lines) {
+                if (!line.startsWith('data: ')) continue;
 
-        try {
-            const results = await Promise.all(creationPromises);
-            const successful = results.filter(r => r.success && !r.skipped).length;
-            const skipped = results.filter(r => r.success && r.skipped).length;
-            const failed = results.filter(r => !r.success).length;
-
-            console.log(`📊 CSV Session Node Creation Summary:`);
-            console.log(`   ✅ Successfully created: ${successful}`);
-            if (skipped > 0) console.log(`   ⚠️ Skipped (already exist): ${skipped}`);
-            if (failed > 0) console.log(`   ❌ Failed: ${failed}`);
-
-            // Only throw if all nodes failed
-            if (failed === results.length) {
-                throw new Error('All CSV nodes failed to create in session');
+                const data = JSON.parse(line.substring(6));
+                if (data.status === 'error') {
+                    throw new Error(data.error);
+                }
+                if (data.status === 'completed') {
+                    summary = data;
+                }
+                this.updateCsvProgress(data);
             }
-        } catch (error) {
-            console.error('Failed to create CSV nodes in session:', error);
-            throw error;
         }
-    }
-
-    /**
-     * Create session relationships from processed CSV data
-     */
-    async createSessionRelationships() {
-        const sessionId = this.cmsInstance.sessionId;
 
-        if (!sessionId) {
-            console.error('No session ID available for creating CSV relationships');
-            throw new Error('Session must be initialized before importing CSV relationships');
+        if (!summary) {
+            throw new Error('CSV import ended before completing');
         }
+        console.log('📊 CSV import summary:', summary);
 
-        if (!this.cmsInstance.relationships || this.cmsInstance.relationships.length === 0) {
-            console.log('No relationships to persist');
-            return;
-        }
+        // Clear existing nodes and visual network, then rebuild from the session
+        console.log('🧹 Clearing existing visual network...');
+        this.cmsInstance.clearVisualNetwork();
+        const nodeList = this.domElements.getNodeList();
+        nodeList.innerHTML = '';
+        this.cmsInstance.nodeCounter = 1;
 
-        try {
-            const response = await fetch(`${this.apiBaseUrl}/session/${sessionId}/relationships/bulk`, {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
-                body: JSON.stringify({
-                    relationships: this.cmsInstance.relationships
-                })
-            });
+        await this.cmsInstance.loadSessionNodes();
+        await this.cmsInstance.loadSessionRelationships();
 
-            if (!response.ok) {
-                const errorData = await response.json();
-                console.error('Failed to create session relationships:', errorData);
-                throw new Error(`Failed to create session relationships: ${errorData.detail || 'Unknown error'}`);
-            }
+        if (this.cmsInstance.viewMode === 'visual') {
+            console.log('  Mode: VISUAL - Initializing visual network');
+            await this.cmsInstance.initializeVisualNetwork();
+        }
 
-            const result = await response.json();
-            console.log(`✅ Created ${result.count} session relationships:`, result);
-            return result;
-        } catch (error) {
-            console.error('Error creating session relationships:', error);
-            throw error;
+        // Select first imported node if available
+        const firstNode = nodeList.querySelector('[data-node-id]');
+        if (firstNode) {
+            this.cmsInstance.selectNode(firstNode.dataset.nodeId);
         }
+
+        console.log('=== CSV IMPORT COMPLETE ===');
     }
 
     /**
-     * Process relationships from CSV data
-     * @param {Array} nodeData - Parsed node data
-     * @param {Array} relationshipData - Parsed relationship data
+     * Show CSV import progress on the import button
+     * @param {Object} data - Progress event from the import stream
      */
-    processRelationships(nodeData, relationshipData) {
-        console.log('=== CSV RELATIONSHIP PROCESSING DEBUGGING ===');
-        console.log(`Input: ${nodeData.length} nodes, ${relationshipData.length} relationships`);
-
-        // Initialize relationship storage
-        this.cmsInstance.relationships = [];
-        this.cmsInstance.csvIdMap = new Map();
-
-        // Build CSV ID to node ID mapping with detailed logging
-        console.log('Building CSV ID mappings:');
-        nodeData.forEach((node, index) => {
-            if (node['~id'] && node.node_id) {
-                this.cmsInstance.csvIdMap.set(node['~id'], node.node_id);
-                console.log(`  ${index + 1}. "${node['~id']}" --> "${node.node_id}"`);
-            } else {
-                console.log(`  ${index + 1}. SKIPPED - Missing ~id or node_id:`, {
-                    '~id': node['~id'],
-                    'node_id': node.node_id
-                });
-            }
-        });
-
-        console.log(`Built ID mapping for ${this.cmsInstance.csvIdMap.size} nodes`);
-        console.log('Complete mapping:', Object.fromEntries(this.cmsInstance.csvIdMap));
-
-        // Process relationships with validation
-        if (relationshipData && relationshipData.length > 0) {
-            let validRelationships = 0;
-            let skippedRelationships = 0;
-
-            console.log('Processing relationships:');
-            relationshipData.forEach((rel, index) => {
-                console.log(`  Relationship ${index + 1}:`);
-                console.log(`    Raw: "${rel['~start_node_id']}" --[${rel['~relationship_type']}]--> "${rel['~end_node_id']}"`);
-
-                const fromId = this.cmsInstance.csvIdMap.get(rel['~start_node_id']);
-                const toId = this.cmsInstance.csvIdMap.get(rel['~end_node_id']);
-
-                console.log(`    Mapped: "${fromId}" --[${rel['~relationship_type']}]--> "${toId}"`);
-
-                if (fromId && toId && fromId !== toId) {
-                    const relationship = {
-                        from: fromId,
-                        to: toId,
-                        type: rel['~relationship_type'] || rel.type || 'LEADS_TO',
-                        explanation: rel.explanation || ''
-                    };
-                    this.cmsInstance.relationships.push(relationship);
-                    validRelationships++;
-                    console.log(`    ✅ VALID: Added relationship`);
-                } else {
-                    skippedRelationships++;
-                    console.log(`    ❌ SKIPPED: fromId=${!!fromId}, toId=${!!toId}, same=${fromId === toId}`);
-                    if (!fromId) console.log(`      Missing mapping for start_node_id: "${rel['~start_node_id']}"`);
-                    if (!toId) console.log(`      Missing mapping for end_node_id: "${rel['~end_node_id']}"`);
-                    if (fromId === toId) console.log(`      Self-referencing relationship: "${fromId}"`);
-                }
-            });
+    updateCsvProgress(data) {
+        const csvBtn = this.domElements.getCsvBtn();
 
-            console.log(`Processed relationships: ${validRelationships} valid, ${skippedRelationships} skipped`);
-            console.log('Final relationships array:', this.cmsInstance.relationships);
-        } else {
-            console.log('No relationship data found, will use sequential connections');
+        if (data.status === 'nodes_progress') {
+            csvBtn.innerHTML = `<i class="fas fa-spinner fa-spin"></i> Nodes: ${data.rows}`;
+        } else if (data.status === 'relationships_progress') {
+            csvBtn.innerHTML = `<i class="fas fa-spinner fa-spin"></i> Links: ${data.rows}`;
         }
-        console.log('=== END CSV RELATIONSHIP PROCESSING ===');
     }
 }
 
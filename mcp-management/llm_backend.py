@@ -6,6 +6,7 @@ With multimodal support for PDFs and images
 
 import os
 import sys
+import time
 import logging
 import base64
 from typing import Dict, List, Any, Optional, Union
@@ -15,6 +16,10 @@ import httpx
 # Add python-services to path for component schemas
 sys.path.insert(0, str(Path(__file__).parent.parent / "python-services"))
 from component_schemas import build_component_prompt_section
+from provider_rate_limiter import IMAGE_TOKENS, estimate_text_tokens, get_rate_limiter
+from api_retry_policy import classify_api_error
+from call_metrics import record_call
+from provider_replay import create_replay_client, get_replay_mode
 
 logger = logging.getLogger(__name__)
 
@@ -63,12 +68,18 @@ class LLMBackend:
     def _init_claude(self):
         """Initialize Claude client"""
         try:
-            from anthropic import Anthropic
-            api_key = os.getenv("ANTHROPIC_API_KEY")
-            if not api_key:
-                raise ValueError("ANTHROPIC_API_KEY not set")
-
-            self.claude_client = Anthropic(api_key=api_key)
+            replay_mode = get_replay_mode()
+            if replay_mode == "replay":
+                self.claude_client = create_replay_client("anthropic")
+            else:
+                from anthropic import Anthropic
+                api_key = os.getenv("ANTHROPIC_API_KEY")
+                if not api_key:
+                    raise ValueError("ANTHROPIC_API_KEY not set")
+
+                self.claude_client = Anthropic(api_key=api_key)
+                if replay_mode == "record":
+                    self.claude_client = create_replay_client("anthropic", live_client=self.claude_client)
             self.model = "claude-sonnet-4-5-20250929"
             logger.info(f"Initialized Claude client with model {self.model}")
         except ImportError:
@@ -99,9 +110,9 @@ class LLMBackend:
         system_message = self._build_system_message(context)
 
         if self.provider == "gemini":
-            return await self._chat_gemini(user_message, tools, system_message)
+            return await self._chat_gemini(user_message, tools, system_message, session_id=session_id)
         else:
-            return await self._chat_claude(user_message, tools, system_message)
+            return await self._chat_claude(user_message, tools, system_message, session_id=session_id)
 
     async def chat_with_file(self, user_message: str, file_data: Union[bytes, str],
                             session_id: Optional[str] = None, file_type: str = "auto") -> str:
@@ -137,9 +148,9 @@ class LLMBackend:
         # Route to appropriate provider with file support
         try:
             if self.provider == "gemini":
-                return await self._chat_gemini(user_message, tools, system_message, file_data, file_type)
+                return await self._chat_gemini(user_message, tools, system_message, file_data, file_type, session_id)
             else:
-                return await self._chat_claude(user_message, tools, system_message, file_data, file_type)
+                return await self._chat_claude(user_message, tools, system_message, file_data, file_type, session_id)
         except Exception as e:
             logger.error(f"Error in chat_with_file: {e}")
             return f"Error processing file: {str(e)}"
@@ -442,7 +453,8 @@ When the user asks to modify content, use content management tools. When asked a
         return True
 
     async def _chat_gemini(self, user_message: str, tools: List[Dict], system_message: str,
-                           file_data: Optional[Union[bytes, str]] = None, file_type: str = "pdf") -> str:
+                           file_data: Optional[Union[bytes, str]] = None, file_type: str = "pdf",
+                           session_id: Optional[str] = None) -> str:
         """
         Chat with Gemini (supports image processing, PDF requires conversion)
 
@@ -452,6 +464,7 @@ When the user asks to modify content, use content management tools. When asked a
             system_message: System context
             file_data: Optional PDF or image bytes (or path for PDF)
             file_type: 'pdf' or 'image'
+            session_id: Optional session ID (tags the call metrics)
         """
         from google.genai import types
 
@@ -510,12 +523,28 @@ When the user asks to modify content, use content management tools. When asked a
         # Add text part
         content_parts.append(types.Part.from_text(user_message))
 
+        # Wait for a slot in the shared Gemini limiter (free tier RPM is low)
+        rate_limiter = get_rate_limiter("gemini", self.model)
+        estimated_tokens = self._estimate_prompt_tokens(user_message, system_message, tools, file_data)
+        await rate_limiter.acquire_async(estimated_tokens)
+
         # Send message
-        response = self.gemini_client.models.generate_content(
-            model=self.model,
-            contents=content_parts,
-            config=config
-        )
+        payload_bytes = self._payload_size(user_message, system_message, image_bytes if file_data else None)
+        call_start = time.time()
+        try:
+            response = self.gemini_client.models.generate_content(
+                model=self.model,
+                contents=content_parts,
+                config=config
+            )
+        except Exception as e:
+            self._record_call("chat_gemini", call_start, payload_bytes, session_id, error=e)
+            raise
+        usage = getattr(response, "usage_metadata", None)
+        rate_limiter.settle(estimated_tokens, getattr(usage, "total_token_count", None))
+        self._record_call("chat_gemini", call_start, payload_bytes, session_id,
+                          prompt_tokens=getattr(usage, "prompt_token_count", 0),
+                          completion_tokens=getattr(usage, "candidates_token_count", 0))
 
         # Handle tool calls
         if response.candidates and response.candidates[0].content.parts:
@@ -535,7 +564,8 @@ When the user asks to modify content, use content management tools. When asked a
         return response.text
 
     async def _chat_claude(self, user_message: str, tools: List[Dict], system_message: str,
-                           file_data: Optional[Union[bytes, str]] = None, file_type: str = "pdf") -> str:
+                           file_data: Optional[Union[bytes, str]] = None, file_type: str = "pdf",
+                           session_id: Optional[str] = None) -> str:
         """
         Chat with Claude (supports native PDF and image processing)
 
@@ -545,6 +575,7 @@ When the user asks to modify content, use content management tools. When asked a
             system_message: System context
             file_data: Optional PDF or image bytes
             file_type: 'pdf' or 'image'
+            session_id: Optional session ID (tags the call metrics)
         """
         # Convert MCP tools to Claude format
         claude_tools = self._convert_tools_to_claude(tools)
@@ -581,14 +612,28 @@ When the user asks to modify content, use content management tools. When asked a
         # Add text message
         message_content.append({"type": "text", "text": user_message})
 
+        # Wait for a slot in the shared Anthropic limiter
+        rate_limiter = get_rate_limiter("anthropic", self.model)
+        estimated_tokens = self._estimate_prompt_tokens(user_message, system_message, tools, file_data) + 4096
+        await rate_limiter.acquire_async(estimated_tokens)
+
         # Send message
-        response = self.claude_client.messages.create(
-            model=self.model,
-            max_tokens=4096,
-            system=system_message,
-            tools=claude_tools,
-            messages=[{"role": "user", "content": message_content}]
-        )
+        payload_bytes = self._payload_size(user_message, system_message, encoded_data if file_data else None)
+        call_start = time.time()
+        try:
+            response = self.claude_client.messages.create(
+                model=self.model,
+                max_tokens=4096,
+                system=system_message,
+                tools=claude_tools,
+                messages=[{"role": "user", "content": message_content}]
+            )
+        except Exception as e:
+            self._record_call("chat_claude", call_start, payload_bytes, session_id, error=e)
+            raise
+        rate_limiter.settle(estimated_tokens, response.usage.input_tokens + response.usage.output_tokens)
+        self._record_call("chat_claude", call_start, payload_bytes, session_id,
+                          prompt_tokens=response.usage.input_tokens, completion_tokens=response.usage.output_tokens)
 
         # Handle tool calls
         if response.stop_reason == "tool_use":
@@ -604,6 +649,31 @@ When the user asks to modify content, use content management tools. When asked a
 
         return "No response"
 
+    def _estimate_prompt_tokens(self, user_message: str, system_message: str, tools: List[Dict],
+                                file_data: Optional[Union[bytes, str]] = None) -> int:
+        """Rough prompt size for the rate limiter (actual usage is settled after the call)"""
+        tokens = estimate_text_tokens(user_message) + estimate_text_tokens(system_message)
+        tokens += sum(estimate_text_tokens(str(tool)) for tool in tools)
+        if file_data:
+            tokens += IMAGE_TOKENS
+        return tokens
+
+    def _payload_size(self, user_message: str, system_message: str, file_data: Optional[Union[bytes, str]]) -> int:
+        return len(user_message) + len(system_message) + (len(file_data) if file_data else 0)
+
+    def _record_call(self, operation: str, call_start: float, payload_bytes: int, session_id: Optional[str],
+                     prompt_tokens: int = 0, completion_tokens: int = 0, error: Optional[Exception] = None):
+        """Add one provider call to the shared call metrics"""
+        record_call(
+            self.provider, self.model, operation, time.time() - call_start,
+            status="error" if error else "success",
+            error_class=classify_api_error(error) if error else None,
+            prompt_tokens=prompt_tokens or 0,
+            completion_tokens=completion_tokens or 0,
+            payload_bytes=payload_bytes,
+            tags={"session_id": session_id}
+        )
+
     def _convert_tools_to_gemini(self, tools: List[Dict]) -> List:
         """Convert MCP tools to Gemini function format"""
         from google.genai import types
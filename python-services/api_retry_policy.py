@@ -0,0 +1,131 @@
+import json
+import random
+import time
+import logging
+from email.utils import parsedate_to_datetime
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# Failure classes for model API calls
+RATE_LIMIT = "rate_limit"
+TIMEOUT = "timeout"
+SERVER_ERROR = "server_error"
+PAYLOAD_ERROR = "payload_error"
+PARSE_ERROR = "parse_error"
+VALIDATION_ERROR = "validation_error"
+CLIENT_ERROR = "client_error"
+UNKNOWN_ERROR = "unknown_error"
+
+# Per-class policy:
+#   max_retries - retries allowed for this class within one page call
+#   degrade     - step down the image quality/resolution ladder before retrying
+#   reask       - re-ask the model about its previous reply (text only, no image re-upload)
+RETRY_POLICIES = {
+    RATE_LIMIT: {"max_retries": 5, "degrade": False, "reask": False},
+    TIMEOUT: {"max_retries": 3, "degrade": True, "reask": False},
+    PAYLOAD_ERROR: {"max_retries": 3, "degrade": True, "reask": False},
+    SERVER_ERROR: {"max_retries": 3, "degrade": False, "reask": False},
+    PARSE_ERROR: {"max_retries": 2, "degrade": False, "reask": True},
+    VALIDATION_ERROR: {"max_retries": 1, "degrade": False, "reask": True},
+    CLIENT_ERROR: {"max_retries": 0, "degrade": False, "reask": False},
+    UNKNOWN_ERROR: {"max_retries": 3, "degrade": False, "reask": False},  # Nothing says the image is at fault
+}
+
+# Substrings of 400-level error messages that mean the request body (image) was too big
+PAYLOAD_ERROR_MARKERS = ("too large", "maximum context length", "image size", "payload", "too many tokens")
+
+RATE_LIMIT_BASE_DELAY = 2.0   # Seconds, doubled per consecutive rate limit when no Retry-After is sent
+RATE_LIMIT_MAX_DELAY = 60.0
+
+
+class ResponseParseError(ValueError):
+    """Model reply could not be parsed as JSON (even after local repair)"""
+
+    def __init__(self, message: str, raw_text: str):
+        super().__init__(message)
+        self.raw_text = raw_text
+
+
+class ResponseValidationError(ValueError):
+    """Model reply parsed but doesn't have the expected structure"""
+
+    def __init__(self, message: str, raw_text: str, parsed: Any = None):
+        super().__init__(message)
+        self.raw_text = raw_text
+        self.parsed = parsed
+
+
+def classify_api_error(error: Exception) -> str:
+    """
+    Map an exception from a model call to one of the failure classes above
+
+    Works on the OpenAI and Anthropic SDK exceptions by duck typing (status_code,
+    class name) so the same policies apply to every provider.
+    """
+    if isinstance(error, (ResponseParseError, json.JSONDecodeError)):
+        return PARSE_ERROR
+    if isinstance(error, ResponseValidationError):
+        return VALIDATION_ERROR
+
+    status_code = getattr(error, "status_code", None)
+    error_name = type(error).__name__
+
+    if status_code == 429 or error_name == "RateLimitError":
+        # Quota exhaustion also comes back as 429 but waiting won't fix it
+        if getattr(error, "code", None) == "insufficient_quota":
+            return CLIENT_ERROR
+        return RATE_LIMIT
+    if isinstance(error, TimeoutError) or "Timeout" in error_name or status_code in (408, 504):
+        return TIMEOUT
+    if status_code == 413:
+        return PAYLOAD_ERROR
+    if status_code == 400 and any(marker in str(error).lower() for marker in PAYLOAD_ERROR_MARKERS):
+        return PAYLOAD_ERROR
+    if (status_code is not None and status_code >= 500) or error_name in ("APIConnectionError", "InternalServerError"):
+        return SERVER_ERROR
+    if status_code is not None and 400 <= status_code < 500:
+        return CLIENT_ERROR
+    return UNKNOWN_ERROR
+
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """Seconds the server asked us to wait (retry-after-ms / retry-after headers), or None"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return max(0.0, float(retry_after_ms) / 1000)
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        # HTTP-date form
+        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def get_rate_limit_delay(error: Exception, rate_limit_count: int) -> float:
+    """Honor the server's Retry-After; otherwise exponential backoff with jitter"""
+    retry_after = get_retry_after(error)
+    if retry_after is not None:
+        return min(retry_after, RATE_LIMIT_MAX_DELAY)
+    delay = RATE_LIMIT_BASE_DELAY * (2 ** max(0, rate_limit_count - 1))
+    return min(delay, RATE_LIMIT_MAX_DELAY) * random.uniform(0.8, 1.2)
+
+
+def get_retry_policy(error_class: str) -> Dict[str, Any]:
+    """Policy for a failure class (unclassified failures keep the old degrade-and-retry behavior)"""
+    return RETRY_POLICIES.get(error_class, RETRY_POLICIES[UNKNOWN_ERROR])
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+PDF -> components pipeline benchmark
+
+Runs analyze_pdf_for_components over sample PDFs against the offline replay
+provider (or live, to record replies for later runs) and reports pages/sec,
+page latency percentiles, peak RSS and retry counts.
+
+    python benchmark_pipeline.py                       # every PDF in ../uploads/pdfs, replayed
+    python benchmark_pipeline.py a.pdf b.pdf --repeat 3 --latency 0.8 --rate-limit-rate 0.05
+    python benchmark_pipeline.py a.pdf --record        # live calls, replies saved for replay
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import logging
+import tempfile
+from typing import Dict, Any, List
+
+from dotenv import load_dotenv
+
+try:
+    import resource
+    RESOURCE_AVAILABLE = True
+except ImportError:
+    RESOURCE_AVAILABLE = False  # Windows
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_PDF_GLOB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "uploads", "pdfs", "*.pdf")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the PDF -> components pipeline")
+    parser.add_argument("pdfs", nargs="*", help=f"PDFs to analyze (default: {DEFAULT_PDF_GLOB})")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per PDF")
+    parser.add_argument("--record", action="store_true", help="Call the live API and record its replies")
+    parser.add_argument("--recordings", default="llm_replay_recordings.jsonl", help="Recorded replies file")
+    parser.add_argument("--latency", type=float, default=1.5, help="Median simulated latency (seconds)")
+    parser.add_argument("--latency-sigma", type=float, default=0.4, help="Log-normal spread of the latency")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="Fraction of requests that time out")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction answered with a 429")
+    parser.add_argument("--server-error-rate", type=float, default=0.0, help="Fraction answered with a 5xx")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="Fraction with unparseable JSON")
+    parser.add_argument("--truncated-rate", type=float, default=0.0, help="Fraction cut off at max_tokens")
+    parser.add_argument("--max-concurrency", type=int, default=8, help="Simulated requests in flight")
+    parser.add_argument("--rpm", type=float, default=0, help="Simulated requests/minute limit (0: none)")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for latency and fault draws")
+    parser.add_argument("--client-limits", action="store_true",
+                        help="Keep the process's RPM/TPM limiter at its configured limits when replaying")
+    parser.add_argument("--use-cache", action="store_true", help="Keep the page analysis cache on")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    parser.add_argument("--verbose", action="store_true", help="Show pipeline logging")
+    return parser.parse_args()
+
+
+def configure_environment(args, metrics_path: str):
+    """Replay/metrics settings are read from the environment when the pipeline modules load"""
+    os.environ.update({
+        "LLM_REPLAY_MODE": "record" if args.record else "replay",
+        "LLM_REPLAY_PATH": args.recordings,
+        "LLM_REPLAY_LATENCY_MEDIAN": str(args.latency),
+        "LLM_REPLAY_LATENCY_SIGMA": str(args.latency_sigma),
+        "LLM_REPLAY_TIMEOUT_RATE": str(args.timeout_rate),
+        "LLM_REPLAY_RATE_LIMIT_RATE": str(args.rate_limit_rate),
+        "LLM_REPLAY_SERVER_ERROR_RATE": str(args.server_error_rate),
+        "LLM_REPLAY_MALFORMED_RATE": str(args.malformed_rate),
+        "LLM_REPLAY_TRUNCATED_RATE": str(args.truncated_rate),
+        "LLM_REPLAY_MAX_CONCURRENCY": str(args.max_concurrency),
+        "LLM_REPLAY_RPM": str(args.rpm),
+        "LLM_REPLAY_SEED": "" if args.seed is None else str(args.seed),
+        "LLM_METRICS_ENABLED": "true",
+        "LLM_METRICS_DB_PATH": metrics_path,
+    })
+    if not args.use_cache:
+        os.environ["VISION_CACHE_ENABLED"] = "false"
+    if not args.record and not args.client_limits:
+        # The replay provider's --rpm stands in for provider limits; the account's TPM would dominate otherwise
+        os.environ.update({"RATE_LIMIT_OPENAI_RPM": "1000000", "RATE_LIMIT_OPENAI_TPM": "1000000000"})
+
+
+def peak_rss_mb() -> float:
+    if not RESOURCE_AVAILABLE:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run_pdf(vision_processor, pdf_path: str, run_id: str) -> Dict[str, Any]:
+    """Analyze one PDF; returns page count, wall time, per-page latencies and failed pages"""
+    started = {}
+    page_latencies = []
+    failed_pages = []
+    totals = {"pages": 0}
+
+    def on_progress(update: Dict[str, Any]):
+        status = update.get("status")
+        page = update.get("current_page")
+        if status == "processing":
+            started.setdefault(page, time.perf_counter())
+        elif status in ("page_completed", "page_error") and page in started:
+            page_latencies.append(time.perf_counter() - started.pop(page))
+            if status == "page_error":
+                failed_pages.append(page)
+        elif status in ("completed", "completed_with_errors"):
+            totals["pages"] = update.get("total_pages", 0)
+
+    start_time = time.perf_counter()
+    result = vision_processor.analyze_pdf_for_components(
+        pdf_path, progress_callback=on_progress, call_tags={"job_id": run_id}
+    )
+    wall_time = time.perf_counter() - start_time
+    return {
+        "pdf": os.path.basename(pdf_path),
+        "pages": totals["pages"],
+        "wall_time": wall_time,
+        "page_latencies": page_latencies,
+        "failed_pages": failed_pages,
+        "components": len(result.get("component_sequence", []))
+    }
+
+
+def build_report(runs: List[Dict[str, Any]], total_wall: float, call_summary: Dict[str, Any],
+                 replay_stats: Dict[str, Any]) -> Dict[str, Any]:
+    from latency_tracker import percentile
+
+    latencies = sorted(latency for run in runs for latency in run["page_latencies"])
+    pages = sum(run["pages"] for run in runs)
+    calls = sum(group["calls"] for group in call_summary["groups"])
+    attempts = sum(group["attempts"] for group in call_summary["groups"])
+    return {
+        "runs": len(runs),
+        "pages": pages,
+        "failed_pages": sum(len(run["failed_pages"]) for run in runs),
+        "wall_time": round(total_wall, 2),
+        "pages_per_second": round(pages / total_wall, 3) if total_wall else 0.0,
+        "page_latency": {
+            "p50": round(percentile(latencies, 0.50), 3),
+            "p95": round(percentile(latencies, 0.95), 3),
+            "max": round(latencies[-1], 3)
+        } if latencies else {},
+        "peak_rss_mb": peak_rss_mb(),
+        "model_calls": calls,
+        "retries": attempts - calls,
+        "call_errors": sum(group["errors"] for group in call_summary["groups"]),
+        "total_tokens": call_summary["total_tokens"],
+        "calls_by_operation": {
+            group["operation"]: {"calls": group["calls"], "attempts": group["attempts"], "errors": group["errors"]}
+            for group in call_summary["groups"]
+        },
+        "replay": replay_stats,
+        "per_pdf": [
+            {"pdf": run["pdf"], "pages": run["pages"], "wall_time": round(run["wall_time"], 2),
+             "components": run["components"], "failed_pages": run["failed_pages"]}
+            for run in runs
+        ]
+    }
+
+
+def print_report(report: Dict[str, Any]):
+    latency = report["page_latency"]
+    print("-" * 50)
+    print(f"Runs: {report['runs']}   Pages: {report['pages']}   Failed pages: {report['failed_pages']}")
+    print(f"Wall time: {report['wall_time']}s   Throughput: {report['pages_per_second']} pages/s")
+    if latency:
+        print(f"Page latency: p50 {latency['p50']}s   p95 {latency['p95']}s   max {latency['max']}s")
+    print(f"Peak RSS: {report['peak_rss_mb']} MB")
+    print(f"Model calls: {report['model_calls']}   Retries: {report['retries']}   "
+          f"Errors: {report['call_errors']}   Tokens: {report['total_tokens']}")
+    for operation, counts in report["calls_by_operation"].items():
+        print(f"  {operation}: {counts['calls']} calls, {counts['attempts']} attempts, {counts['errors']} errors")
+    print(f"Replay: {report['replay']}")
+    for run in report["per_pdf"]:
+        print(f"  {run['pdf']}: {run['pages']} pages in {run['wall_time']}s, {run['components']} components")
+
+
+def main():
+    args = parse_args()
+    load_dotenv()
+    metrics_dir = tempfile.mkdtemp(prefix="pipeline-benchmark-")
+    configure_environment(args, os.path.join(metrics_dir, "llm_call_metrics.db"))
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR)
+
+    from vision_processor import VisionProcessor
+    from call_metrics import get_call_metrics
+    from provider_replay import get_replay_provider
+
+    pdfs = args.pdfs or sorted(glob.glob(DEFAULT_PDF_GLOB))
+    if not pdfs:
+        print("No PDFs to benchmark")
+        return 1
+
+    vision_processor = VisionProcessor()
+    run_prefix = f"benchmark-{int(time.time())}"
+    runs = []
+    start_time = time.perf_counter()
+    for repeat in range(args.repeat):
+        for index, pdf_path in enumerate(pdfs):
+            run = run_pdf(vision_processor, pdf_path, f"{run_prefix}-{repeat}-{index}")
+            runs.append(run)
+            if not args.json:
+                print(f"{run['pdf']}: {run['pages']} pages in {run['wall_time']:.2f}s")
+    total_wall = time.perf_counter() - start_time
+
+    recorder = get_call_metrics()
+    call_summary = recorder.get_summary(since_seconds=total_wall + 60)
+    recorder.close()
+    report = build_report(runs, total_wall, call_summary, get_replay_provider().get_stats())
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,217 @@
+import os
+import time
+import logging
+import sqlite3
+import threading
+from typing import Dict, Any, Optional
+
+from latency_tracker import percentile
+
+logger = logging.getLogger(__name__)
+
+METRIC_COLUMNS = (
+    "created_at", "provider", "model", "operation", "status", "error_class",
+    "prompt_tokens", "completion_tokens", "total_tokens", "payload_bytes", "attempts", "wall_time",
+    "job_id", "pages", "node_id", "session_id"
+)
+TAG_COLUMNS = ("job_id", "node_id", "session_id")
+
+
+class CallMetricsRecorder:
+    """
+    Per-call accounting for model/vision requests
+
+    record() only appends to an in-memory buffer; records are written to the
+    llm_call_metrics SQLite table in one transaction every flush_interval
+    seconds (or sooner once flush_size records are waiting), so callers never
+    wait on disk. Queries flush first, so they always include recent calls.
+    """
+
+    def __init__(self, db_path: str = None, flush_interval: float = None, flush_size: int = 200,
+                 retention_days: int = None):
+        self.db_path = db_path or os.getenv('LLM_METRICS_DB_PATH', 'llm_call_metrics.db')
+        self.flush_interval = flush_interval or float(os.getenv('LLM_METRICS_FLUSH_SECONDS', '10'))
+        self.flush_size = flush_size
+        self.retention_seconds = (retention_days or int(os.getenv('LLM_METRICS_RETENTION_DAYS', '30'))) * 86400
+        self._buffer = []
+        self._buffer_lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._flush_timer = None
+
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_call_metrics (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created_at REAL NOT NULL,
+                provider TEXT NOT NULL,
+                model TEXT NOT NULL,
+                operation TEXT NOT NULL,
+                status TEXT NOT NULL,
+                error_class TEXT,
+                prompt_tokens INTEGER DEFAULT 0,
+                completion_tokens INTEGER DEFAULT 0,
+                total_tokens INTEGER DEFAULT 0,
+                payload_bytes INTEGER DEFAULT 0,
+                attempts INTEGER DEFAULT 1,
+                wall_time REAL NOT NULL,
+                job_id TEXT,
+                pages TEXT,
+                node_id TEXT,
+                session_id TEXT
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_call_metrics_created ON llm_call_metrics(created_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_call_metrics_job ON llm_call_metrics(job_id)")
+        self._conn.execute(
+            "DELETE FROM llm_call_metrics WHERE created_at < ?", (time.time() - self.retention_seconds,)
+        )
+        self._conn.commit()
+
+    def record(self, provider: str, model: str, operation: str, wall_time: float, status: str = "success",
+               error_class: str = None, prompt_tokens: int = 0, completion_tokens: int = 0,
+               total_tokens: int = None, payload_bytes: int = 0, attempts: int = 1,
+               tags: Optional[Dict[str, Any]] = None):
+        """Buffer one call's accounting; tags may carry job_id, pages, node_id and session_id"""
+        tags = tags or {}
+        pages = tags.get("pages")
+        if isinstance(pages, (list, tuple)):
+            pages = ",".join(str(page) for page in pages)
+        row = (
+            time.time(), provider, model, operation, status, error_class,
+            int(prompt_tokens or 0), int(completion_tokens or 0),
+            int(total_tokens if total_tokens is not None else (prompt_tokens or 0) + (completion_tokens or 0)),
+            int(payload_bytes or 0), int(attempts or 1), round(wall_time, 3),
+            tags.get("job_id"), str(pages) if pages is not None else None, tags.get("node_id"), tags.get("session_id")
+        )
+        with self._buffer_lock:
+            self._buffer.append(row)
+            buffered = len(self._buffer)
+            if self._flush_timer is None:
+                self._flush_timer = threading.Timer(self.flush_interval, self._timed_flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+        if buffered >= self.flush_size:
+            self.flush()
+
+    def flush(self) -> int:
+        """Write buffered records to SQLite; returns how many were written"""
+        with self._buffer_lock:
+            rows, self._buffer = self._buffer, []
+        if not rows:
+            return 0
+        try:
+            with self._db_lock:
+                self._conn.executemany(
+                    f"INSERT INTO llm_call_metrics ({', '.join(METRIC_COLUMNS)}) "
+                    f"VALUES ({', '.join('?' for _ in METRIC_COLUMNS)})",
+                    rows
+                )
+                self._conn.commit()
+        except Exception as e:
+            logger.warning(f"Could not flush {len(rows)} call metrics: {e}")
+            return 0
+        return len(rows)
+
+    def close(self):
+        with self._buffer_lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+        self.flush()
+
+    def get_summary(self, since_seconds: float = 86400, **filters) -> Dict[str, Any]:
+        """
+        Totals and wall-time percentiles per provider/model/operation
+
+        filters: job_id, node_id and/or session_id to narrow the calls counted.
+        """
+        self.flush()
+        where = ["created_at >= ?"]
+        params = [time.time() - since_seconds]
+        for column in TAG_COLUMNS:
+            if filters.get(column):
+                where.append(f"{column} = ?")
+                params.append(filters[column])
+
+        with self._db_lock:
+            rows = self._conn.execute(
+                f"""
+                SELECT provider, model, operation, status, prompt_tokens, completion_tokens, total_tokens,
+                       payload_bytes, attempts, wall_time
+                FROM llm_call_metrics
+                WHERE {' AND '.join(where)}
+                """,
+                params
+            ).fetchall()
+
+        groups = {}
+        for provider, model, operation, status, prompt, completion, total, payload, attempts, wall_time in rows:
+            group = groups.setdefault((provider, model, operation), {
+                "provider": provider, "model": model, "operation": operation,
+                "calls": 0, "errors": 0, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0,
+                "payload_bytes": 0, "attempts": 0, "wall_times": []
+            })
+            group["calls"] += 1
+            group["errors"] += status != "success"
+            group["prompt_tokens"] += prompt
+            group["completion_tokens"] += completion
+            group["total_tokens"] += total
+            group["payload_bytes"] += payload
+            group["attempts"] += attempts
+            group["wall_times"].append(wall_time)
+
+        summary = []
+        for group in groups.values():
+            wall_times = sorted(group.pop("wall_times"))
+            group["avg_attempts"] = round(group["attempts"] / group["calls"], 2)
+            group["wall_time"] = {
+                "total": round(sum(wall_times), 1),
+                "p50": percentile(wall_times, 0.50),
+                "p95": percentile(wall_times, 0.95),
+                "p99": percentile(wall_times, 0.99)
+            }
+            summary.append(group)
+
+        return {
+            "since_seconds": since_seconds,
+            "filters": {column: filters[column] for column in TAG_COLUMNS if filters.get(column)},
+            "calls": len(rows),
+            "total_tokens": sum(group["total_tokens"] for group in summary),
+            "groups": sorted(summary, key=lambda group: (group["provider"], group["model"], group["operation"]))
+        }
+
+    def _timed_flush(self):
+        with self._buffer_lock:
+            self._flush_timer = None
+        self.flush()
+
+
+_recorder = None
+_recorder_failed = False
+_recorder_lock = threading.Lock()
+
+
+def get_call_metrics() -> Optional[CallMetricsRecorder]:
+    """Process-wide recorder (None when LLM_METRICS_ENABLED=false or the database can't be opened)"""
+    global _recorder, _recorder_failed
+    if _recorder_failed or os.getenv('LLM_METRICS_ENABLED', 'true').lower() != 'true':
+        return None
+    with _recorder_lock:
+        if _recorder is None:
+            try:
+                _recorder = CallMetricsRecorder()
+            except Exception as e:
+                logger.warning(f"Call metrics disabled: {e}")
+                _recorder_failed = True
+                return None
+        return _recorder
+
+
+def record_call(provider: str, model: str, operation: str, wall_time: float, **kwargs):
+    """record() on the process-wide recorder, if metrics are enabled - never raises"""
+    try:
+        recorder = get_call_metrics()
+        if recorder:
+            recorder.record(provider, model, operation, wall_time, **kwargs)
+    except Exception as e:
+        logger.warning(f"Could not record call metrics: {e}")
@@ -1,6 +1,8 @@
 # Component Schema Definitions
 # Extracted from frontend app.js extractComponentData() method (lines 1020-1099)
 
+import json
+
 COMPONENT_SCHEMAS = {
     "heading": {
         "description": "Single text input for titles/section headers",
@@ -247,7 +249,13 @@ COMPONENT_SCHEMAS = {
             "chart_data": {
                 "type": "object",
                 "required": False,
-                "description": "Chart metadata for auto-generators. For pie-chart/fraction-circle: {numerator: int, denominator: int}. For bar-chart: {current: int, maximum: int}. Frontend will auto-generate SVG from this data."
+                "description": "Chart metadata for auto-generators. For pie-chart/fraction-circle: {numerator: int, denominator: int}. For bar-chart: {current: int, maximum: int}. Frontend will auto-generate SVG from this data.",
+                "structure": {
+                    "numerator": "integer",
+                    "denominator": "integer",
+                    "current": "integer",
+                    "maximum": "integer"
+                }
             }
         },
         "example": {
@@ -345,13 +353,122 @@ def build_component_prompt_section() -> str:
 
         # Add example
         prompt_sections.append("   Example JSON:")
-        import json
         example_json = json.dumps(schema['example'], indent=6)
         prompt_sections.append(f"   {example_json}")
         prompt_sections.append("")
 
     return "\n".join(prompt_sections)
 
+VALID_TEMPLATES = ["text-heavy", "visual-grid", "highlight-box", "mixed-media", "simple-list"]
+
+
+def _nullable(schema: dict) -> dict:
+    return {"anyOf": [schema, {"type": "null"}]}
+
+
+def _structure_to_json_schema(structure: dict) -> dict:
+    """JSON Schema for an object parameter described by its 'structure' entry"""
+    properties = {}
+    for field_name, field_spec in structure.items():
+        if isinstance(field_spec, dict):
+            properties[field_name] = _structure_to_json_schema(field_spec)
+        elif field_spec.startswith("integer"):
+            properties[field_name] = _nullable({"type": "integer"})
+        else:
+            properties[field_name] = {"type": "string"}
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties),
+        "additionalProperties": False
+    }
+
+
+def _parameter_to_json_schema(param_info: dict) -> dict:
+    if param_info["type"] == "array":
+        schema = {"type": "array", "items": {"type": "string"}}
+    elif param_info["type"] == "object":
+        schema = _structure_to_json_schema(param_info.get("structure", {}))
+    else:
+        schema = {"type": "string"}
+    schema["description"] = param_info["description"]
+    # Strict mode requires every key, so optional parameters are nullable instead of omitted
+    return schema if param_info["required"] else _nullable(schema)
+
+
+def build_component_response_schema() -> dict:
+    """
+    JSON Schema for a whole page response, generated from COMPONENT_SCHEMAS
+
+    Shaped for strict structured output (every property required,
+    additionalProperties false, optional parameters nullable). Null optional
+    parameters should be dropped after parsing.
+    """
+    component_variants = []
+    for component_type, schema in COMPONENT_SCHEMAS.items():
+        parameters = {
+            param_name: _parameter_to_json_schema(param_info)
+            for param_name, param_info in schema["parameters"].items()
+        }
+        component_variants.append({
+            "type": "object",
+            "properties": {
+                "type": {"type": "string", "enum": [component_type]},
+                "order": {"type": "integer"},
+                "parameters": {
+                    "type": "object",
+                    "properties": parameters,
+                    "required": list(parameters),
+                    "additionalProperties": False
+                },
+                "confidence": {"type": "number"}
+            },
+            "required": ["type", "order", "parameters", "confidence"],
+            "additionalProperties": False
+        })
+
+    return {
+        "type": "object",
+        "properties": {
+            "component_sequence": {"type": "array", "items": {"anyOf": component_variants}},
+            "suggested_template": {"type": "string", "enum": VALID_TEMPLATES},
+            "overall_confidence": {"type": "number"},
+            "processing_notes": {"type": "string"}
+        },
+        "required": ["component_sequence", "suggested_template", "overall_confidence", "processing_notes"],
+        "additionalProperties": False
+    }
+
+
+def build_batch_response_schema(page_keys: list, page_schema: dict = None) -> dict:
+    """
+    JSON Schema for a multi-page response: one required page analysis per key (e.g. "page_3")
+
+    The page schema is shared through $defs so its size doesn't grow with the
+    number of pages.
+    """
+    return {
+        "type": "object",
+        "$defs": {"page": page_schema or build_component_response_schema()},
+        "properties": {key: {"$ref": "#/$defs/page"} for key in page_keys},
+        "required": list(page_keys),
+        "additionalProperties": False
+    }
+
+
+def drop_null_parameters(component: dict) -> dict:
+    """Remove optional parameters a structured-output reply filled with null"""
+    parameters = component.get("parameters")
+    if isinstance(parameters, dict):
+        for param_name in [name for name, value in parameters.items() if value is None]:
+            del parameters[param_name]
+        for value in parameters.values():
+            if isinstance(value, dict):
+                for field_name in [name for name, field in value.items() if field is None]:
+                    del value[field_name]
+    return component
+
+
 def validate_component_parameters(component_type: str, parameters: dict) -> tuple[bool, str]:
     """Validate component parameters against schema"""
     if component_type not in COMPONENT_SCHEMAS:
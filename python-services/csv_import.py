@@ -0,0 +1,143 @@
+import os
+import csv
+import json
+import asyncio
+import logging
+from typing import Dict, Any, List, Optional, Iterator, AsyncIterator
+
+logger = logging.getLogger(__name__)
+
+NODE_TYPES = ("support", "enrichment", "core")
+
+
+def _parse_int(value: Optional[str]) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def csv_node_type(row: Dict[str, str]) -> str:
+    """Node type from the 'type' column, else from Neptune-style '~labels', else core"""
+    if row.get("type"):
+        return row["type"]
+    labels = row.get("~labels") or ""
+    for node_type in NODE_TYPES:
+        if node_type in labels:
+            return node_type
+    return "core"
+
+
+def csv_node_record(row: Dict[str, str], index: int) -> Dict[str, Any]:
+    """Session node for one nodes-CSV row (same shape the editor's CSV import creates)"""
+    node_id = row.get("node_id") or f"N{index + 1:03d}"
+    return {
+        "node_id": node_id,
+        "title": row.get("name") or row.get("title") or node_id,
+        "raw_content": json.dumps({
+            "type": csv_node_type(row),
+            "difficulty": _parse_int(row.get("difficulty")),
+            "time_minutes": _parse_int(row.get("time_minutes")),
+            "description": row.get("description") or "",
+            "textbook_pages": row.get("textbook_pages") or "",
+            "original_csv_data": row
+        }),
+        "chapter_id": 1
+    }
+
+
+def iter_csv_batches(file_path: str, batch_size: int) -> Iterator[List[Dict[str, str]]]:
+    """Read a CSV file as lists of at most batch_size row dicts, never holding more than one batch"""
+    with open(file_path, newline="", encoding="utf-8-sig") as csv_file:
+        batch = []
+        for row in csv.DictReader(csv_file):
+            batch.append({key.strip(): (value or "").strip() for key, value in row.items() if key})
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+
+class CsvCurriculumImporter:
+    """
+    Imports a curriculum CSV export (nodes, plus optional relationships) into a session
+
+    Files are read a batch at a time (in a worker thread) and each batch is
+    upserted in its own transaction, so memory stays flat whatever the file size
+    and a bad batch doesn't undo the others. Only the imported node ids (and the
+    Neptune '~id' -> node_id map) are kept across batches, to resolve the
+    relationship file's endpoints.
+    """
+
+    def __init__(self, db_manager, session_id: str, batch_size: int = None):
+        self.db_manager = db_manager
+        self.session_id = session_id
+        self.batch_size = max(1, batch_size or int(os.getenv("CSV_IMPORT_BATCH_SIZE", "1000")))
+
+    async def run(self, nodes_path: str, relationships_path: str = None) -> AsyncIterator[Dict[str, Any]]:
+        """Import both files, yielding a progress update after every batch and a final summary"""
+        node_counts = {"rows": 0, "inserted": 0, "updated": 0, "skipped": 0, "failed": 0}
+        relationship_counts = {"rows": 0, "inserted": 0, "updated": 0, "skipped": 0, "invalid": 0, "failed": 0}
+        id_map = {}
+        node_ids = set()
+
+        yield {"status": "started", "session_id": self.session_id, "message": "Importing nodes"}
+
+        async for batch in self._batches(nodes_path):
+            nodes = []
+            for row in batch:
+                node = csv_node_record(row, node_counts["rows"])
+                node_counts["rows"] += 1
+                node_ids.add(node["node_id"])
+                if row.get("~id"):
+                    id_map[row["~id"]] = node["node_id"]
+                nodes.append(node)
+            self._add_counts(node_counts, await self.db_manager.bulk_upsert_session_nodes(self.session_id, nodes))
+            yield {"status": "nodes_progress", **node_counts}
+
+        if relationships_path:
+            async for batch in self._batches(relationships_path):
+                relationships = []
+                for row in batch:
+                    relationship_counts["rows"] += 1
+                    from_id = self._resolve_node(row.get("~start_node_id"), id_map, node_ids)
+                    to_id = self._resolve_node(row.get("~end_node_id"), id_map, node_ids)
+                    if not from_id or not to_id or from_id == to_id:
+                        # Unmapped endpoints would be dangling edges; self-references aren't drawn
+                        relationship_counts["invalid"] += 1
+                        continue
+                    relationships.append({
+                        "from": from_id,
+                        "to": to_id,
+                        "type": row.get("~relationship_type") or row.get("type") or "LEADS_TO",
+                        "explanation": row.get("explanation") or ""
+                    })
+                self._add_counts(relationship_counts, await self.db_manager.bulk_upsert_relationships(
+                    self.session_id, relationships, chunk_size=self.batch_size
+                ))
+                yield {"status": "relationships_progress", **relationship_counts}
+
+        logger.info(f"CSV import for session {self.session_id}: nodes {node_counts}, "
+                    f"relationships {relationship_counts}")
+        yield {"status": "completed", "nodes": node_counts, "relationships": relationship_counts}
+
+    async def _batches(self, file_path: str) -> AsyncIterator[List[Dict[str, str]]]:
+        batches = iter_csv_batches(file_path, self.batch_size)
+        while True:
+            batch = await asyncio.to_thread(next, batches, None)
+            if batch is None:
+                return
+            yield batch
+
+    @staticmethod
+    def _resolve_node(reference: Optional[str], id_map: Dict[str, str], node_ids: set) -> Optional[str]:
+        """node_id for a relationship endpoint: a mapped '~id', or a node_id from this import (else None)"""
+        if reference in id_map:
+            return id_map[reference]
+        return reference if reference in node_ids else None
+
+    @staticmethod
+    def _add_counts(totals: Dict[str, int], counts: Dict[str, int]):
+        for outcome, count in counts.items():
+            totals[outcome] = totals.get(outcome, 0) + count
@@ -3,7 +3,7 @@ import logging
 from typing import List, Dict, Any, Optional
 import asyncio
 from contextlib import asynccontextmanager
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, text, event, bindparam
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
@@ -23,9 +23,32 @@ class DatabaseManager:
             self.database_url = "sqlite:///cms_development.db"
             self.async_database_url = "sqlite+aiosqlite:///cms_development.db"
 
+        # SQLite: WAL journal, one writer connection and a pool of read-only connections
+        self.is_sqlite = "sqlite" in self.async_database_url
+        self.sqlite_wal = os.getenv("DB_SQLITE_WAL", "true").lower() == "true"
+        self.read_pool_size = max(1, int(os.getenv("DB_READ_POOL_SIZE", "4")))
+        self.sqlite_pragmas = {
+            "synchronous": "NORMAL",  # Durable across app crashes in WAL mode; only an OS crash can lose the last commits
+            "cache_size": -int(os.getenv("DB_SQLITE_CACHE_KB", "16000")),
+            "mmap_size": int(os.getenv("DB_SQLITE_MMAP_MB", "128")) * 1024 * 1024,
+            "busy_timeout": int(os.getenv("DB_SQLITE_BUSY_TIMEOUT_MS", "5000")),
+            "temp_store": "MEMORY"
+        }
+
+        # Write-behind queue for auto-saves: latest save per (session, node), committed in batches
+        self.write_behind = os.getenv("DB_WRITE_BEHIND", "true").lower() == "true"
+        self.write_batch_delay = int(os.getenv("DB_WRITE_BATCH_MS", "5")) / 1000
+        self.write_batch_size = max(1, int(os.getenv("DB_WRITE_BATCH_SIZE", "50")))
+        self.bulk_chunk_size = max(1, int(os.getenv("DB_BULK_CHUNK_SIZE", "5000")))  # Rows per bulk-import commit
+        self._pending_saves = {}  # (session_id, node_id) -> {"components": [...], "futures": [...]}
+        self._batch_full = asyncio.Event()
+        self._flush_task = None
+
         self.engine = None
-        self.async_engine = None
+        self.async_engine = None  # Writer (the only engine outside SQLite WAL mode)
+        self.read_engine = None
         self.SessionLocal = None
+        self.ReadSessionLocal = None
         self._initialized = False
         self._schema_ensured = False
 
@@ -35,17 +58,39 @@ class DatabaseManager:
             return True
 
         try:
-            self.async_engine = create_async_engine(
-                self.async_database_url,
-                echo=False,
-                poolclass=StaticPool if "sqlite" in self.async_database_url else None,
-            )
+            if self.is_sqlite and self.sqlite_wal:
+                # One writer connection: write sessions queue for it instead of interleaving on a shared
+                # connection, while reads run concurrently on their own connections against the WAL snapshot
+                self.async_engine = create_async_engine(
+                    self.async_database_url, echo=False, pool_size=1, max_overflow=0, pool_timeout=60
+                )
+                self.read_engine = create_async_engine(
+                    self.async_database_url, echo=False, pool_size=self.read_pool_size, max_overflow=0
+                )
+                self._set_sqlite_pragmas(self.async_engine, read_only=False)
+                self._set_sqlite_pragmas(self.read_engine, read_only=True)
+
+                # Open the writer first so the database is in WAL mode before any reader connects
+                async with self.async_engine.connect():
+                    pass
+            else:
+                self.async_engine = create_async_engine(
+                    self.async_database_url,
+                    echo=False,
+                    poolclass=StaticPool if self.is_sqlite else None,
+                )
+                self.read_engine = self.async_engine
 
             self.SessionLocal = sessionmaker(
                 bind=self.async_engine,
                 class_=AsyncSession,
                 expire_on_commit=False
             )
+            self.ReadSessionLocal = sessionmaker(
+                bind=self.read_engine,
+                class_=AsyncSession,
+                expire_on_commit=False
+            )
 
             self._initialized = True
             logger.info("Database connection initialized successfully")
@@ -55,6 +100,21 @@ class DatabaseManager:
             logger.error(f"Failed to initialize database: {str(e)}")
             return False
 
+    def _set_sqlite_pragmas(self, engine, read_only: bool):
+        """Apply the PRAGMA profile to every new connection of an engine"""
+        pragmas = dict(self.sqlite_pragmas)
+        if read_only:
+            pragmas["query_only"] = "ON"
+        else:
+            pragmas["journal_mode"] = "WAL"
+
+        @event.listens_for(engine.sync_engine, "connect")
+        def set_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+            cursor.close()
+
     async def ensure_schema(self):
         """Verify database schema exists, create if missing"""
         if self._schema_ensured:
@@ -72,6 +132,7 @@ class DatabaseManager:
                 logger.info("Database schema applied successfully")
             else:
                 logger.info("Database schema verified - all tables exist")
+                await self._migrate_schema()
 
             self._schema_ensured = True
 
@@ -108,9 +169,27 @@ class DatabaseManager:
             logger.error(f"Error applying schema: {str(e)}")
             raise
 
+    async def _migrate_schema(self):
+        """Add columns introduced after a database was first created (SQLite has no IF NOT EXISTS for columns)"""
+        added_columns = {
+            "node_components": [
+                ("status", "TEXT DEFAULT 'final'"),
+                ("source_page", "INTEGER")
+            ]
+        }
+        for table, columns in added_columns.items():
+            existing = {row["name"] for row in await self.execute_query(f"PRAGMA table_info({table})")}
+            for column, definition in columns:
+                if column not in existing:
+                    await self.execute_insert(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+                    logger.info(f"Added column {table}.{column}")
+
     async def close(self):
         """Properly close database connections"""
         try:
+            await self.flush_pending_writes()
+            if self.read_engine and self.read_engine is not self.async_engine:
+                await self.read_engine.dispose()
             if self.async_engine:
                 await self.async_engine.dispose()
                 logger.info("Database connections closed")
@@ -122,6 +201,12 @@ class DatabaseManager:
             raise RuntimeError("Database not initialized. Call initialize() first.")
         return self.SessionLocal()
 
+    async def get_read_session(self):
+        """Session on the read pool (same as get_session outside SQLite WAL mode) - not for writes"""
+        if not self.ReadSessionLocal:
+            raise RuntimeError("Database not initialized. Call initialize() first.")
+        return self.ReadSessionLocal()
+
     @asynccontextmanager
     async def transaction_context(self):
         """Provides transaction context with automatic rollback on error"""
@@ -136,7 +221,7 @@ class DatabaseManager:
 
     async def execute_query(self, query: str, params: Dict[str, Any] = None) -> List[Dict[str, Any]]:
         try:
-            async with await self.get_session() as session:
+            async with await self.get_read_session() as session:
                 result = await session.execute(text(query), params or {})
                 rows = result.fetchall()
                 return [dict(row._mapping) for row in rows]
@@ -312,11 +397,12 @@ class DatabaseManager:
         try:
             query = """
             SELECT nc.component_type, nc.component_order, nc.parameters, nc.confidence_score,
-                   nc.created_at, nc.last_modified, nc.version
+                   nc.created_at, nc.last_modified, nc.version, nc.status, nc.source_page
             FROM node_components nc
             JOIN nodes n ON nc.node_id = n.id
             WHERE n.node_id = :node_id
-            ORDER BY nc.component_order
+            ORDER BY CASE WHEN nc.status = 'provisional' THEN 1 ELSE 0 END,
+                     COALESCE(nc.source_page, 0), nc.component_order
             """
             results = await self.execute_query(query, {"node_id": node_id})
             
@@ -336,42 +422,317 @@ class DatabaseManager:
             return []
 
     async def save_node_components(self, node_id: str, components: List[Dict[str, Any]],
-                                 suggested_template: str, overall_confidence: float) -> bool:
-        """Save complete component sequence to database"""
+                                 suggested_template: str, overall_confidence: float,
+                                 session_id: Optional[str] = None) -> bool:
+        """
+        Save complete component sequence to database (only rows that changed are written)
+
+        With a session_id the node is looked up in that session only, since the
+        same node_id can exist in several sessions.
+        """
         try:
             # Get internal node ID from node_id string
             node_query = "SELECT id FROM nodes WHERE node_id = :node_id"
-            node_result = await self.execute_query(node_query, {"node_id": node_id})
+            params = {"node_id": node_id}
+            if session_id is not None:
+                node_query += " AND session_id = :session_id"
+                params["session_id"] = session_id
+            node_result = await self.execute_query(node_query, params)
             if not node_result:
                 logger.error(f"Node {node_id} not found in database")
                 return False
 
             internal_node_id = node_result[0]["id"]
 
-            # Delete existing components for this node
-            delete_query = "DELETE FROM node_components WHERE node_id = :node_id"
-            await self.execute_insert(delete_query, {"node_id": internal_node_id})
+            async with self.transaction_context() as session:
+                await self._sync_node_components(session, internal_node_id, components)
 
-            # Insert new components
-            for component in components:
-                insert_query = """
+            return True
+        except Exception as e:
+            logger.error(f"Error saving components for node {node_id}: {str(e)}")
+            return False
+
+    @staticmethod
+    def _diff_rows(stored_rows: List[Dict[str, Any]], desired_rows: List[Dict[str, Any]], slot_key, content_key):
+        """
+        Match desired rows to stored ones so a save writes as few rows as possible
+
+        slot_key gives a row's position (e.g. its order) and content_key its
+        comparable content. Rows matching on both are left alone; rows whose
+        content moved to another slot, or whose slot got new content, become
+        updates; only what is left over is inserted or deleted.
+        Returns (updates [(stored, desired)], inserts [desired], deletes [stored], unchanged count).
+        """
+        remaining_stored = list(stored_rows)
+        unmatched = []
+        unchanged = 0
+
+        # Same slot, same content: untouched
+        by_slot_and_content = {}
+        for row in remaining_stored:
+            by_slot_and_content.setdefault((slot_key(row), content_key(row)), []).append(row)
+        for desired in desired_rows:
+            matches = by_slot_and_content.get((slot_key(desired), content_key(desired)))
+            if matches:
+                remaining_stored.remove(matches.pop(0))
+                unchanged += 1
+            else:
+                unmatched.append(desired)
+
+        # Same content in another slot (reordered), then new content in an occupied slot
+        updates = []
+        for key in (content_key, slot_key):
+            candidates = {}
+            for row in remaining_stored:
+                candidates.setdefault(key(row), []).append(row)
+            still_unmatched = []
+            for desired in unmatched:
+                matches = candidates.get(key(desired))
+                if matches:
+                    stored = matches.pop(0)
+                    remaining_stored.remove(stored)
+                    updates.append((stored, desired))
+                else:
+                    still_unmatched.append(desired)
+            unmatched = still_unmatched
+
+        return updates, unmatched, remaining_stored, unchanged
+
+    async def _sync_node_components(self, session, internal_node_id: int,
+                                    components: List[Dict[str, Any]]) -> Dict[str, int]:
+        """
+        Make a node's final components match the given sequence within the caller's transaction
+
+        Only rows that differ are written; updated rows get version + 1. Provisional
+        rows from a PDF analysis are dropped, as the editor's save replaces them.
+        """
+        import json
+        await session.execute(
+            text("DELETE FROM node_components WHERE node_id = :node_id AND status = 'provisional'"),
+            {"node_id": internal_node_id}
+        )
+        stored_rows = [dict(row._mapping) for row in (await session.execute(
+            text("""
+            SELECT id, component_type, component_order, parameters, confidence_score
+            FROM node_components
+            WHERE node_id = :node_id AND COALESCE(status, 'final') != 'provisional'
+            """),
+            {"node_id": internal_node_id}
+        )).fetchall()]
+        for row in stored_rows:
+            try:
+                row["parameters"] = json.loads(row["parameters"])
+            except (json.JSONDecodeError, TypeError):
+                row["parameters"] = None  # Never equal to a saved component, so the row gets rewritten
+
+        desired_rows = [
+            {
+                "component_type": component["type"],
+                "component_order": component["order"],
+                "parameters": component["parameters"],
+                "confidence_score": component.get("confidence", 0.5)
+            }
+            for component in components
+        ]
+        updates, inserts, deletes, unchanged = self._diff_rows(
+            stored_rows, desired_rows,
+            slot_key=lambda row: row["component_order"],
+            content_key=lambda row: (
+                row["component_type"], json.dumps(row["parameters"], sort_keys=True), float(row["confidence_score"] or 0)
+            )
+        )
+
+        if deletes:
+            await session.execute(
+                text("DELETE FROM node_components WHERE id = :id"), [{"id": row["id"]} for row in deletes]
+            )
+        if updates:
+            await session.execute(
+                text("""
+                UPDATE node_components
+                SET component_type = :component_type, component_order = :component_order,
+                    parameters = :parameters, confidence_score = :confidence_score,
+                    version = COALESCE(version, 1) + 1, last_modified = CURRENT_TIMESTAMP
+                WHERE id = :id
+                """),
+                [
+                    {**desired, "id": stored["id"], "parameters": json.dumps(desired["parameters"])}
+                    for stored, desired in updates
+                ]
+            )
+        if inserts:
+            await session.execute(
+                text("""
                 INSERT INTO node_components (node_id, component_type, component_order,
                                            parameters, confidence_score)
                 VALUES (:node_id, :component_type, :component_order, :parameters, :confidence_score)
-                """
-                import json
-                params = {
-                    "node_id": internal_node_id,
-                    "component_type": component["type"],
-                    "component_order": component["order"],
-                    "parameters": json.dumps(component["parameters"]),  # Serialize dict to JSON string
-                    "confidence_score": component.get("confidence", 0.5)
-                }
-                await self.execute_insert(insert_query, params)
+                """),
+                [
+                    # Serialize dict to JSON string
+                    {**desired, "node_id": internal_node_id, "parameters": json.dumps(desired["parameters"])}
+                    for desired in inserts
+                ]
+            )
+
+        changes = {"inserted": len(inserts), "updated": len(updates), "deleted": len(deletes), "unchanged": unchanged}
+        logger.debug(f"Synced components of node {internal_node_id}: {changes}")
+        return changes
+
+    # Write-behind queue for auto-saves
+    async def queue_node_components_save(self, session_id: str, node_id: str,
+                                         components: List[Dict[str, Any]]) -> asyncio.Future:
+        """
+        Queue a node's component sequence for the next group commit
+
+        Returns a future that resolves to True once the save is committed (False if
+        the node is missing or the write failed). A newer save for the same
+        (session, node) replaces one still waiting; both callers' futures resolve
+        with the newer write. Batches commit every DB_WRITE_BATCH_MS, or as soon as
+        DB_WRITE_BATCH_SIZE nodes are waiting, in one transaction that also
+        touches the sessions' last_accessed.
+        """
+        future = asyncio.get_running_loop().create_future()
+        if not self.write_behind:
+            future.set_result(await self.save_node_components(node_id, components, None, None, session_id=session_id))
+            return future
+
+        pending = self._pending_saves.setdefault((session_id, node_id), {"futures": []})
+        pending["components"] = components
+        pending["futures"].append(future)
+        if len(self._pending_saves) >= self.write_batch_size:
+            self._batch_full.set()
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._run_write_batches())
+        return future
+
+    async def flush_pending_writes(self):
+        """Commit everything queued so far (used on shutdown)"""
+        self._batch_full.set()
+        while self._flush_task is not None and not self._flush_task.done():
+            await asyncio.shield(self._flush_task)
+
+    async def _run_write_batches(self):
+        while self._pending_saves:
+            if len(self._pending_saves) < self.write_batch_size:
+                # Give the rest of a burst a moment to arrive
+                try:
+                    await asyncio.wait_for(self._batch_full.wait(), self.write_batch_delay)
+                except asyncio.TimeoutError:
+                    pass
+            self._batch_full.clear()
+
+            # Saves queued while this batch commits wait for the next one, so per-node order holds
+            keys = list(self._pending_saves)[:self.write_batch_size]
+            batch = [(key, self._pending_saves.pop(key)) for key in keys]
+            try:
+                results = await self._commit_save_batch(batch)
+            except Exception as e:
+                # One bad save shouldn't fail the others - retry them one transaction each
+                logger.warning(f"Group commit of {len(batch)} auto-saves failed, retrying individually: {str(e)}")
+                results = []
+                for entry in batch:
+                    try:
+                        results.extend(await self._commit_save_batch([entry]))
+                    except Exception as entry_error:
+                        logger.error(f"Error saving components for node {entry[0][1]}: {str(entry_error)}")
+                        results.append(False)
+
+            for (_, pending), saved in zip(batch, results):
+                for future in pending["futures"]:
+                    if not future.done():
+                        future.set_result(saved)
+
+    async def _commit_save_batch(self, batch) -> List[bool]:
+        """Write a batch of queued saves in a single transaction; returns per-entry success"""
+        results = []
+        async with self.transaction_context() as session:
+            for (session_id, node_id), pending in batch:
+                node_result = (await session.execute(
+                    text("SELECT id FROM nodes WHERE node_id = :node_id AND session_id = :session_id"),
+                    {"node_id": node_id, "session_id": session_id}
+                )).fetchall()
+                if not node_result:
+                    logger.error(f"Node {node_id} not found in session {session_id}")
+                    results.append(False)
+                    continue
+                await self._sync_node_components(session, node_result[0][0], pending["components"])
+                results.append(True)
+
+            for session_id in {session_id for (session_id, _), _ in batch if session_id}:
+                await session.execute(
+                    text("UPDATE sessions SET last_accessed = datetime('now') WHERE id = :session_id"),
+                    {"session_id": session_id}
+                )
+        return results
+
+    @staticmethod
+    def _node_session_filter(session_id: Optional[str]) -> str:
+        """Scope a nodes lookup to one session (or to session-less nodes), since node_ids repeat across sessions"""
+        return "session_id = :session_id" if session_id else "session_id IS NULL"
+
+    async def clear_provisional_components(self, node_id: str, session_id: Optional[str] = None) -> int:
+        """Drop provisional components left by an earlier PDF analysis of this node (in session_id)"""
+        try:
+            query = f"""
+            DELETE FROM node_components
+            WHERE status = 'provisional'
+              AND node_id IN (SELECT id FROM nodes WHERE node_id = :node_id AND {self._node_session_filter(session_id)})
+            """
+            return await self.execute_insert(query, {"node_id": node_id, "session_id": session_id})
+        except Exception as e:
+            logger.error(f"Error clearing provisional components for node {node_id}: {str(e)}")
+            return 0
+
+    async def save_provisional_page_components(self, node_id: str, page_number: int,
+                                               components: List[Dict[str, Any]],
+                                               session_id: Optional[str] = None) -> bool:
+        """
+        Persist one analyzed PDF page's components while the rest of the PDF is still processing
 
+        Rows are marked status='provisional' with their source page and listed after
+        the node's saved components; the editor's next save replaces them with final rows.
+        The node is looked up in session_id (session-less nodes when it is None).
+        """
+        try:
+            node_query = f"SELECT id FROM nodes WHERE node_id = :node_id AND {self._node_session_filter(session_id)}"
+            node_result = await self.execute_query(node_query, {"node_id": node_id, "session_id": session_id})
+            if not node_result:
+                logger.warning(f"Node {node_id} not found in session {session_id} - "
+                               f"page {page_number} components not persisted")
+                return False
+
+            internal_node_id = node_result[0]["id"]
+
+            import json
+            async with self.transaction_context() as session:
+                # Re-running a page (retry/resume) replaces its earlier provisional rows
+                await session.execute(
+                    text("""
+                    DELETE FROM node_components
+                    WHERE node_id = :node_id AND status = 'provisional' AND source_page = :source_page
+                    """),
+                    {"node_id": internal_node_id, "source_page": page_number}
+                )
+                for position, component in enumerate(components, 1):
+                    await session.execute(
+                        text("""
+                        INSERT INTO node_components (node_id, component_type, component_order, parameters,
+                                                     confidence_score, status, source_page)
+                        VALUES (:node_id, :component_type, :component_order, :parameters,
+                                :confidence_score, 'provisional', :source_page)
+                        """),
+                        {
+                            "node_id": internal_node_id,
+                            "component_type": component["type"],
+                            "component_order": position,
+                            "parameters": json.dumps(component.get("parameters", {})),
+                            "confidence_score": component.get("confidence", 0.5),
+                            "source_page": page_number
+                        }
+                    )
             return True
         except Exception as e:
-            logger.error(f"Error saving components for node {node_id}: {str(e)}")
+            logger.error(f"Error saving provisional components for node {node_id}, page {page_number}: {str(e)}")
             return False
 
     async def update_node_component(self, node_id: str, order: int, component: Dict[str, Any]) -> bool:
@@ -607,9 +968,19 @@ class DatabaseManager:
             logger.error(f"Error creating session: {str(e)}")
             return None
 
-    async def validate_session(self, session_id: str) -> bool:
-        """Checks if session exists and updates access timestamp atomically"""
+    async def validate_session(self, session_id: str, touch: bool = True) -> bool:
+        """
+        Checks if session exists and updates access timestamp atomically
+
+        touch=False only checks (on the read pool); callers that queue a write for
+        the session leave the timestamp to that write's group commit.
+        """
         try:
+            if not touch:
+                result = await self.execute_query("SELECT id FROM sessions WHERE id = :session_id",
+                                                  {"session_id": session_id})
+                return bool(result)
+
             # Use transaction to ensure validation + access update are atomic
             async with self.transaction_context() as session:
                 # Check if session exists
@@ -701,32 +1072,117 @@ class DatabaseManager:
             
             internal_node_id = node_result[0]["id"]
             
-            # Use transaction to save all content
+            category_map = {"explanation": 1, "real_world_example": 2, "textbook_content": 3, "memory_trick": 4}
+            desired_rows = [
+                {"category_id": category_map.get(category, 1), "content_text": content.strip()}
+                for category, content in content_data.items()
+                if content and content.strip()
+            ]
+
+            # Use transaction to save all content - only changed categories are written
             async with self.transaction_context() as session:
-                # Delete existing content for this node
-                delete_query = "DELETE FROM user_assignments WHERE node_id = :node_id"
-                await session.execute(text(delete_query), {"node_id": internal_node_id})
-                
-                # Save new content
-                category_map = {"explanation": 1, "real_world_example": 2, "textbook_content": 3, "memory_trick": 4}
-                for category, content in content_data.items():
-                    if content and content.strip():
-                        content_query = """
+                stored_rows = [dict(row._mapping) for row in (await session.execute(
+                    text("SELECT id, category_id, content_text FROM user_assignments WHERE node_id = :node_id"),
+                    {"node_id": internal_node_id}
+                )).fetchall()]
+                updates, inserts, deletes, _ = self._diff_rows(
+                    stored_rows, desired_rows,
+                    slot_key=lambda row: row["category_id"],
+                    content_key=lambda row: (row["category_id"], row["content_text"])
+                )
+
+                if deletes:
+                    await session.execute(
+                        text("DELETE FROM user_assignments WHERE id = :id"), [{"id": row["id"]} for row in deletes]
+                    )
+                if updates:
+                    await session.execute(
+                        text("""
+                        UPDATE user_assignments
+                        SET content_text = :content_text, assigned_by = 'user', assigned_at = CURRENT_TIMESTAMP
+                        WHERE id = :id
+                        """),
+                        [{"id": stored["id"], "content_text": desired["content_text"]} for stored, desired in updates]
+                    )
+                if inserts:
+                    await session.execute(
+                        text("""
                         INSERT INTO user_assignments (node_id, category_id, content_text, assigned_by)
-                        VALUES (:node_id, :category_id, :content_text, :assigned_by)
-                        """
-                        await session.execute(text(content_query), {
-                            "node_id": internal_node_id,
-                            "category_id": category_map.get(category, 1),
-                            "content_text": content.strip(),
-                            "assigned_by": "user"
-                        })
-            
+                        VALUES (:node_id, :category_id, :content_text, 'user')
+                        """),
+                        [{**desired, "node_id": internal_node_id} for desired in inserts]
+                    )
+
             return True
         except Exception as e:
             logger.error(f"Error saving session node content: {str(e)}")
             return False
 
+    async def bulk_upsert_session_nodes(self, session_id: str, nodes: List[Dict[str, Any]]) -> Dict[str, int]:
+        """
+        Create or update many session nodes in one transaction (a CSV import batch)
+
+        Nodes are matched on node_id; an existing node gets the new title and
+        raw_content only if they differ. Returns counts: inserted, updated, skipped
+        (unchanged, or repeated within the batch) and failed (batch not written).
+        """
+        counts = {"inserted": 0, "updated": 0, "skipped": 0, "failed": 0}
+        rows = {}
+        duplicates = 0
+        for node in nodes:
+            row = {
+                "node_id": node["node_id"],
+                "session_id": session_id,
+                "title": node.get("title", node["node_id"]),
+                "raw_content": node.get("raw_content", ""),
+                "chapter_id": node.get("chapter_id", 1)
+            }
+            if row["node_id"] in rows:
+                duplicates += 1
+            rows[row["node_id"]] = row
+        counts["skipped"] = duplicates
+        if not rows:
+            return counts
+
+        try:
+            async with self.transaction_context() as session:
+                result = await session.execute(
+                    text("""
+                    SELECT node_id, title, raw_content FROM nodes
+                    WHERE session_id = :session_id AND node_id IN :node_ids
+                    """).bindparams(bindparam("node_ids", expanding=True)),
+                    {"session_id": session_id, "node_ids": list(rows)}
+                )
+                stored = {node_id: (title, raw_content) for node_id, title, raw_content in result.fetchall()}
+
+                writes = []
+                for node_id, row in rows.items():
+                    if node_id not in stored:
+                        counts["inserted"] += 1
+                    elif stored[node_id] != (row["title"], row["raw_content"]):
+                        counts["updated"] += 1
+                    else:
+                        counts["skipped"] += 1
+                        continue
+                    writes.append(row)
+
+                if writes:
+                    await session.execute(
+                        text("""
+                        INSERT INTO nodes (node_id, session_id, title, raw_content, chapter_id)
+                        VALUES (:node_id, :session_id, :title, :raw_content, :chapter_id)
+                        ON CONFLICT (session_id, node_id) DO UPDATE
+                        SET title = excluded.title, raw_content = excluded.raw_content,
+                            last_modified = CURRENT_TIMESTAMP
+                        """),
+                        writes
+                    )
+        except Exception as e:
+            logger.error(f"Error bulk upserting {len(rows)} nodes for session {session_id}: {str(e)}")
+            return {"inserted": 0, "updated": 0, "skipped": duplicates, "failed": len(rows)}
+
+        return counts
+
     async def create_session_node(self, session_id: str, node_data: Dict[str, Any]) -> bool:
         """Create a new node in a session"""
         try:
@@ -833,35 +1289,112 @@ class DatabaseManager:
             return []
 
     async def bulk_create_relationships(self, session_id: str, relationships: List[Dict[str, Any]]) -> bool:
-        """Create multiple relationships in a session efficiently (atomic)"""
-        try:
-            if not relationships:
-                return True
+        """Create multiple relationships in a session (existing ones are kept); True if no chunk failed"""
+        counts = await self.bulk_upsert_relationships(session_id, relationships)
+        return counts["failed"] == 0
 
-            # Use transaction to ensure all relationships are created atomically
-            async with self.transaction_context() as session:
-                query = """
-                INSERT INTO session_relationships (session_id, from_node_id, to_node_id, relationship_type, explanation, created_by, confidence_score)
-                VALUES (:session_id, :from_node_id, :to_node_id, :relationship_type, :explanation, :created_by, :confidence_score)
-                """
+    async def bulk_upsert_relationships(self, session_id: str, relationships: List[Dict[str, Any]],
+                                        on_conflict: str = "skip", chunk_size: int = None) -> Dict[str, int]:
+        """
+        Import relationships in chunked transactions, tolerating rows that already exist
 
-                for rel in relationships:
-                    data = {
-                        "session_id": session_id,
-                        "from_node_id": rel["from"],
-                        "to_node_id": rel["to"],
-                        "relationship_type": rel.get("type", "LEADS_TO"),
-                        "explanation": rel.get("explanation", ""),
-                        "created_by": rel.get("created_by", "CSV_IMPORT"),
-                        "confidence_score": rel.get("confidence_score", 1.0)
-                    }
-                    await session.execute(text(query), data)
+        on_conflict="skip" keeps an existing (from, to, type) relationship as it is;
+        "update" overwrites its explanation, created_by and confidence_score. Each
+        chunk of DB_BULK_CHUNK_SIZE rows is written with one executemany and
+        committed on its own, so a failing chunk doesn't undo the others.
 
-            logger.info(f"Bulk created {len(relationships)} relationships for session {session_id}")
-            return True
-        except Exception as e:
-            logger.error(f"Error bulk creating relationships: {str(e)}")
-            return False
+        Returns counts: inserted, updated, skipped (already stored as given, or
+        repeated within the import), invalid (no from/to) and failed (in a chunk
+        that could not be written).
+        """
+        counts = {"inserted": 0, "updated": 0, "skipped": 0, "invalid": 0, "failed": 0}
+        chunk_size = max(1, chunk_size or self.bulk_chunk_size)
+
+        # Later rows for the same (from, to, type) win; a statement can't touch one row twice
+        rows = {}
+        for rel in relationships:
+            if not rel.get("from") or not rel.get("to"):
+                counts["invalid"] += 1
+                continue
+            row = {
+                "session_id": session_id,
+                "from_node_id": rel["from"],
+                "to_node_id": rel["to"],
+                "relationship_type": rel.get("type", "LEADS_TO"),
+                "explanation": rel.get("explanation", ""),
+                "created_by": rel.get("created_by", "CSV_IMPORT"),
+                "confidence_score": rel.get("confidence_score", 1.0)
+            }
+            key = (row["from_node_id"], row["to_node_id"], row["relationship_type"])
+            if key in rows:
+                counts["skipped"] += 1
+            rows[key] = row
+        rows = list(rows.values())
+
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            try:
+                chunk_counts = await self._upsert_relationship_chunk(session_id, chunk, on_conflict)
+            except Exception as e:
+                logger.error(f"Relationship import chunk {start // chunk_size + 1} failed ({len(chunk)} rows): {str(e)}")
+                counts["failed"] += len(chunk)
+                continue
+            for outcome, count in chunk_counts.items():
+                counts[outcome] += count
+
+        logger.info(f"Bulk imported {len(relationships)} relationships for session {session_id}: {counts}")
+        return counts
+
+    async def _upsert_relationship_chunk(self, session_id: str, chunk: List[Dict[str, Any]],
+                                         on_conflict: str) -> Dict[str, int]:
+        """Classify the chunk against its stored rows, then write only new/changed ones with one executemany"""
+        async with self.transaction_context() as session:
+            stored = {}
+            result = await session.execute(
+                text("""
+                SELECT from_node_id, to_node_id, relationship_type, explanation, created_by, confidence_score
+                FROM session_relationships
+                WHERE session_id = :session_id AND from_node_id IN :from_node_ids
+                """).bindparams(bindparam("from_node_ids", expanding=True)),
+                {"session_id": session_id, "from_node_ids": list({row["from_node_id"] for row in chunk})}
+            )
+            for from_node_id, to_node_id, relationship_type, explanation, created_by, confidence in result.fetchall():
+                stored[(from_node_id, to_node_id, relationship_type)] = (explanation, created_by, confidence)
+
+            inserts, updates = [], []
+            for row in chunk:
+                existing = stored.get((row["from_node_id"], row["to_node_id"], row["relationship_type"]))
+                if existing is None:
+                    inserts.append(row)
+                elif on_conflict == "update" and existing != (row["explanation"], row["created_by"],
+                                                               row["confidence_score"]):
+                    updates.append(row)
+
+            if inserts or updates:
+                await session.execute(
+                    text(f"""
+                    INSERT INTO session_relationships (session_id, from_node_id, to_node_id, relationship_type, explanation, created_by, confidence_score)
+                    VALUES (:session_id, :from_node_id, :to_node_id, :relationship_type, :explanation, :created_by, :confidence_score)
+                    {self._relationship_conflict_clause(on_conflict)}
+                    """),
+                    inserts + updates
+                )
+
+        return {"inserted": len(inserts), "updated": len(updates), "skipped": len(chunk) - len(inserts) - len(updates)}
+
+    def _relationship_conflict_clause(self, on_conflict: str) -> str:
+        if on_conflict == "update":
+            # The WHERE leaves rows that already hold these values untouched (and unreported)
+            distinct = "IS NOT" if self.is_sqlite else "IS DISTINCT FROM"
+            return f"""
+            ON CONFLICT (session_id, from_node_id, to_node_id, relationship_type) DO UPDATE
+            SET explanation = excluded.explanation, created_by = excluded.created_by,
+                confidence_score = excluded.confidence_score
+            WHERE session_relationships.explanation {distinct} excluded.explanation
+               OR session_relationships.created_by {distinct} excluded.created_by
+               OR session_relationships.confidence_score {distinct} excluded.confidence_score
+            """
+        return "ON CONFLICT (session_id, from_node_id, to_node_id, relationship_type) DO NOTHING"
 
     async def create_session_relationship(self, session_id: str, relationship_data: Dict[str, Any]) -> bool:
         """Create a single relationship in a session"""
@@ -1009,6 +1542,9 @@ class DatabaseManager:
             return {}
 
     async def close(self):
+        await self.flush_pending_writes()
+        if self.read_engine and self.read_engine is not self.async_engine:
+            await self.read_engine.dispose()
         if self.async_engine:
             await self.async_engine.dispose()
             logger.info("Database connection closed")
\ No newline at end of file
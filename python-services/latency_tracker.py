@@ -0,0 +1,112 @@
+import math
+import threading
+import logging
+from collections import deque
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (bytes of request payload) for latency buckets; larger payloads fall in the last bucket
+PAYLOAD_SIZE_BUCKETS = [
+    (50_000, "<50KB"),          # Text-only requests (no image)
+    (250_000, "50-250KB"),
+    (500_000, "250-500KB"),
+    (1_000_000, "500KB-1MB"),
+    (2_000_000, "1-2MB"),
+]
+LARGEST_BUCKET = ">2MB"
+
+
+def payload_size_bucket(payload_bytes: int) -> str:
+    for upper_bound, label in PAYLOAD_SIZE_BUCKETS:
+        if payload_bytes < upper_bound:
+            return label
+    return LARGEST_BUCKET
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class LatencyTracker:
+    """
+    Rolling request latencies per (model, payload size bucket)
+
+    Keeps the last window_size samples for each key and derives request
+    timeouts from the observed p99 times a safety factor. Keys with fewer than
+    min_samples observations are "cold" and callers keep their static timeout.
+    Timed-out requests are recorded at the timeout they hit, so a provider
+    slowdown pushes the percentiles (and the next timeouts) up instead of
+    causing a run of premature timeouts.
+    """
+
+    def __init__(self, window_size: int = 200, min_samples: int = 20, safety_factor: float = 1.5,
+                 min_timeout: float = 15.0, max_timeout: float = 300.0):
+        self.window_size = window_size
+        self.min_samples = min_samples
+        self.safety_factor = safety_factor
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self._samples = {}  # (model, bucket) -> deque of seconds
+        self._timeouts = {}  # (model, bucket) -> count of timed-out requests in total
+        self._lock = threading.Lock()
+
+    def record(self, model: str, payload_bytes: int, seconds: float, timed_out: bool = False):
+        key = (model, payload_size_bucket(payload_bytes))
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = deque(maxlen=self.window_size)
+            samples.append(seconds)
+            if timed_out:
+                self._timeouts[key] = self._timeouts.get(key, 0) + 1
+
+    def get_percentiles(self, model: str, payload_bytes: int) -> Optional[Dict[str, float]]:
+        """p50/p95/p99 for the request's bucket, or None while the bucket is cold"""
+        key = (model, payload_size_bucket(payload_bytes))
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return self._summarize(samples)
+
+    def get_timeout(self, model: str, payload_bytes: int, fallback: float) -> float:
+        """Adaptive timeout for a request, or the static fallback when there isn't enough data"""
+        percentiles = self.get_percentiles(model, payload_bytes)
+        if percentiles is None:
+            return fallback
+        return self._derive_timeout(percentiles["p99"])
+
+    def get_stats(self) -> List[Dict[str, Any]]:
+        """Per-bucket sample counts, percentiles and the timeout currently derived from them"""
+        with self._lock:
+            snapshot = {key: sorted(samples) for key, samples in self._samples.items()}
+            timeouts = dict(self._timeouts)
+
+        stats = []
+        for (model, bucket), samples in sorted(snapshot.items()):
+            entry = {
+                "model": model,
+                "payload_bucket": bucket,
+                "samples": len(samples),
+                "timeouts": timeouts.get((model, bucket), 0),
+                "warm": len(samples) >= self.min_samples
+            }
+            if samples:
+                entry.update(self._summarize(samples))
+            if entry["warm"]:
+                entry["adaptive_timeout"] = self._derive_timeout(entry["p99"])
+            stats.append(entry)
+        return stats
+
+    def _derive_timeout(self, p99: float) -> float:
+        return round(min(self.max_timeout, max(self.min_timeout, p99 * self.safety_factor)), 1)
+
+    def _summarize(self, sorted_samples: List[float]) -> Dict[str, float]:
+        return {
+            "p50": round(percentile(sorted_samples, 0.50), 3),
+            "p95": round(percentile(sorted_samples, 0.95), 3),
+            "p99": round(percentile(sorted_samples, 0.99), 3)
+        }
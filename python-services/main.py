@@ -1,4 +1,4 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, Header, UploadFile, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from fastapi.responses import JSONResponse, HTMLResponse, RedirectResponse, Response, StreamingResponse
@@ -6,11 +6,21 @@ from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 from typing import Optional, Dict, List, Any
 import os
+import re
+import uuid
+import shutil
+import tempfile
 import logging
 import json
+import time
 import asyncio
 from dotenv import load_dotenv
 from anthropic import Anthropic
+from provider_rate_limiter import estimate_text_tokens, get_rate_limiter, get_rate_limiter_stats
+from api_retry_policy import classify_api_error
+from call_metrics import get_call_metrics, record_call
+from provider_replay import create_replay_client, get_replay_mode
+from csv_import import CsvCurriculumImporter
 try:
     from pdf_extractor import PDFProcessor
     PDF_PROCESSOR_AVAILABLE = True
@@ -39,6 +49,22 @@ except ImportError:
     VISION_PROCESSOR_AVAILABLE = False
     print("Warning: Vision processor not available due to missing dependencies")
 
+try:
+    from vision_job_queue import (
+        VisionJobQueue, ProvisionalComponentWriter, JOB_QUEUED, JOB_COMPLETED, JOB_FAILED
+    )
+    VISION_JOB_QUEUE_AVAILABLE = True
+except ImportError:
+    VISION_JOB_QUEUE_AVAILABLE = False
+    print("Warning: Vision job queue not available due to missing dependencies")
+
+try:
+    from pdf_probe import probe_pdf, resolve_page_range, PYMUPDF_AVAILABLE, PYPDF2_AVAILABLE
+    PDF_PROBE_AVAILABLE = PYMUPDF_AVAILABLE or PYPDF2_AVAILABLE
+except ImportError:
+    PDF_PROBE_AVAILABLE = False
+    print("Warning: PDF probe not available due to missing dependencies")
+
 load_dotenv()
 
 logging.basicConfig(level=logging.INFO)
@@ -46,8 +72,13 @@ logger = logging.getLogger(__name__)
 
 # Initialize Claude API
 CLAUDE_API_KEY = os.getenv('ANTHROPIC_API_KEY')
-if CLAUDE_API_KEY:
+if get_replay_mode() == 'replay':
+    claude_client = create_replay_client("anthropic")
+    CLAUDE_AVAILABLE = True
+elif CLAUDE_API_KEY:
     claude_client = Anthropic(api_key=CLAUDE_API_KEY)
+    if get_replay_mode() == 'record':
+        claude_client = create_replay_client("anthropic", live_client=claude_client)
     CLAUDE_AVAILABLE = True
 else:
     claude_client = None
@@ -71,6 +102,13 @@ async def lifespan(app: FastAPI):
     else:
         logger.warning("Database manager not available")
 
+    if vision_job_queue:
+        if db_manager:
+            # Persist each analyzed page as provisional node components while the job runs
+            vision_job_queue.component_writer = ProvisionalComponentWriter(db_manager, asyncio.get_running_loop())
+        # Resumes jobs interrupted by the last shutdown from their page checkpoints
+        vision_job_queue.start()
+
     logger.info("Application startup complete")
 
     yield  # Application runs
@@ -78,6 +116,13 @@ async def lifespan(app: FastAPI):
     # Shutdown sequence
     logger.info("Shutting down application...")
 
+    if vision_job_queue:
+        vision_job_queue.shutdown()
+
+    call_metrics = get_call_metrics()
+    if call_metrics:
+        call_metrics.close()  # Write out buffered call records
+
     if db_manager:
         try:
             await db_manager.close()
@@ -113,6 +158,7 @@ pdf_processor = PDFProcessor() if PDF_PROCESSOR_AVAILABLE else None
 db_manager = DatabaseManager() if DATABASE_AVAILABLE else None
 template_renderer = TemplateRenderer() if TEMPLATE_RENDERER_AVAILABLE else None
 vision_processor = VisionProcessor() if VISION_PROCESSOR_AVAILABLE else None
+vision_job_queue = VisionJobQueue(vision_processor) if vision_processor and VISION_JOB_QUEUE_AVAILABLE else None
 
 # In-memory storage for nodes
 nodes_storage = []
@@ -178,6 +224,8 @@ class ComponentItem(BaseModel):
     order: int
     parameters: Dict[str, Any]
     confidence: Optional[float] = 0.5
+    status: Optional[str] = None  # 'provisional' while a PDF analysis is still writing the node
+    source_page: Optional[int] = None
 
 class ComponentSequence(BaseModel):
     node_id: str
@@ -214,6 +262,8 @@ class GenerateSVGsRequest(BaseModel):
     context: str
     titles: List[str]
     descriptions: List[str]
+    node_id: Optional[str] = None  # Only used to tag call metrics
+    session_id: Optional[str] = None
 
 # Serve main CMS at root
 @app.get("/", response_class=HTMLResponse)
@@ -432,18 +482,77 @@ async def bulk_create_session_relationships(session_id: str, relationships_data:
             raise HTTPException(status_code=400, detail="relationships array is required")
 
         relationships = relationships_data["relationships"]
-        success = await db_manager.bulk_create_relationships(session_id, relationships)
+        on_conflict = relationships_data.get("on_conflict", "skip")
+        if on_conflict not in ("skip", "update"):
+            raise HTTPException(status_code=400, detail="on_conflict must be 'skip' or 'update'")
 
-        if success:
-            return {"success": True, "message": f"Created {len(relationships)} relationships successfully", "count": len(relationships)}
-        else:
+        counts = await db_manager.bulk_upsert_relationships(session_id, relationships, on_conflict=on_conflict)
+
+        # Chunks commit independently - only report failure when nothing could be written
+        if relationships and counts["failed"] == len(relationships):
             raise HTTPException(status_code=500, detail="Failed to create relationships")
+        return {
+            "success": counts["failed"] == 0,
+            "message": f"Imported {len(relationships)} relationships: {counts['inserted']} created, "
+                       f"{counts['updated']} updated, {counts['skipped']} unchanged",
+            "count": counts["inserted"] + counts["updated"],
+            **counts
+        }
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error bulk creating relationships: {str(e)}")
         raise HTTPException(status_code=500, detail="Error creating relationships")
 
+async def spool_csv_upload(file: UploadFile) -> str:
+    """Copy an uploaded CSV to a temporary file in chunks (the stream outlives the request's upload)"""
+    if not file.filename or not file.filename.lower().endswith('.csv'):
+        raise HTTPException(status_code=400, detail="Only CSV files are allowed")
+    with tempfile.NamedTemporaryFile(prefix="csv-import-", suffix=".csv", delete=False) as spooled:
+        await asyncio.to_thread(shutil.copyfileobj, file.file, spooled)
+    return spooled.name
+
+
+@app.post("/session/{session_id}/import-csv")
+async def import_session_csv(session_id: str, nodes_file: UploadFile = File(...),
+                             relationships_file: Optional[UploadFile] = File(None)):
+    """
+    Import a curriculum CSV (nodes, plus optional relationships) into a session in one request
+
+    Rows are parsed and upserted a batch at a time, and progress is streamed back as
+    Server-Sent Events: nodes_progress / relationships_progress after each batch with
+    running inserted/updated/skipped counts, then completed (or error).
+    """
+    if not db_manager:
+        raise HTTPException(status_code=500, detail="Database not available")
+    if not await db_manager.validate_session(session_id):
+        raise HTTPException(status_code=401, detail="Invalid or expired session")
+
+    nodes_path = await spool_csv_upload(nodes_file)
+    try:
+        relationships_path = await spool_csv_upload(relationships_file) if relationships_file else None
+    except HTTPException:
+        os.remove(nodes_path)
+        raise
+
+    async def generate_import_stream():
+        try:
+            async for update in CsvCurriculumImporter(db_manager, session_id).run(nodes_path, relationships_path):
+                yield format_sse_event(update)
+        except Exception as e:
+            logger.error(f"CSV import failed for session {session_id}: {str(e)}")
+            yield format_sse_event({"status": "error", "error": f"CSV import failed: {str(e)}"})
+        finally:
+            for path in (nodes_path, relationships_path):
+                if path and os.path.exists(path):
+                    os.remove(path)
+
+    return StreamingResponse(
+        generate_import_stream(),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
 @app.post("/session/{session_id}/relationships")
 async def create_session_relationship(session_id: str, relationship: RelationshipCreate):
     """Create a single relationship in a session"""
@@ -602,8 +711,8 @@ async def auto_save_node_content(session_id: str, node_id: str, content: dict):
         if not db_manager:
             raise HTTPException(status_code=500, detail="Database not available")
         
-        # Validate session first
-        is_valid = await db_manager.validate_session(session_id)
+        # Validate session first (its access time is updated with the save's group commit)
+        is_valid = await db_manager.validate_session(session_id, touch=False)
         if not is_valid:
             # Auto-save fails silently for invalid sessions
             return {"status": "session_expired", "message": "Session expired"}
@@ -619,13 +728,9 @@ async def auto_save_node_content(session_id: str, node_id: str, content: dict):
                     "confidence": comp.get("confidence", 1.0)
                 })
         
-        # Save component sequence to database
-        success = await db_manager.save_node_components(
-            node_id, components_dict, 
-            content.get("suggested_template", "text-heavy"),
-            content.get("overall_confidence", 1.0)
-        )
-        
+        # Queue for the next group commit and wait until it is committed
+        success = await (await db_manager.queue_node_components_save(session_id, node_id, components_dict))
+
         if success:
             from datetime import datetime
             return {
@@ -1067,12 +1172,27 @@ Requirements:
 
 Return only the JSON, no other text."""
 
-        # Call Claude
-        message = claude_client.messages.create(
-            model="claude-3-5-sonnet-20240620",
-            max_tokens=4000,
-            messages=[{"role": "user", "content": prompt}]
-        )
+        # Call Claude once the shared Anthropic limiter has room
+        svg_model = "claude-3-5-sonnet-20240620"
+        rate_limiter = get_rate_limiter("anthropic", svg_model)
+        estimated_tokens = estimate_text_tokens(prompt) + 4000
+        await rate_limiter.acquire_async(estimated_tokens)
+        call_start = time.time()
+        try:
+            message = claude_client.messages.create(
+                model=svg_model,
+                max_tokens=4000,
+                messages=[{"role": "user", "content": prompt}]
+            )
+        except Exception as e:
+            record_call("anthropic", svg_model, "generate_svgs", time.time() - call_start, status="error",
+                        error_class=classify_api_error(e), payload_bytes=len(prompt),
+                        tags={"node_id": request.node_id, "session_id": request.session_id})
+            raise
+        rate_limiter.settle(estimated_tokens, message.usage.input_tokens + message.usage.output_tokens)
+        record_call("anthropic", svg_model, "generate_svgs", time.time() - call_start,
+                    prompt_tokens=message.usage.input_tokens, completion_tokens=message.usage.output_tokens,
+                    payload_bytes=len(prompt), tags={"node_id": request.node_id, "session_id": request.session_id})
 
         # Parse response
         response_text = message.content[0].text.strip()
@@ -1267,149 +1387,194 @@ async def ai_command(command: dict):
         return {"error": f"Command failed: {str(e)}"}
 
 # Streaming Progress Endpoint for PDF Analysis
-@app.post("/nodes/{node_id}/analyze-pdf-vision-stream")
-async def analyze_pdf_vision_streaming(node_id: str, file: UploadFile = File(...), context: str = ""):
-    """
-    Upload PDF and get real-time progress updates via Server-Sent Events
-    Returns streaming progress updates during multi-page processing
-    """
-    # Enhanced input validation
-    
+MAX_VISION_UPLOAD_SIZE = 50 * 1024 * 1024  # 50MB in bytes
+VISION_UPLOAD_DIR = "../uploads/pdfs"
+
+
+def validate_vision_upload(filename: Optional[str], file_size: int, context: str):
+    """Request checks shared by the vision analysis endpoints (raises HTTPException)"""
     # Validate file type and extension
-    if not file.filename or not file.filename.lower().endswith('.pdf'):
+    if not filename or not filename.lower().endswith('.pdf'):
         raise HTTPException(status_code=400, detail="Only PDF files are allowed")
-    
+
     # Validate file size (50MB max)
-    MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB in bytes
-    file_content = await file.read()
-    if len(file_content) > MAX_FILE_SIZE:
+    if file_size > MAX_VISION_UPLOAD_SIZE:
         raise HTTPException(
-            status_code=413, 
-            detail=f"File too large. Maximum size is {MAX_FILE_SIZE // (1024*1024)}MB"
+            status_code=413,
+            detail=f"File too large. Maximum size is {MAX_VISION_UPLOAD_SIZE // (1024*1024)}MB"
         )
-    
-    # Reset file pointer after reading for size check
-    await file.seek(0)
-    
+
     # Validate filename for security (prevent path traversal)
-    import re
-    if not re.match(r'^[a-zA-Z0-9_\-\.\s]+\.pdf$', file.filename):
+    if not re.match(r'^[a-zA-Z0-9_\-\.\s]+\.pdf$', filename):
         raise HTTPException(status_code=400, detail="Invalid filename. Use only letters, numbers, spaces, dots, hyphens and underscores")
-    
+
     # Validate context length
     if context and len(context) > 1000:
         raise HTTPException(status_code=400, detail="Context text too long. Maximum 1000 characters")
 
+
+def save_vision_upload(node_id: str, filename: str, content: bytes) -> str:
+    """Write an upload under a per-job name so queued jobs never share (or overwrite) a file"""
+    os.makedirs(VISION_UPLOAD_DIR, exist_ok=True)
+    file_path = os.path.join(VISION_UPLOAD_DIR, f"{node_id}_{uuid.uuid4().hex[:8]}_{filename}")
+    with open(file_path, "wb") as buffer:
+        buffer.write(content)
+    return file_path
+
+
+def check_uploaded_pdf(file_path: str, first_page: Optional[int] = None,
+                       last_page: Optional[int] = None) -> Optional[str]:
+    """
+    Header check plus structural probe of a saved PDF (no page rendering)
+
+    Raises ValueError with a user-facing message (including a page range that
+    selects no page); returns a page-range warning or None.
+    """
+    with open(file_path, "rb") as f:
+        if not f.read(8).startswith(b'%PDF-'):
+            raise ValueError("Invalid PDF format: file header check failed")
+
+    # Skip this validation if no PDF library is installed - vision API will handle it
+    if not (vision_processor and PDF_PROBE_AVAILABLE):
+        return None
+
+    try:
+        pdf_info = probe_pdf(file_path)
+    except Exception as pdf_error:
+        raise ValueError(f"PDF validation failed: {str(pdf_error)}")
+    if pdf_info["needs_password"]:
+        raise ValueError("PDF validation failed: PDF is password protected")
+    page_count = pdf_info["page_count"]
+    if page_count <= 0:
+        raise ValueError("PDF validation failed: PDF contains no readable pages")
+    first_page, clamped_last_page = resolve_page_range(page_count, first_page, last_page)
+    if last_page and clamped_last_page < last_page:
+        return f"PDF has {page_count} pages, will process pages {first_page}-{clamped_last_page}"
+    return None
+
+
+SSE_HEARTBEAT_SECONDS = 15  # Comment line keeps proxies from closing idle streams
+SSE_RETRY_MS = 3000         # Client reconnect delay advertised to EventSource clients
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no",  # Disable proxy buffering so each event is delivered immediately
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Headers": "*"
+}
+
+
+def format_sse_event(data: Dict[str, Any], event_id: Optional[int] = None) -> str:
+    """Frame one text/event-stream message (id line only when the event is resumable)"""
+    id_line = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{id_line}data: {json.dumps(data)}\n\n"
+
+
+async def stream_vision_job(job_id: str, last_event_id: int = 0):
+    """
+    Relay a queued job's progress events as SSE, ending with its result or error
+
+    Events are pushed from the worker thread into an asyncio queue, so an idle
+    stream costs nothing but a heartbeat comment. Each event carries its job seq
+    as the SSE id; a reconnect with Last-Event-ID replays only what was missed.
+    """
+    loop = asyncio.get_running_loop()
+    # Subscribe before replaying so nothing recorded in between is lost (duplicates are skipped by seq)
+    queue = vision_job_queue.subscribe(job_id, loop)
+    try:
+        yield f"retry: {SSE_RETRY_MS}\n\n"
+        last_seq = last_event_id
+
+        for event in vision_job_queue.get_events(job_id, last_seq):
+            seq = event.pop("seq")
+            last_seq = seq
+            if event["status"] in ("job_completed", "job_failed"):
+                yield format_sse_event(build_vision_job_final_update(job_id), seq)
+                return
+            yield format_sse_event(event, seq)
+
+        job = vision_job_queue.get_job(job_id)
+        if job["status"] in (JOB_COMPLETED, JOB_FAILED):
+            # The terminal event may have been recorded after the replay above; it is
+            # only already delivered if last_seq is at or past it (nothing newer left)
+            for event in vision_job_queue.get_events(job_id, last_seq):
+                seq = event.pop("seq")
+                if event["status"] in ("job_completed", "job_failed"):
+                    yield format_sse_event(build_vision_job_final_update(job_id), seq)
+                    return
+                yield format_sse_event(event, seq)
+            return
+
+        while True:
+            try:
+                seq, event = await asyncio.wait_for(queue.get(), timeout=SSE_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": heartbeat\n\n"
+                continue
+            if seq <= last_seq:
+                continue
+            last_seq = seq
+            if event["status"] in ("job_completed", "job_failed"):
+                yield format_sse_event(build_vision_job_final_update(job_id), seq)
+                return
+            yield format_sse_event(event, seq)
+    finally:
+        vision_job_queue.unsubscribe(job_id, queue)
+
+
+def build_vision_job_final_update(job_id: str) -> Dict[str, Any]:
+    job = vision_job_queue.get_job(job_id, include_result=True)
+    if job["status"] == JOB_COMPLETED:
+        return {"status": "finished", "job_id": job_id, "result": job["result"]}
+    return {"status": "error", "job_id": job_id, "error": job["error"] or "Unknown error occurred"}
+
+
+@app.post("/nodes/{node_id}/analyze-pdf-vision-stream")
+async def analyze_pdf_vision_streaming(node_id: str, file: UploadFile = File(...), context: str = "",
+                                       session_id: str = "", first_page: Optional[int] = None,
+                                       last_page: Optional[int] = None):
+    """
+    Upload PDF and get real-time progress updates via Server-Sent Events
+    Returns streaming progress updates during multi-page processing
+    (optionally only pages first_page-last_page, 1-based and inclusive)
+
+    The analysis runs as a queued job - if the client disconnects it keeps going;
+    reconnect to /vision-jobs/{job_id}/events with Last-Event-ID to resume the
+    stream, or fetch /vision-jobs/{job_id}/result later.
+    """
+    # Enhanced input validation
+    file_content = await file.read()
+    validate_vision_upload(file.filename, len(file_content), context)
+
     # Note: Node validation removed - database operations will handle missing nodes gracefully
 
     async def generate_progress_stream():
         try:
-            # Save uploaded PDF temporarily
-            upload_dir = "../uploads/pdfs"
-            os.makedirs(upload_dir, exist_ok=True)
-            file_path = os.path.join(upload_dir, f"{node_id}_{file.filename}")
-
-            # Write file to disk
-            with open(file_path, "wb") as buffer:
-                content = await file.read()
-                buffer.write(content)
-
-            # Validate PDF format by checking file header
+            # Save uploaded PDF and validate it before queueing
+            file_path = save_vision_upload(node_id, file.filename, file_content)
             try:
-                with open(file_path, "rb") as f:
-                    header = f.read(8)
-                    if not header.startswith(b'%PDF-'):
-                        raise ValueError("Invalid PDF format - file header check failed")
-            except Exception as format_error:
+                warning = check_uploaded_pdf(file_path, first_page, last_page)
+            except ValueError as validation_error:
+                os.remove(file_path)
                 error_update = {
                     "status": "error",
-                    "error": f"Invalid PDF format: {str(format_error)}"
+                    "error": str(validation_error)
                 }
-                yield f"data: {json.dumps(error_update)}\n\n"
+                yield format_sse_event(error_update)
                 return
 
-            # Additional PDF validation using PyMuPDF if available
-            # Skip this validation if PyMuPDF is not installed - vision API will handle it
-            try:
-                from vision_processor import PYMUPDF_AVAILABLE
-                if vision_processor and PYMUPDF_AVAILABLE:
-                    try:
-                        # Try to get page count to validate PDF structure
-                        _, page_count = vision_processor.convert_pdf_page_to_image(file_path, 1)
-                        if page_count <= 0:
-                            raise ValueError("PDF contains no readable pages")
-                        if page_count > vision_processor.max_total_pages:
-                            warning_update = {
-                                "status": "warning",
-                                "message": f"PDF has {page_count} pages, will process first {vision_processor.max_total_pages} only"
-                            }
-                            yield f"data: {json.dumps(warning_update)}\n\n"
-                    except Exception as pdf_error:
-                        error_update = {
-                            "status": "error",
-                            "error": f"PDF validation failed: {str(pdf_error)}"
-                        }
-                        yield f"data: {json.dumps(error_update)}\n\n"
-                        return
-            except ImportError:
-                # PyMuPDF not available, skip validation
-                pass
-
-            # Progress tracking variables
-            progress_updates = []
-            final_result = None
-
-            def progress_callback(update):
-                progress_updates.append(update)
-
-            # Call vision processor with progress callback
-            if vision_processor:
-                # Run in thread to avoid blocking
-                import threading
-                result_container = {}
-                exception_container = {}
-
-                def run_analysis():
-                    try:
-                        result = vision_processor.analyze_pdf_for_components(
-                            pdf_path=file_path,
-                            context=context if context else None,
-                            progress_callback=progress_callback
-                        )
-                        result_container['result'] = result
-                    except Exception as e:
-                        logger.error(f"Vision processing error: {str(e)}")
-                        print(f"ERROR: Vision processing failed: {str(e)}")
-                        import traceback
-                        traceback.print_exc()
-                        exception_container['error'] = str(e)
-
-                # Start analysis in background thread
-                thread = threading.Thread(target=run_analysis)
-                thread.start()
-
-                # Stream progress updates
-                while thread.is_alive() or progress_updates:
-                    if progress_updates:
-                        update = progress_updates.pop(0)
-                        yield f"data: {json.dumps(update)}\n\n"
-                    await asyncio.sleep(0.1)  # Small delay to prevent busy waiting
-
-                thread.join()
-
-                # Send final result or error
-                if 'result' in result_container:
-                    final_update = {
-                        "status": "finished",
-                        "result": result_container['result']
-                    }
-                else:
-                    final_update = {
-                        "status": "error",
-                        "error": exception_container.get('error', 'Unknown error occurred')
-                    }
-                
-                yield f"data: {json.dumps(final_update)}\n\n"
+            if warning:
+                warning_update = {
+                    "status": "warning",
+                    "message": warning
+                }
+                yield format_sse_event(warning_update)
+
+            if vision_job_queue:
+                job_id = vision_job_queue.submit(node_id, file_path, file.filename, context or None,
+                                                 session_id or None, first_page, last_page)
+                async for chunk in stream_vision_job(job_id):
+                    yield chunk
             else:
                 # Demo mode without vision processor
                 demo_updates = [
@@ -1424,7 +1589,7 @@ async def analyze_pdf_vision_streaming(node_id: str, file: UploadFile = File(...
                 ]
                 
                 for update in demo_updates:
-                    yield f"data: {json.dumps(update)}\n\n"
+                    yield format_sse_event(update)
                     await asyncio.sleep(0.5)  # Simulate processing delay
 
                 # Send demo final result
@@ -1439,29 +1604,140 @@ async def analyze_pdf_vision_streaming(node_id: str, file: UploadFile = File(...
                         "processing_notes": "Demo mode - real processing requires PyMuPDF"
                     }
                 }
-                yield f"data: {json.dumps(demo_result)}\n\n"
+                yield format_sse_event(demo_result)
 
         except Exception as e:
             error_update = {
                 "status": "error", 
                 "error": f"Stream processing failed: {str(e)}"
             }
-            yield f"data: {json.dumps(error_update)}\n\n"
+            yield format_sse_event(error_update)
 
     return StreamingResponse(
         generate_progress_stream(),
-        media_type="text/plain",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Headers": "*"
-        }
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
     )
 
+# Vision Job Endpoints - queue an analysis, then poll/stream it and fetch the result later
+@app.post("/nodes/{node_id}/analyze-pdf-vision-jobs", status_code=202)
+async def create_vision_job(node_id: str, file: UploadFile = File(...), context: str = "", session_id: str = "",
+                            first_page: Optional[int] = None, last_page: Optional[int] = None):
+    """Queue a PDF (or pages first_page-last_page of it) for vision analysis and return its job id immediately"""
+    if not vision_job_queue:
+        raise HTTPException(status_code=503, detail="Vision processor not available")
+
+    file_content = await file.read()
+    validate_vision_upload(file.filename, len(file_content), context)
+
+    file_path = save_vision_upload(node_id, file.filename, file_content)
+    try:
+        warning = check_uploaded_pdf(file_path, first_page, last_page)
+    except ValueError as validation_error:
+        os.remove(file_path)
+        raise HTTPException(status_code=400, detail=str(validation_error))
+
+    job_id = vision_job_queue.submit(node_id, file_path, file.filename, context or None, session_id or None,
+                                     first_page, last_page)
+    return {
+        "job_id": job_id,
+        "status": JOB_QUEUED,
+        "warning": warning,
+        "status_url": f"/vision-jobs/{job_id}",
+        "events_url": f"/vision-jobs/{job_id}/events",
+        "result_url": f"/vision-jobs/{job_id}/result",
+        "message": "Analysis queued"
+    }
+
+@app.get("/vision-jobs/{job_id}")
+async def get_vision_job(job_id: str):
+    """Current status and page progress of a vision job"""
+    job = vision_job_queue.get_job(job_id) if vision_job_queue else None
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/vision-jobs/{job_id}/events")
+async def stream_vision_job_events(job_id: str, after: int = 0, last_event_id: Optional[str] = Header(None)):
+    """
+    Stream a job's progress events until it finishes
+
+    Resumes after the Last-Event-ID header sent by reconnecting EventSource
+    clients, or after the ?after= seq for clients that can't set headers.
+    """
+    if not vision_job_queue or not vision_job_queue.get_job(job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    resume_after = after
+    if last_event_id and last_event_id.isdigit():
+        resume_after = max(resume_after, int(last_event_id))
+
+    return StreamingResponse(
+        stream_vision_job(job_id, last_event_id=resume_after),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+@app.post("/vision-jobs/{job_id}/retry", status_code=202)
+async def retry_vision_job(job_id: str):
+    """Requeue a failed job - pages checkpointed before the failure are not analyzed again"""
+    job = vision_job_queue.get_job(job_id) if vision_job_queue else None
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if not vision_job_queue.retry(job_id):
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']} - only failed jobs with their upload can be retried")
+    return {"job_id": job_id, "status": JOB_QUEUED, "events_url": f"/vision-jobs/{job_id}/events"}
+
+@app.get("/vision-jobs/{job_id}/result")
+async def get_vision_job_result(job_id: str):
+    """Merged component sequence of a finished job"""
+    job = vision_job_queue.get_job(job_id, include_result=True) if vision_job_queue else None
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] == JOB_FAILED:
+        raise HTTPException(status_code=422, detail=f"Job failed: {job['error']}")
+    if job["status"] != JOB_COMPLETED:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Job is {job['status']} ({job['completed_pages']}/{job['total_pages'] or '?'} pages done)"
+        )
+    return {"job_id": job_id, "node_id": job["node_id"], "result": job["result"]}
+
+@app.get("/vision/latency-stats")
+async def get_vision_latency_stats():
+    """Observed model latency percentiles per payload size bucket, the timeouts derived from them and hedge rates"""
+    if not vision_processor:
+        raise HTTPException(status_code=503, detail="Vision processor not available")
+    tracker = vision_processor.latency_tracker
+    return {
+        "min_samples": tracker.min_samples,
+        "safety_factor": tracker.safety_factor,
+        "window_size": tracker.window_size,
+        "buckets": tracker.get_stats(),
+        "hedging": vision_processor.get_hedge_stats()
+    }
+
+@app.get("/llm-call-metrics")
+async def get_llm_call_metrics(since_hours: float = 24, job_id: Optional[str] = None, node_id: Optional[str] = None,
+                               session_id: Optional[str] = None):
+    """Token, payload, attempt and wall-time totals with latency percentiles per provider/model/operation"""
+    recorder = get_call_metrics()
+    if not recorder:
+        raise HTTPException(status_code=503, detail="Call metrics disabled")
+    return await asyncio.to_thread(
+        recorder.get_summary, since_hours * 3600, job_id=job_id, node_id=node_id, session_id=session_id
+    )
+
+@app.get("/rate-limits")
+async def get_rate_limits():
+    """Current state of the process-wide provider rate limiters"""
+    return {"limiters": get_rate_limiter_stats()}
+
 # Enhanced Vision Processing Endpoint for Component Sequences  
 @app.post("/nodes/{node_id}/analyze-pdf-vision")
-async def analyze_pdf_vision_for_components(node_id: str, file: UploadFile = File(...), page_number: int = 1, context: str = ""):
+async def analyze_pdf_vision_for_components(node_id: str, file: UploadFile = File(...), page_number: int = 1,
+                                            context: str = "", session_id: str = "",
+                                            first_page: Optional[int] = None, last_page: Optional[int] = None):
     """
     Upload PDF and get AI-suggested component sequence for specific node
     Returns structured component sequence that can populate the frontend editor
@@ -1511,7 +1787,10 @@ async def analyze_pdf_vision_for_components(node_id: str, file: UploadFile = Fil
             vision_result = vision_processor.analyze_pdf_for_components(
                 pdf_path=file_path,
                 page_number=page_number,
-                context=context if context else None
+                context=context if context else None,
+                call_tags={"node_id": node_id, "session_id": session_id or None},
+                first_page=first_page,
+                last_page=last_page
             )
 
         # Validate component types against known components
@@ -1573,11 +1852,15 @@ async def get_node_components(node_id: str):
             # Convert database results to ComponentItem format
             components = []
             for db_comp in db_components:
+                is_provisional = db_comp.get("status") == "provisional"
                 components.append(ComponentItem(
                     type=db_comp["component_type"],
-                    order=db_comp["component_order"],
+                    # Provisional rows are numbered per page - continue the sequence after saved components
+                    order=len(components) + 1 if is_provisional else db_comp["component_order"],
                     parameters=db_comp["parameters"],
-                    confidence=db_comp["confidence_score"]
+                    confidence=db_comp["confidence_score"],
+                    status=db_comp.get("status") or "final",
+                    source_page=db_comp.get("source_page")
                 ))
 
             # For now, use default template (will be enhanced in later chunks)
@@ -0,0 +1,128 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class PageAnalysisCache:
+    """
+    Persistent cache of per-page vision results
+
+    Entries are keyed by a hash of the rendered page content, the system prompt
+    version, the model name and the user prompt (which carries the context
+    string), so re-uploads of the same chapter - or a revision where only a few
+    pages changed - skip the vision API for unchanged pages.
+
+    Stored in a small SQLite file. Eviction is LRU by total size plus a maximum
+    entry age.
+    """
+
+    def __init__(self, db_path: str = None, max_size_bytes: int = None, max_age_seconds: int = None):
+        self.db_path = db_path or os.getenv('VISION_CACHE_PATH', 'vision_page_cache.db')
+        self.max_size_bytes = max_size_bytes or int(os.getenv('VISION_CACHE_MAX_BYTES', str(200 * 1024 * 1024)))
+        self.max_age_seconds = max_age_seconds or int(os.getenv('VISION_CACHE_MAX_AGE_DAYS', '30')) * 86400
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS page_analysis_cache (
+                cache_key TEXT PRIMARY KEY,
+                result TEXT NOT NULL,
+                size_bytes INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_accessed REAL NOT NULL
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_page_analysis_cache_last_accessed ON page_analysis_cache(last_accessed)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(page_hash: str, prompt_version: str, model: str, user_prompt: str) -> str:
+        """Combine everything that influences a page's vision result into one key"""
+        key_source = "\x1f".join([page_hash, prompt_version, model, user_prompt or ""])
+        return hashlib.sha256(key_source.encode('utf-8')).hexdigest()
+
+    def get(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached page result, or None on a miss (expired entries count as misses)"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result, created_at FROM page_analysis_cache WHERE cache_key = ?", (cache_key,)
+            ).fetchone()
+            if not row:
+                return None
+
+            result_json, created_at = row
+            if now - created_at > self.max_age_seconds:
+                self._conn.execute("DELETE FROM page_analysis_cache WHERE cache_key = ?", (cache_key,))
+                self._conn.commit()
+                return None
+
+            self._conn.execute(
+                "UPDATE page_analysis_cache SET last_accessed = ? WHERE cache_key = ?", (now, cache_key)
+            )
+            self._conn.commit()
+
+        try:
+            return json.loads(result_json)
+        except json.JSONDecodeError:
+            logger.warning(f"Discarding corrupt page cache entry {cache_key[:12]}")
+            return None
+
+    def put(self, cache_key: str, result: Dict[str, Any]):
+        """Store a page result and evict old/least recently used entries if over budget"""
+        result_json = json.dumps(result)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO page_analysis_cache (cache_key, result, size_bytes, created_at, last_accessed)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (cache_key, result_json, len(result_json), now, now)
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float):
+        """Drop expired entries, then least recently used ones until under max_size_bytes (caller holds the lock)"""
+        self._conn.execute(
+            "DELETE FROM page_analysis_cache WHERE created_at < ?", (now - self.max_age_seconds,)
+        )
+
+        total_size = self._conn.execute(
+            "SELECT COALESCE(SUM(size_bytes), 0) FROM page_analysis_cache"
+        ).fetchone()[0]
+        if total_size <= self.max_size_bytes:
+            return
+
+        evicted = 0
+        rows = self._conn.execute(
+            "SELECT cache_key, size_bytes FROM page_analysis_cache ORDER BY last_accessed"
+        ).fetchall()
+        for cache_key, size_bytes in rows:
+            if total_size <= self.max_size_bytes:
+                break
+            self._conn.execute("DELETE FROM page_analysis_cache WHERE cache_key = ?", (cache_key,))
+            total_size -= size_bytes
+            evicted += 1
+
+        logger.info(f"Page analysis cache evicted {evicted} least recently used entries")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries, total_size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM page_analysis_cache"
+            ).fetchone()
+        return {"entries": entries, "size_bytes": total_size, "max_size_bytes": self.max_size_bytes}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,123 @@
+import hashlib
+import logging
+import zlib
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+    print("Warning: NumPy not available. Blank/duplicate page detection disabled.")
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+INK_LEVEL = 200          # Grayscale values darker than this count as ink
+HASH_SIZE = 16           # 16x16 difference hash = 256 bits
+CHANGED_LEVEL = 48       # Per-pixel difference that counts as a real change, not anti-aliasing
+
+
+def page_fingerprint(gray_image, page_text: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Cheap fingerprint of a low-resolution grayscale page render
+
+    Returns the ink coverage ratio, a 256-bit difference hash (dHash) used as a
+    fast near-duplicate prefilter, the thumbnail pixels for a pixel-level check
+    on hash matches and, when the page has a non-empty text layer, a digest of its text.
+    The thumbnail is kept zlib-compressed so fingerprints of long books stay small.
+    """
+    pixels = np.asarray(gray_image.convert("L"), dtype=np.uint8)
+    ink_ratio = float((pixels < INK_LEVEL).mean())
+
+    small = np.asarray(
+        gray_image.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.BILINEAR),
+        dtype=np.int16
+    )
+    dhash = np.packbits(small[:, 1:] > small[:, :-1])
+
+    text_digest = None
+    normalized_text = " ".join(page_text.split()) if page_text else ""
+    if normalized_text:
+        text_digest = hashlib.sha256(normalized_text.encode('utf-8')).hexdigest()
+
+    return {
+        "ink_ratio": ink_ratio,
+        "dhash": dhash,
+        "shape": pixels.shape,
+        "pixels": zlib.compress(pixels.tobytes(), 1),
+        "text_digest": text_digest
+    }
+
+
+def fingerprint_pixels(fingerprint: Dict[str, Any]):
+    """Thumbnail pixels of a fingerprint as a uint8 array"""
+    return np.frombuffer(zlib.decompress(fingerprint["pixels"]), dtype=np.uint8).reshape(fingerprint["shape"])
+
+
+def hamming_distance(hash_a, hash_b) -> int:
+    return int(np.unpackbits(np.bitwise_xor(hash_a, hash_b)).sum())
+
+
+def find_blank_and_duplicate_pages(fingerprints: Dict[int, Dict[str, Any]], blank_ink_ratio: float = 0.003,
+                                   max_hash_distance: int = 10,
+                                   max_changed_ratio: float = 0.0002) -> Dict[int, Dict[str, Any]]:
+    """
+    Decide which pages don't need their own vision call
+
+    Pages without a text layer whose ink coverage is below blank_ink_ratio are
+    skipped; a page with text is never blank, however little ink (a single
+    short line, light-coloured text) it renders. A page whose dHash is within
+    max_hash_distance of an earlier analyzed page, whose text layer (when both
+    pages have one) is identical, and whose thumbnail has at most
+    max_changed_ratio of its pixels visibly changed, reuses that page's result.
+    Pages without a text layer to confirm the match must render identically.
+    The hash alone is never trusted because pages that only differ in a page
+    number or a word look alike at hash resolution.
+
+    Returns {page_number: {"action": "skipped"|"reused", ...}} for affected pages only.
+    """
+    page_map = {}
+    analyzed_pages = []
+
+    for page_number in sorted(fingerprints):
+        fingerprint = fingerprints[page_number]
+
+        if not fingerprint["text_digest"] and fingerprint["ink_ratio"] < blank_ink_ratio:
+            page_map[page_number] = {
+                "action": "skipped",
+                "reason": "blank",
+                "ink_ratio": round(fingerprint["ink_ratio"], 5)
+            }
+            continue
+
+        for source_page in analyzed_pages:
+            source = fingerprints[source_page]
+            if source["shape"] != fingerprint["shape"]:
+                continue
+            if source["text_digest"] and fingerprint["text_digest"] and source["text_digest"] != fingerprint["text_digest"]:
+                continue
+            if hamming_distance(source["dhash"], fingerprint["dhash"]) > max_hash_distance:
+                continue
+
+            # Without matching text layers a page-number change is the only signal, so demand an identical render
+            text_confirmed = bool(source["text_digest"]) and source["text_digest"] == fingerprint["text_digest"]
+            allowed_ratio = max_changed_ratio if text_confirmed else 0.0
+
+            pixel_diff = np.abs(fingerprint_pixels(source).astype(np.int16) - fingerprint_pixels(fingerprint))
+            changed_ratio = float((pixel_diff > CHANGED_LEVEL).mean())
+            if changed_ratio <= allowed_ratio:
+                page_map[page_number] = {
+                    "action": "reused",
+                    "reason": "duplicate",
+                    "source_page": source_page,
+                    "changed_ratio": round(changed_ratio, 5)
+                }
+                break
+        else:
+            analyzed_pages.append(page_number)
+
+    return page_map
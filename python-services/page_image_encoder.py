@@ -0,0 +1,179 @@
+import io
+import time
+import logging
+from typing import Dict, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+    print("Warning: NumPy not available. Margin cropping, grayscale detection and raster text sizing disabled.")
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+MARGIN_LEVEL = 245        # Grayscale values darker than this are page content, lighter ones are margin
+MARGIN_PADDING = 0.01     # Keep this fraction of each dimension around the content when cropping
+MIN_CROP_GAIN = 0.03      # Only crop when it removes at least this fraction of the pixels
+COLOR_SPREAD = 24         # Channel spread (max - min) above which a pixel counts as colored
+COLOR_PIXEL_RATIO = 0.002 # Pages with fewer colored pixels than this are sent as grayscale
+TEXT_INK_LEVEL = 160      # Darker than this counts as glyph ink when measuring text lines on the raster
+MAX_BUDGET_ROUNDS = 3     # Downscale rounds when even min_quality doesn't fit the byte budget
+
+
+def measure_text_height(gray_pixels) -> Optional[float]:
+    """
+    Typical text line height in pixels, from the raster alone (scanned pages)
+
+    Rows containing glyph ink form runs, one per text line; the median run
+    height approximates the body font size in pixels. Returns None when the
+    page has too few lines to tell.
+    """
+    ink_rows = (gray_pixels < TEXT_INK_LEVEL).mean(axis=1) > 0.002
+    edges = np.flatnonzero(np.diff(ink_rows.astype(np.int8)))
+    if ink_rows[0]:
+        edges = np.insert(edges, 0, -1)
+    if ink_rows[-1]:
+        edges = np.append(edges, len(ink_rows) - 1)
+    heights = edges[1::2] - edges[0::2]
+    heights = heights[heights >= 3]
+    if len(heights) < 3:
+        return None
+    return float(np.median(heights))
+
+
+class PageImageEncoder:
+    """
+    JPEG encoder for page rasters that works to a byte and pixel budget
+
+    Each page is cropped to its content (empty margins removed), sent as
+    grayscale when it has no meaningful color, scaled down as far as its body
+    text stays at least min_text_px tall (and to the pixel budget), and then
+    encoded at the highest JPEG quality that fits the byte budget, found by
+    binary search. The aim is a payload small enough to go through on the first
+    attempt instead of relying on the retry ladder to shrink it.
+    """
+
+    def __init__(self, byte_budget: int = 400_000, pixel_budget: int = 1_200_000, min_text_px: float = 18.0,
+                 min_quality: int = 35, max_dimension: int = 2000):
+        if not PIL_AVAILABLE:
+            raise Exception("PIL not available. Cannot process images.")
+        self.byte_budget = byte_budget
+        self.pixel_budget = pixel_budget
+        self.min_text_px = min_text_px
+        self.min_quality = min_quality
+        self.max_dimension = max_dimension
+
+    def encode(self, image, max_quality: int = 75, text_px: Optional[float] = None,
+               budget_factor: float = 1.0) -> Tuple[bytes, Dict[str, Any]]:
+        """
+        Encode a page raster; returns (JPEG bytes, what was done)
+
+        text_px is the body text size in pixels on this raster (from the PDF
+        text layer); without it the size is measured on the raster. budget_factor
+        shrinks both budgets for retries after timeouts and payload errors.
+        """
+        start_time = time.perf_counter()
+        original_size = image.size
+        info = {"original_size": original_size, "cropped": False, "grayscale": False}
+
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        if NUMPY_AVAILABLE:
+            gray_pixels = np.asarray(image.convert("L"), dtype=np.uint8)
+            image, gray_pixels, info["cropped"] = self._crop_margins(image, gray_pixels)
+            if image.mode == "RGB" and self._is_monochrome(image):
+                image = image.convert("L")
+                info["grayscale"] = True
+            if text_px is None:
+                text_px = measure_text_height(gray_pixels)
+                info["text_px_source"] = "raster" if text_px else None
+            else:
+                info["text_px_source"] = "text_layer"
+        elif image.mode == "L":
+            info["grayscale"] = True
+
+        scale = self._choose_scale(image.size, text_px, self.pixel_budget * budget_factor)
+        if scale < 1.0:
+            width, height = image.size
+            image = image.resize((max(1, int(width * scale)), max(1, int(height * scale))), Image.Resampling.LANCZOS)
+        info["text_px"] = round(text_px * scale, 1) if text_px else None
+
+        data, quality = self._encode_within_budget(image, max_quality, int(self.byte_budget * budget_factor))
+        info.update({
+            "size": image.size,
+            "quality": quality,
+            "bytes": len(data),
+            "encode_ms": round((time.perf_counter() - start_time) * 1000)
+        })
+        return data, info
+
+    def _crop_margins(self, image, gray_pixels):
+        """Crop to the content bounding box plus a little padding (no-op on blank or full-bleed pages)"""
+        content = gray_pixels < MARGIN_LEVEL
+        rows = np.flatnonzero(content.any(axis=1))
+        columns = np.flatnonzero(content.any(axis=0))
+        if not len(rows) or not len(columns):
+            return image, gray_pixels, False
+
+        height, width = gray_pixels.shape
+        pad_y, pad_x = int(height * MARGIN_PADDING), int(width * MARGIN_PADDING)
+        top, bottom = max(0, rows[0] - pad_y), min(height, rows[-1] + 1 + pad_y)
+        left, right = max(0, columns[0] - pad_x), min(width, columns[-1] + 1 + pad_x)
+        if (bottom - top) * (right - left) > width * height * (1 - MIN_CROP_GAIN):
+            return image, gray_pixels, False
+        return image.crop((left, top, right, bottom)), gray_pixels[top:bottom, left:right], True
+
+    def _is_monochrome(self, image) -> bool:
+        # Every 4th pixel is plenty to tell a colored figure from black-on-white text
+        pixels = np.asarray(image, dtype=np.int16)[::4, ::4]
+        spread = pixels.max(axis=2) - pixels.min(axis=2)
+        return float((spread > COLOR_SPREAD).mean()) < COLOR_PIXEL_RATIO
+
+    def _choose_scale(self, size: Tuple[int, int], text_px: Optional[float], pixel_budget: float) -> float:
+        """Largest downscale that keeps body text legible, capped by the pixel budget and max_dimension"""
+        width, height = size
+        scale = 1.0
+        if text_px:
+            scale = min(scale, self.min_text_px / text_px)
+        scale = min(scale, (pixel_budget / (width * height)) ** 0.5, self.max_dimension / max(width, height))
+        return scale
+
+    def _encode_within_budget(self, image, max_quality: int, byte_budget: int) -> Tuple[bytes, int]:
+        """Highest quality in [min_quality, max_quality] whose JPEG fits byte_budget (downscaling if none does)"""
+        for _ in range(MAX_BUDGET_ROUNDS):
+            data = self._encode_jpeg(image, max_quality)
+            if len(data) <= byte_budget:
+                return data, max_quality
+
+            best = None
+            low, high = self.min_quality, max_quality - 1
+            while low <= high:
+                quality = (low + high) // 2
+                candidate = self._encode_jpeg(image, quality)
+                if len(candidate) <= byte_budget:
+                    best = (candidate, quality)
+                    low = quality + 1
+                else:
+                    data = candidate
+                    high = quality - 1
+            if best:
+                return best
+
+            # JPEG size scales roughly with pixel count - shrink just enough to fit
+            scale = min(0.9, (byte_budget / len(data)) ** 0.5 * 0.95)
+            width, height = image.size
+            image = image.resize((max(1, int(width * scale)), max(1, int(height * scale))), Image.Resampling.LANCZOS)
+            logger.info(f"Page image over {byte_budget} byte budget at quality {self.min_quality}, "
+                        f"reducing to {image.size}")
+
+        return self._encode_jpeg(image, self.min_quality), self.min_quality
+
+    def _encode_jpeg(self, image, quality: int) -> bytes:
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=quality, optimize=True)
+        return buffer.getvalue()
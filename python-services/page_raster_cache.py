@@ -0,0 +1,224 @@
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+try:
+    import fitz  # PyMuPDF
+    PYMUPDF_AVAILABLE = True
+except ImportError:
+    PYMUPDF_AVAILABLE = False
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+try:
+    from pdf2image import convert_from_path, pdfinfo_from_path
+    PDF2IMAGE_AVAILABLE = True
+except ImportError:
+    PDF2IMAGE_AVAILABLE = False
+
+
+def pixmap_to_image(pix):
+    """
+    Build a PIL Image from a PyMuPDF pixmap's sample buffer without a PPM round-trip
+
+    pix.samples is a bytes copy of the pixels (kept rather than samples_mv so the
+    image stays valid after the pixmap is freed); PIL then wraps that buffer
+    without decoding anything. Pixmaps with an alpha channel are flattened onto
+    white, since JPEG can't encode alpha.
+    """
+    if pix.alpha:
+        mode = "LA" if pix.n == 2 else "RGBA"
+        image = Image.frombuffer(mode, (pix.width, pix.height), pix.samples, "raw", mode, pix.stride, 1)
+        flattened = Image.new("RGB", image.size, "white")
+        flattened.paste(image.convert("RGBA"), mask=image.getchannel("A"))
+        return flattened
+    mode = "L" if pix.n == 1 else "RGB"
+    return Image.frombuffer(mode, (pix.width, pix.height), pix.samples, "raw", mode, pix.stride, 1)
+
+
+class PageRasterCache:
+    """
+    Per-job PDF handle and page raster cache
+
+    Opens the PDF once, reads the page count without rendering anything, and
+    rasterizes each page a single time at the highest resolution the retry
+    ladder needs. Lower-resolution retry variants are produced by downscaling
+    the cached raster in memory instead of re-opening and re-rendering the PDF.
+    """
+
+    def __init__(self, pdf_path: str, base_resolution: float = 2.0, max_cached_pages: int = 8):
+        if not PIL_AVAILABLE:
+            raise Exception("PIL not available. Cannot process images.")
+
+        self.pdf_path = pdf_path
+        self.base_resolution = base_resolution
+        self.max_cached_pages = max(1, max_cached_pages)
+        self._doc = None
+        self._page_count = None
+        self._rasters = OrderedDict()  # page_number -> PIL Image at base_resolution
+        self._page_hashes = {}  # page_number -> hex digest of the rendered page
+        self._lock = threading.Lock()  # PyMuPDF documents are not thread-safe
+
+        if PYMUPDF_AVAILABLE:
+            self._doc = fitz.open(pdf_path)
+            self._page_count = len(self._doc)
+        elif PDF2IMAGE_AVAILABLE:
+            # pdfinfo reads the page count from the document structure, no rendering
+            self._page_count = int(pdfinfo_from_path(pdf_path)["Pages"])
+        else:
+            raise Exception("No PDF processing library available. Install PyMuPDF or pdf2image with poppler.")
+
+    @property
+    def page_count(self) -> int:
+        return self._page_count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def close(self):
+        """Release the document handle and all cached rasters"""
+        with self._lock:
+            self._rasters.clear()
+            if self._doc is not None:
+                self._doc.close()
+                self._doc = None
+
+    def release(self, page_number: int):
+        """Drop a page raster once it is no longer needed (e.g. page analysis finished)"""
+        with self._lock:
+            self._rasters.pop(page_number, None)
+
+    def get_page_hash(self, page_number: int) -> str:
+        """Content hash of the rendered page (stable across re-uploads of the same PDF page)"""
+        page_hash = self._page_hashes.get(page_number)
+        if page_hash is None:
+            image = self.get_page_image(page_number)
+            digest = hashlib.sha256(f"{image.mode}:{image.size}".encode('utf-8'))
+            digest.update(image.tobytes())
+            page_hash = digest.hexdigest()
+            self._page_hashes[page_number] = page_hash
+        return page_hash
+
+    def get_page_thumbnail(self, page_number: int, width_px: int = 256):
+        """Low-resolution grayscale render for cheap page fingerprinting (not cached)"""
+        if self._doc is not None:
+            with self._lock:
+                page = self._doc.load_page(page_number - 1)
+                scale = width_px / max(page.rect.width, 1)
+                pix = page.get_pixmap(matrix=fitz.Matrix(scale, scale), colorspace=fitz.csGRAY)
+                return pixmap_to_image(pix)
+
+        images = convert_from_path(self.pdf_path, first_page=page_number, last_page=page_number,
+                                   size=(width_px, None), grayscale=True)
+        if not images:
+            raise ValueError(f"Could not convert page {page_number}")
+        return images[0]
+
+    def get_page_layout(self, page_number: int) -> Optional[Dict[str, Any]]:
+        """
+        Structural description of a page from its text layer and display list - no rasterization
+
+        Returns None when PyMuPDF isn't available (pdf2image can't read structure).
+        Each text block carries its joined text, largest font size and whether
+        every span is bold, which is enough to pick out headings.
+        """
+        if self._doc is None:
+            return None
+
+        with self._lock:
+            page = self._doc.load_page(page_number - 1)
+            text_dict = page.get_text("dict")
+            image_count = len(page.get_images(full=True))
+            drawing_count = len(page.get_drawings())
+            page_area = abs(page.rect.width * page.rect.height) or 1.0
+
+        blocks = []
+        text_area = 0.0
+        inline_images = 0
+        for block in text_dict.get("blocks", []):
+            if block.get("type") != 0:
+                inline_images += 1
+                continue
+
+            spans = [span for line in block.get("lines", []) for span in line.get("spans", []) if span.get("text", "").strip()]
+            if not spans:
+                continue
+
+            lines = []
+            for line in block.get("lines", []):
+                line_text = "".join(span.get("text", "") for span in line.get("spans", [])).strip()
+                if line_text:
+                    lines.append(line_text)
+
+            x0, y0, x1, y1 = block["bbox"]
+            text_area += max(0.0, (x1 - x0) * (y1 - y0))
+            blocks.append({
+                "text": " ".join(lines),
+                "lines": lines,
+                "font_size": max(span.get("size", 0) for span in spans),
+                "bold": all(span.get("flags", 0) & 16 for span in spans),
+                "chars": sum(len(span["text"].strip()) for span in spans)
+            })
+
+        return {
+            "blocks": blocks,
+            "text_chars": sum(block["chars"] for block in blocks),
+            "text_area_ratio": round(min(1.0, text_area / page_area), 3),
+            "image_count": max(image_count, inline_images),
+            "drawing_count": drawing_count
+        }
+
+    def get_page_image(self, page_number: int, resolution_matrix: Optional[float] = None):
+        """Return the page as a PIL Image at the requested resolution, rendering it at most once"""
+        if page_number < 1 or page_number > self._page_count:
+            raise ValueError(f"Page {page_number} not found. PDF has {self._page_count} pages.")
+
+        if resolution_matrix is None:
+            resolution_matrix = self.base_resolution
+
+        with self._lock:
+            base_image = self._rasters.get(page_number)
+            if base_image is None:
+                base_image = self._render_page(page_number)
+                self._rasters[page_number] = base_image
+                # Keep memory bounded - evict least recently used pages
+                while len(self._rasters) > self.max_cached_pages:
+                    self._rasters.popitem(last=False)
+            else:
+                self._rasters.move_to_end(page_number)
+                logger.info(f"Reusing cached raster for page {page_number}")
+
+        if resolution_matrix >= self.base_resolution:
+            return base_image
+
+        # Produce the lower-quality retry variant by downscaling in memory
+        scale = resolution_matrix / self.base_resolution
+        width, height = base_image.size
+        new_size = (max(1, int(width * scale)), max(1, int(height * scale)))
+        logger.info(f"Downscaling cached page {page_number} raster to {new_size} (resolution={resolution_matrix})")
+        return base_image.resize(new_size, Image.Resampling.LANCZOS)
+
+    def _render_page(self, page_number: int):
+        """Rasterize a single page at base_resolution (caller holds the lock)"""
+        logger.info(f"Rasterizing page {page_number} once at resolution matrix: {self.base_resolution}")
+
+        if self._doc is not None:
+            page = self._doc.load_page(page_number - 1)
+            mat = fitz.Matrix(self.base_resolution, self.base_resolution)
+            pix = page.get_pixmap(matrix=mat)
+            return pixmap_to_image(pix)
+
+        dpi = int(150 * (self.base_resolution / 2.0))
+        images = convert_from_path(self.pdf_path, first_page=page_number, last_page=page_number, dpi=dpi)
+        if not images:
+            raise ValueError(f"Could not convert page {page_number}")
+        return images[0]
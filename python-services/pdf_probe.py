@@ -0,0 +1,125 @@
+import logging
+from typing import Dict, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+try:
+    import fitz  # PyMuPDF
+    PYMUPDF_AVAILABLE = True
+except ImportError:
+    PYMUPDF_AVAILABLE = False
+try:
+    import PyPDF2
+    PYPDF2_AVAILABLE = True
+except ImportError:
+    PYPDF2_AVAILABLE = False
+
+
+def probe_pdf(pdf_path: str) -> Dict[str, Any]:
+    """
+    Cheap structural probe of a PDF - nothing is rasterized or decoded
+
+    Reads the page tree, page boxes, encryption dictionary and per-page font
+    resources only. A page is considered to have a text layer when it references
+    at least one font, which is how PDFs carry extractable text.
+
+    Returns:
+        {
+            "page_count": int,
+            "page_sizes": [{"width": float, "height": float}, ...],  # PDF points
+            "is_encrypted": bool,
+            "needs_password": bool,
+            "has_text_layer": bool,
+            "text_layer_pages": [int, ...]  # 1-based page numbers
+        }
+    """
+    if PYMUPDF_AVAILABLE:
+        return _probe_with_pymupdf(pdf_path)
+    elif PYPDF2_AVAILABLE:
+        return _probe_with_pypdf2(pdf_path)
+    else:
+        raise Exception("No PDF processing library available. Install PyMuPDF or PyPDF2.")
+
+
+def _probe_with_pymupdf(pdf_path: str) -> Dict[str, Any]:
+    doc = fitz.open(pdf_path)
+    try:
+        result = {
+            "page_count": len(doc),
+            "page_sizes": [],
+            "is_encrypted": bool(doc.is_encrypted),
+            "needs_password": bool(doc.needs_pass),
+            "has_text_layer": False,
+            "text_layer_pages": []
+        }
+
+        # Page objects can't be read without the password
+        if doc.needs_pass:
+            return result
+
+        for index in range(len(doc)):
+            page = doc.load_page(index)
+            rect = page.rect
+            result["page_sizes"].append({"width": round(rect.width, 2), "height": round(rect.height, 2)})
+            if page.get_fonts():
+                result["text_layer_pages"].append(index + 1)
+
+        result["has_text_layer"] = bool(result["text_layer_pages"])
+        return result
+    finally:
+        doc.close()
+
+
+def _probe_with_pypdf2(pdf_path: str) -> Dict[str, Any]:
+    with open(pdf_path, 'rb') as file:
+        reader = PyPDF2.PdfReader(file)
+        is_encrypted = bool(reader.is_encrypted)
+        needs_password = False
+
+        if is_encrypted:
+            # Many PDFs are encrypted with an empty user password (permissions only)
+            try:
+                needs_password = reader.decrypt("") == 0
+            except Exception:
+                needs_password = True
+
+        result = {
+            "page_count": 0,
+            "page_sizes": [],
+            "is_encrypted": is_encrypted,
+            "needs_password": needs_password,
+            "has_text_layer": False,
+            "text_layer_pages": []
+        }
+
+        if needs_password:
+            return result
+
+        result["page_count"] = len(reader.pages)
+        for index, page in enumerate(reader.pages):
+            box = page.mediabox
+            result["page_sizes"].append({"width": round(float(box.width), 2), "height": round(float(box.height), 2)})
+
+            resources = page.get("/Resources")
+            fonts = resources.get_object().get("/Font") if resources else None
+            if fonts:
+                result["text_layer_pages"].append(index + 1)
+
+        result["has_text_layer"] = bool(result["text_layer_pages"])
+        return result
+
+
+def resolve_page_range(page_count: int, first_page: Optional[int] = None,
+                       last_page: Optional[int] = None) -> Tuple[int, int]:
+    """
+    Clamp a requested 1-based, inclusive page range to the document
+
+    Missing bounds default to the first/last page and a last_page past the end
+    is clamped; a range that selects no page raises ValueError.
+    """
+    first_page = 1 if first_page is None else first_page
+    last_page = page_count if last_page is None else min(last_page, page_count)
+    if first_page < 1 or first_page > page_count:
+        raise ValueError(f"first_page {first_page} is outside the document (1-{page_count})")
+    if last_page < first_page:
+        raise ValueError(f"last_page {last_page} is before first_page {first_page}")
+    return first_page, last_page
@@ -0,0 +1,169 @@
+import os
+import re
+import time
+import asyncio
+import threading
+import logging
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# Default limits per provider (requests per minute, tokens per minute): OpenAI usage tier 2,
+# Anthropic tier 1, Gemini free tier. Override with RATE_LIMIT_<PROVIDER>_RPM / _TPM or
+# RATE_LIMIT_<PROVIDER>_<MODEL>_RPM / _TPM to match the account's actual tier
+DEFAULT_PROVIDER_LIMITS = {
+    "openai": {"rpm": 5000, "tpm": 450000},
+    "anthropic": {"rpm": 50, "tpm": 40000},
+    "gemini": {"rpm": 15, "tpm": 250000},
+}
+FALLBACK_LIMITS = {"rpm": 60, "tpm": 30000}
+
+# Rough token costs for estimating a request before it is sent
+CHARS_PER_TOKEN = 4
+IMAGE_TOKENS = 1105     # gpt-4o high-detail image of ~2000px (85 base + 6 tiles * 170)
+
+
+def estimate_text_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+class TokenBucketLimiter:
+    """
+    Requests-per-minute and tokens-per-minute buckets for one provider/model
+
+    acquire() blocks (acquire_async() awaits) until both buckets have room,
+    then deducts the request and its estimated tokens. Estimates are corrected
+    with settle() once the provider reports actual usage, and a 429 from the
+    provider pauses every caller through pause() instead of letting each one
+    retry into the limit on its own.
+    """
+
+    def __init__(self, name: str, requests_per_minute: float, tokens_per_minute: float):
+        self.name = name
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._request_allowance = float(requests_per_minute)
+        self._token_allowance = float(tokens_per_minute)
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._stats = {"requests": 0, "waits": 0, "waited_seconds": 0.0, "pauses": 0}
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int = 0) -> float:
+        """Block until the request fits; returns seconds waited"""
+        waited = 0.0
+        while True:
+            delay = self._try_reserve(tokens, waited)
+            if delay == 0:
+                return waited
+            time.sleep(delay)
+            waited += delay
+
+    async def acquire_async(self, tokens: int = 0) -> float:
+        """Event-loop friendly acquire(); returns seconds waited"""
+        waited = 0.0
+        while True:
+            delay = self._try_reserve(tokens, waited)
+            if delay == 0:
+                return waited
+            await asyncio.sleep(delay)
+            waited += delay
+
+    def settle(self, estimated_tokens: int, actual_tokens: Optional[int]):
+        """Replace a request's token estimate with the usage the provider reported"""
+        if actual_tokens is None:
+            return
+        with self._lock:
+            self._refill()
+            self._token_allowance = min(self.tokens_per_minute,
+                                        self._token_allowance + estimated_tokens - actual_tokens)
+
+    def pause(self, seconds: float):
+        """Hold all callers back, e.g. for a 429's Retry-After"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._stats["pauses"] += 1
+        logger.warning(f"Rate limiter {self.name} paused for {seconds:.1f}s after a provider rate limit")
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._refill()
+            return {
+                "name": self.name,
+                "requests_per_minute": self.requests_per_minute,
+                "tokens_per_minute": self.tokens_per_minute,
+                "available_requests": round(self._request_allowance, 1),
+                "available_tokens": int(self._token_allowance),
+                "paused_for": round(max(0.0, self._paused_until - time.monotonic()), 1),
+                **{key: round(value, 1) if isinstance(value, float) else value for key, value in self._stats.items()}
+            }
+
+    def _refill(self):
+        """Top both buckets up for the time since the last update (caller holds the lock)"""
+        now = time.monotonic()
+        elapsed = now - self._updated_at
+        self._updated_at = now
+        self._request_allowance = min(self.requests_per_minute,
+                                      self._request_allowance + elapsed * self.requests_per_minute / 60)
+        self._token_allowance = min(self.tokens_per_minute,
+                                    self._token_allowance + elapsed * self.tokens_per_minute / 60)
+
+    def _try_reserve(self, tokens: int, waited: float) -> float:
+        """Reserve the request if it fits now (returns 0), else return how long to wait"""
+        # A single request larger than the whole bucket would never fit - let it through when the bucket is full
+        tokens = min(tokens, self.tokens_per_minute)
+        with self._lock:
+            self._refill()
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                return pause
+
+            request_deficit = 1 - self._request_allowance
+            token_deficit = tokens - self._token_allowance
+            if request_deficit <= 0 and token_deficit <= 0:
+                self._request_allowance -= 1
+                self._token_allowance -= tokens
+                self._stats["requests"] += 1
+                if waited:
+                    self._stats["waits"] += 1
+                    self._stats["waited_seconds"] += waited
+                return 0
+
+            return max(request_deficit * 60 / self.requests_per_minute,
+                       token_deficit * 60 / self.tokens_per_minute,
+                       0.05)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def _env_limit(provider: str, model: str, kind: str) -> Optional[float]:
+    model_key = re.sub(r'[^A-Z0-9]+', '_', model.upper()).strip('_')
+    for name in (f"RATE_LIMIT_{provider.upper()}_{model_key}_{kind}", f"RATE_LIMIT_{provider.upper()}_{kind}"):
+        value = os.getenv(name)
+        if value:
+            return float(value)
+    return None
+
+
+def get_rate_limiter(provider: str, model: str) -> TokenBucketLimiter:
+    """Process-wide limiter for a provider/model, created on first use with limits from the environment"""
+    key = (provider.lower(), model)
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            defaults = DEFAULT_PROVIDER_LIMITS.get(key[0], FALLBACK_LIMITS)
+            limiter = TokenBucketLimiter(
+                f"{key[0]}/{model}",
+                _env_limit(key[0], model, "RPM") or defaults["rpm"],
+                _env_limit(key[0], model, "TPM") or defaults["tpm"]
+            )
+            _limiters[key] = limiter
+        return limiter
+
+
+def get_rate_limiter_stats() -> list:
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return [limiter.get_stats() for limiter in limiters]
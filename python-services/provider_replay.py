@@ -0,0 +1,413 @@
+import os
+import re
+import json
+import math
+import time
+import random
+import hashlib
+import logging
+import threading
+from collections import deque
+from types import SimpleNamespace
+from typing import Dict, Any, Optional, Tuple
+
+from provider_rate_limiter import IMAGE_TOKENS, estimate_text_tokens
+
+logger = logging.getLogger(__name__)
+
+REPLAY_MODES = ("off", "record", "replay")
+
+# Strings this long without a space in the first part are image/file payloads (base64 or data URLs)
+BLOB_MIN_LENGTH = 4096
+
+# Reply used for page-analysis requests that have no recording
+DEFAULT_PAGE_REPLY = {
+    "component_sequence": [
+        {
+            "type": "heading",
+            "order": 1,
+            "parameters": {"text": "Replayed page"},
+            "confidence": 0.9
+        },
+        {
+            "type": "paragraph",
+            "order": 2,
+            "parameters": {"text": "Offline stand-in reply; record real responses with LLM_REPLAY_MODE=record."},
+            "confidence": 0.9
+        }
+    ],
+    "suggested_template": "text-heavy",
+    "overall_confidence": 0.9,
+    "processing_notes": "Synthetic reply from the replay provider"
+}
+DEFAULT_CHAT_REPLY = "Offline stand-in reply (no recording matched this request)."
+
+PAGE_KEY_PATTERN = re.compile(r'\bpage_\d+\b')
+
+
+class ReplayRateLimitError(Exception):
+    """Injected 429, shaped like the SDK errors classify_api_error/get_retry_after read"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Rate limit reached (replay), retry after {retry_after:.1f}s")
+        self.status_code = 429
+        self.response = SimpleNamespace(headers={"retry-after-ms": str(int(retry_after * 1000))})
+
+
+class ReplayTimeoutError(TimeoutError):
+    """Injected request timeout"""
+
+
+class ReplayServerError(Exception):
+    """Injected 5xx"""
+
+    def __init__(self, message: str = "The server had an error processing your request (replay)"):
+        super().__init__(message)
+        self.status_code = 503
+
+
+def get_replay_mode() -> str:
+    mode = os.getenv('LLM_REPLAY_MODE', 'off').lower()
+    if mode not in REPLAY_MODES:
+        logger.warning(f"Unknown LLM_REPLAY_MODE '{mode}', using live providers")
+        return "off"
+    return mode
+
+
+def _strip_blobs(value, keep_digest: bool):
+    """Copy of a request with image/file payloads replaced by their digest (or dropped)"""
+    if isinstance(value, dict):
+        return {key: _strip_blobs(item, keep_digest) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_strip_blobs(item, keep_digest) for item in value]
+    if isinstance(value, bytes) or (
+        isinstance(value, str) and len(value) >= BLOB_MIN_LENGTH and ' ' not in value[:BLOB_MIN_LENGTH]
+    ):
+        if not keep_digest:
+            return "<blob>"
+        data = value if isinstance(value, bytes) else value.encode()
+        return f"<blob {hashlib.sha256(data).hexdigest()[:16]}>"
+    return value
+
+
+def request_keys(provider: str, request: Dict[str, Any]) -> Tuple[str, str]:
+    """
+    (exact key, text key) for a request
+
+    The exact key covers the images too; the text key ignores them, so a page
+    re-sent at a lower quality (or the same prompt for another PDF) still finds
+    a recording.
+    """
+    relevant = {
+        "provider": provider,
+        "model": request.get("model"),
+        "system": request.get("system"),
+        "messages": request.get("messages")
+    }
+    keys = []
+    for keep_digest in (True, False):
+        encoded = json.dumps(_strip_blobs(relevant, keep_digest), sort_keys=True, default=str)
+        keys.append(hashlib.sha256(encoded.encode()).hexdigest())
+    return keys[0], keys[1]
+
+
+class ReplayStore:
+    """
+    Recorded provider replies in a JSON-lines file
+
+    Each line holds the request's exact and text keys, the reply (OpenAI text or
+    Anthropic content blocks) and the usage the provider reported. Lookups try
+    the exact key first, then the text key.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._exact = {}
+        self._by_text = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        self._index(json.loads(line))
+                    except json.JSONDecodeError:
+                        logger.warning(f"Skipping unreadable line in replay recordings {path}")
+        logger.info(f"Replay store {path}: {len(self._exact)} recorded replies")
+
+    def __len__(self):
+        return len(self._exact)
+
+    def lookup(self, exact_key: str, text_key: str) -> Tuple[Optional[Dict[str, Any]], str]:
+        """(entry, "exact" | "text" | "miss")"""
+        with self._lock:
+            if exact_key in self._exact:
+                return self._exact[exact_key], "exact"
+            if text_key in self._by_text:
+                return self._by_text[text_key], "text"
+        return None, "miss"
+
+    def add(self, entry: Dict[str, Any]):
+        with self._lock:
+            self._index(entry)
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry) + "\n")
+
+    def _index(self, entry: Dict[str, Any]):
+        self._exact[entry["key"]] = entry
+        self._by_text.setdefault(entry["text_key"], entry)
+
+
+class ReplayProvider:
+    """
+    Offline stand-in for the model providers
+
+    In replay mode every request sleeps for a latency drawn from a log-normal
+    distribution (median latency_median seconds, spread latency_sigma), may be
+    failed on purpose (timeouts, 429s, 5xx, malformed or truncated JSON at the
+    configured rates), is held to max_concurrency requests in flight and
+    requests_per_minute (over the limit gets a 429 with Retry-After, like the
+    real APIs), and is answered from the recordings - or with a synthetic reply
+    when nothing matches. In record mode requests go to the live client and
+    its replies are appended to the recordings.
+    """
+
+    def __init__(self, recordings_path: str = None, latency_median: float = None, latency_sigma: float = None,
+                 timeout_rate: float = None, rate_limit_rate: float = None, server_error_rate: float = None,
+                 malformed_rate: float = None, truncated_rate: float = None, max_concurrency: int = None,
+                 requests_per_minute: float = None, timeout_stall: float = None, seed: int = None):
+        def setting(value, env_name, default, cast=float):
+            return value if value is not None else cast(os.getenv(env_name, default))
+
+        self.store = ReplayStore(recordings_path or os.getenv('LLM_REPLAY_PATH', 'llm_replay_recordings.jsonl'))
+        self.latency_median = setting(latency_median, 'LLM_REPLAY_LATENCY_MEDIAN', '1.5')
+        self.latency_sigma = setting(latency_sigma, 'LLM_REPLAY_LATENCY_SIGMA', '0.4')
+        self.timeout_rate = setting(timeout_rate, 'LLM_REPLAY_TIMEOUT_RATE', '0')
+        self.rate_limit_rate = setting(rate_limit_rate, 'LLM_REPLAY_RATE_LIMIT_RATE', '0')
+        self.server_error_rate = setting(server_error_rate, 'LLM_REPLAY_SERVER_ERROR_RATE', '0')
+        self.malformed_rate = setting(malformed_rate, 'LLM_REPLAY_MALFORMED_RATE', '0')
+        self.truncated_rate = setting(truncated_rate, 'LLM_REPLAY_TRUNCATED_RATE', '0')
+        self.max_concurrency = setting(max_concurrency, 'LLM_REPLAY_MAX_CONCURRENCY', '8', int)
+        self.requests_per_minute = setting(requests_per_minute, 'LLM_REPLAY_RPM', '0')
+        # Injected timeouts stall this long (at most the request's own timeout) before raising
+        self.timeout_stall = setting(timeout_stall, 'LLM_REPLAY_TIMEOUT_STALL', '2')
+
+        seed = seed if seed is not None else os.getenv('LLM_REPLAY_SEED')
+        self._random = random.Random(int(seed) if seed not in (None, "") else None)
+        self._random_lock = threading.Lock()
+        self._in_flight = threading.BoundedSemaphore(max(1, self.max_concurrency))
+        self._request_times = deque()
+        self._window_lock = threading.Lock()
+        self._stats = {
+            "requests": 0, "recorded": 0, "exact_hits": 0, "text_hits": 0, "synthetic": 0,
+            "timeouts": 0, "rate_limits": 0, "throughput_limits": 0, "server_errors": 0,
+            "malformed": 0, "truncated": 0
+        }
+        self._stats_lock = threading.Lock()
+
+    def respond(self, provider: str, request: Dict[str, Any], live_call: Optional[callable] = None):
+        """
+        Answer one request; returns (reply, usage, finish reason)
+
+        reply is the text for OpenAI-style requests and a list of content block
+        dicts for Anthropic-style ones.
+        """
+        exact_key, text_key = request_keys(provider, request)
+        if live_call is not None:
+            reply, usage, finish_reason = live_call()
+            self.store.add({
+                "key": exact_key, "text_key": text_key, "provider": provider, "model": request.get("model"),
+                "reply": reply, "usage": usage, "finish_reason": finish_reason, "recorded_at": time.time()
+            })
+            self._count("recorded")
+            return reply, usage, finish_reason
+
+        self._count("requests")
+        self._check_throughput()
+        with self._in_flight:
+            fault, latency = self._draw_fault()
+            if fault == "rate_limit":
+                self._count("rate_limits")
+                raise ReplayRateLimitError(retry_after=1.0)
+            request_timeout = request.get("timeout")
+            if fault == "timeout" or (request_timeout and latency > request_timeout):
+                self._count("timeouts")
+                time.sleep(min(request_timeout or self.timeout_stall, self.timeout_stall))
+                raise ReplayTimeoutError(f"Request timed out (replay, timeout={request_timeout})")
+            time.sleep(latency)
+            if fault == "server_error":
+                self._count("server_errors")
+                raise ReplayServerError()
+
+        entry, match = self.store.lookup(exact_key, text_key)
+        if entry is not None:
+            self._count(f"{match}_hits")
+            reply, usage, finish_reason = entry["reply"], dict(entry["usage"]), entry.get("finish_reason")
+        else:
+            self._count("synthetic")
+            reply, usage, finish_reason = self._synthesize(provider, request)
+
+        if provider == "openai" and fault == "malformed":
+            self._count("malformed")
+            # Single quotes survive none of the local repairs, so this exercises the re-ask path
+            reply = reply.replace('"', "'")
+        elif provider == "openai" and fault == "truncated":
+            self._count("truncated")
+            reply, finish_reason = reply[:max(1, len(reply) * 2 // 3)], "length"
+        return reply, usage, finish_reason
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["recordings"] = len(self.store)
+        return stats
+
+    def _count(self, key: str):
+        with self._stats_lock:
+            self._stats[key] += 1
+
+    def _draw_fault(self) -> Tuple[Optional[str], float]:
+        """Pick this request's injected fault (or None) and its simulated latency"""
+        with self._random_lock:
+            roll = self._random.random()
+            latency = self.latency_median * math.exp(self._random.gauss(0, self.latency_sigma))
+        for fault, rate in (("timeout", self.timeout_rate), ("rate_limit", self.rate_limit_rate),
+                            ("server_error", self.server_error_rate), ("malformed", self.malformed_rate),
+                            ("truncated", self.truncated_rate)):
+            if roll < rate:
+                return fault, latency
+            roll -= rate
+        return None, latency
+
+    def _check_throughput(self):
+        """Sliding one-minute window; over requests_per_minute is answered with a 429"""
+        if self.requests_per_minute <= 0:
+            return
+        now = time.monotonic()
+        with self._window_lock:
+            while self._request_times and now - self._request_times[0] >= 60:
+                self._request_times.popleft()
+            if len(self._request_times) >= self.requests_per_minute:
+                retry_after = 60 - (now - self._request_times[0])
+                self._count("throughput_limits")
+                raise ReplayRateLimitError(retry_after=max(0.1, retry_after))
+            self._request_times.append(now)
+
+    def _synthesize(self, provider: str, request: Dict[str, Any]):
+        prompt_text = json.dumps(_strip_blobs(request.get("messages"), keep_digest=False))
+        prompt_tokens = estimate_text_tokens(prompt_text) + IMAGE_TOKENS * prompt_text.count("<blob>")
+        if provider == "anthropic":
+            reply = [{"type": "text", "text": DEFAULT_CHAT_REPLY}]
+            usage = {"input_tokens": prompt_tokens, "output_tokens": estimate_text_tokens(DEFAULT_CHAT_REPLY)}
+            return reply, usage, "end_turn"
+
+        # Batched page requests ask for one analysis per page_<n> key
+        page_keys = sorted(set(PAGE_KEY_PATTERN.findall(prompt_text)), key=lambda key: int(key[5:]))
+        if page_keys:
+            reply = json.dumps({key: DEFAULT_PAGE_REPLY for key in page_keys})
+        else:
+            reply = json.dumps(DEFAULT_PAGE_REPLY)
+        completion_tokens = estimate_text_tokens(reply)
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                 "total_tokens": prompt_tokens + completion_tokens}
+        return reply, usage, "stop"
+
+
+class _OpenAICompletions:
+    def __init__(self, provider: ReplayProvider, live_client):
+        self._provider = provider
+        self._live_client = live_client
+
+    def create(self, **request):
+        live_call = None
+        if self._live_client is not None:
+            def live_call():
+                response = self._live_client.chat.completions.create(**request)
+                usage = response.usage
+                return response.choices[0].message.content, {
+                    "prompt_tokens": usage.prompt_tokens,
+                    "completion_tokens": usage.completion_tokens,
+                    "total_tokens": usage.total_tokens
+                }, getattr(response.choices[0], "finish_reason", None)
+
+        reply, usage, finish_reason = self._provider.respond("openai", request, live_call)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=reply), finish_reason=finish_reason)],
+            usage=SimpleNamespace(**usage),
+            model=request.get("model")
+        )
+
+
+class ReplayOpenAIClient:
+    """Drop-in for OpenAI(): client.chat.completions.create(**request)"""
+
+    def __init__(self, provider: ReplayProvider, live_client=None):
+        self.chat = SimpleNamespace(completions=_OpenAICompletions(provider, live_client))
+
+
+class _AnthropicMessages:
+    def __init__(self, provider: ReplayProvider, live_client):
+        self._provider = provider
+        self._live_client = live_client
+
+    def create(self, **request):
+        live_call = None
+        if self._live_client is not None:
+            def live_call():
+                response = self._live_client.messages.create(**request)
+                blocks = []
+                for block in response.content:
+                    if block.type == "tool_use":
+                        blocks.append({"type": "tool_use", "id": block.id, "name": block.name, "input": block.input})
+                    elif hasattr(block, "text"):
+                        blocks.append({"type": block.type, "text": block.text})
+                return blocks, {
+                    "input_tokens": response.usage.input_tokens,
+                    "output_tokens": response.usage.output_tokens
+                }, response.stop_reason
+
+        blocks, usage, stop_reason = self._provider.respond("anthropic", request, live_call)
+        return SimpleNamespace(
+            content=[SimpleNamespace(**block) for block in blocks],
+            usage=SimpleNamespace(**usage),
+            stop_reason=stop_reason,
+            model=request.get("model")
+        )
+
+
+class ReplayAnthropicClient:
+    """Drop-in for Anthropic(): client.messages.create(**request)"""
+
+    def __init__(self, provider: ReplayProvider, live_client=None):
+        self.messages = _AnthropicMessages(provider, live_client)
+
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def get_replay_provider() -> ReplayProvider:
+    """Process-wide replay provider, configured from LLM_REPLAY_* on first use"""
+    global _provider
+    with _provider_lock:
+        if _provider is None:
+            _provider = ReplayProvider()
+        return _provider
+
+
+def create_replay_client(provider: str, live_client=None):
+    """
+    Replay client for "openai" or "anthropic"
+
+    With live_client (record mode) requests go through to it and are recorded;
+    without it they are answered offline.
+    """
+    clients = {"openai": ReplayOpenAIClient, "anthropic": ReplayAnthropicClient}
+    if provider not in clients:
+        raise ValueError(f"No replay client for provider '{provider}'")
+    return clients[provider](get_replay_provider(), live_client)
@@ -0,0 +1,105 @@
+import json
+import re
+import logging
+from typing import Dict, Any, List
+
+logger = logging.getLogger(__name__)
+
+COMPONENT_SEQUENCE_START = re.compile(r'"component_sequence"\s*:\s*\[')
+
+
+def _scan_json_structure(text: str):
+    """Walk text outside string literals, yielding (index, char) for structural characters"""
+    in_string = False
+    escaped = False
+    for index, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+            continue
+        yield index, char
+    # Final state tells callers whether the text ended inside a string
+    yield len(text), '"' if in_string else ''
+
+
+def strip_trailing_commas(text: str) -> str:
+    """Remove commas directly before a closing bracket/brace, leaving string contents alone"""
+    drop = set()
+    last_comma = None
+    for index, char in _scan_json_structure(text):
+        if char == ',':
+            last_comma = index
+        elif char in '}]':
+            if last_comma is not None:
+                drop.add(last_comma)
+            last_comma = None
+        elif char and not char.isspace():
+            last_comma = None
+    return "".join(char for index, char in enumerate(text) if index not in drop)
+
+
+def looks_truncated(text: str) -> bool:
+    """True when a JSON reply stops mid-structure (unclosed brackets or string), e.g. at max_tokens"""
+    depth = 0
+    started = False
+    ended_in_string = False
+    for index, char in _scan_json_structure(text):
+        if index == len(text):
+            ended_in_string = char == '"'
+        elif char in '{[':
+            depth += 1
+            started = True
+        elif char in '}]':
+            depth -= 1
+    return started and (depth > 0 or ended_in_string)
+
+
+def repair_json_text(text: str) -> str:
+    """Cheap local fixes for common reply damage: surrounding prose, inner code fences, trailing commas"""
+    fenced = re.search(r"```(?:json)?\s*(.*?)```", text, re.DOTALL)
+    if fenced:
+        text = fenced.group(1)
+    start, end = text.find('{'), text.rfind('}')
+    if start != -1 and end > start:
+        text = text[start:end + 1]
+    return strip_trailing_commas(text).strip()
+
+
+def salvage_component_sequence(text: str) -> List[Dict[str, Any]]:
+    """
+    Recover every complete component object from a (possibly truncated) reply
+
+    Decodes the component_sequence array one element at a time and stops at the
+    first element that doesn't parse, so a reply cut off mid-component still
+    yields all the components before the cut.
+    """
+    match = COMPONENT_SEQUENCE_START.search(text)
+    if not match:
+        return []
+
+    text = strip_trailing_commas(text)
+    match = COMPONENT_SEQUENCE_START.search(text)
+    decoder = json.JSONDecoder()
+    position = match.end()
+    components = []
+
+    while position < len(text):
+        while position < len(text) and (text[position].isspace() or text[position] == ','):
+            position += 1
+        if position >= len(text) or text[position] == ']':
+            break
+        try:
+            component, position = decoder.raw_decode(text, position)
+        except json.JSONDecodeError:
+            break
+        if isinstance(component, dict):
+            components.append(component)
+
+    return components
@@ -0,0 +1,426 @@
+import os
+import json
+import asyncio
+import time
+import uuid
+import logging
+import sqlite3
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+TERMINAL_JOB_STATUSES = (JOB_COMPLETED, JOB_FAILED)
+
+
+class ProvisionalComponentWriter:
+    """
+    Bridges job worker threads to DatabaseManager's async provisional-component methods
+
+    Coroutines run on the application's event loop; the worker waits for each
+    write so a page is stored before its page_components event is published.
+    """
+
+    def __init__(self, db_manager, loop: asyncio.AbstractEventLoop, timeout: float = 10.0):
+        self.db_manager = db_manager
+        self.loop = loop
+        self.timeout = timeout
+
+    def clear(self, node_id: str, session_id: Optional[str]):
+        self._run(self.db_manager.clear_provisional_components(node_id, session_id))
+
+    def save_page(self, node_id: str, session_id: Optional[str], page_number: int,
+                  components: List[Dict[str, Any]]) -> bool:
+        return bool(self._run(self.db_manager.save_provisional_page_components(
+            node_id, page_number, components, session_id=session_id
+        )))
+
+    def _run(self, coroutine):
+        try:
+            return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout=self.timeout)
+        except Exception as e:
+            logger.warning(f"Provisional component write failed: {e}")
+            return None
+
+
+class VisionJobQueue:
+    """
+    Persistent queue for PDF vision analysis jobs
+
+    Jobs, their progress events and per-page checkpoints live in a small SQLite
+    file, and a bounded worker pool runs at most max_workers analyses at once.
+    Uploads beyond that wait in the queue instead of each starting a thread.
+    On startup, jobs that were queued or interrupted mid-run are resubmitted
+    and resume from their checkpointed pages.
+
+    Events are numbered per job (seq) and pushed to asyncio subscribers as soon
+    as they are recorded, so streams never poll and can resume from any seq.
+    """
+
+    def __init__(self, vision_processor, db_path: str = None, max_workers: int = None, retention_days: int = None):
+        self.vision_processor = vision_processor
+        self.db_path = db_path or os.getenv('VISION_JOB_DB_PATH', 'vision_jobs.db')
+        self.max_workers = max(1, max_workers or int(os.getenv('VISION_JOB_WORKERS', '2')))
+        self.retention_seconds = (retention_days or int(os.getenv('VISION_JOB_RETENTION_DAYS', '7'))) * 86400
+        self._lock = threading.Lock()
+        self._executor = None
+        self._active_jobs = set()  # Job ids currently running in this process
+        self._subscribers = {}  # job_id -> [(event loop, asyncio.Queue)]
+        self.component_writer = None  # Optional ProvisionalComponentWriter for per-page persistence
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS vision_jobs (
+                job_id TEXT PRIMARY KEY,
+                node_id TEXT NOT NULL,
+                session_id TEXT,
+                pdf_path TEXT NOT NULL,
+                filename TEXT,
+                context TEXT,
+                first_page INTEGER,
+                last_page INTEGER,
+                status TEXT NOT NULL,
+                total_pages INTEGER,
+                completed_pages INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_vision_jobs_status ON vision_jobs(status, created_at);
+
+            CREATE TABLE IF NOT EXISTS vision_job_pages (
+                job_id TEXT NOT NULL,
+                page_number INTEGER NOT NULL,
+                result TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (job_id, page_number)
+            );
+
+            CREATE TABLE IF NOT EXISTS vision_job_events (
+                job_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                event TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (job_id, seq)
+            );
+        """)
+        # Job databases created before session tagging / page ranges lack those columns
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(vision_jobs)").fetchall()}
+        for column, column_type in (("session_id", "TEXT"), ("first_page", "INTEGER"), ("last_page", "INTEGER")):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE vision_jobs ADD COLUMN {column} {column_type}")
+        self._conn.commit()
+
+    def start(self):
+        """Start the worker pool and resubmit jobs left queued/running by a previous process"""
+        if self._executor is not None:
+            return
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="vision-job")
+        self._purge_old_jobs()
+
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT job_id, status FROM vision_jobs WHERE status IN (?, ?) ORDER BY created_at",
+                (JOB_QUEUED, JOB_RUNNING)
+            ).fetchall()
+        for job_id, status in rows:
+            if status == JOB_RUNNING:
+                logger.info(f"Resuming interrupted vision job {job_id}")
+                self._append_event(job_id, {"status": "requeued", "message": "Server restarted - resuming analysis"})
+            self._executor.submit(self._run_job, job_id)
+        logger.info(f"Vision job queue started with {self.max_workers} workers ({len(rows)} jobs resubmitted)")
+
+    def shutdown(self):
+        """Stop accepting work; running jobs keep their checkpoints and resume on next start"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def submit(self, node_id: str, pdf_path: str, filename: str = None, context: str = None,
+               session_id: str = None, first_page: int = None, last_page: int = None) -> str:
+        """Queue a PDF (or the page range first_page-last_page of it) for analysis and return its job id"""
+        if self._executor is None:
+            self.start()
+
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO vision_jobs
+                    (job_id, node_id, session_id, pdf_path, filename, context, first_page, last_page,
+                     status, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (job_id, node_id, session_id, pdf_path, filename, context, first_page, last_page,
+                 JOB_QUEUED, now, now)
+            )
+            self._conn.commit()
+
+        self._append_event(job_id, {"status": "queued", "job_id": job_id, "message": "Analysis queued"})
+        self._executor.submit(self._run_job, job_id)
+        return job_id
+
+    def retry(self, job_id: str) -> bool:
+        """Requeue a failed job; it resumes from its checkpointed pages. False if it isn't failed or its upload is gone"""
+        with self._lock:
+            row = self._conn.execute("SELECT status, pdf_path FROM vision_jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if not row or row[0] != JOB_FAILED or not os.path.exists(row[1]):
+                return False
+            self._conn.execute(
+                "UPDATE vision_jobs SET status = ?, error = NULL, finished_at = NULL, updated_at = ? WHERE job_id = ?",
+                (JOB_QUEUED, time.time(), job_id)
+            )
+            self._conn.commit()
+
+        if self._executor is None:
+            self.start()
+        self._append_event(job_id, {"status": "requeued", "job_id": job_id, "message": "Retrying analysis"})
+        self._executor.submit(self._run_job, job_id)
+        return True
+
+    def get_job(self, job_id: str, include_result: bool = False) -> Optional[Dict[str, Any]]:
+        """Job status row as a dict (result only when include_result), or None if unknown"""
+        with self._lock:
+            self._conn.row_factory = sqlite3.Row
+            try:
+                row = self._conn.execute("SELECT * FROM vision_jobs WHERE job_id = ?", (job_id,)).fetchone()
+                queue_position = None
+                if row and row["status"] == JOB_QUEUED:
+                    queue_position = self._conn.execute(
+                        "SELECT COUNT(*) FROM vision_jobs WHERE status = ? AND created_at < ?",
+                        (JOB_QUEUED, row["created_at"])
+                    ).fetchone()[0] + 1
+            finally:
+                self._conn.row_factory = None
+
+        if not row:
+            return None
+
+        job = {key: row[key] for key in row.keys() if key not in ("result", "pdf_path")}
+        job["queue_position"] = queue_position
+        if include_result:
+            job["result"] = json.loads(row["result"]) if row["result"] else None
+        return job
+
+    def get_events(self, job_id: str, after_seq: int = 0) -> List[Dict[str, Any]]:
+        """Progress events with seq > after_seq, oldest first (each carries its seq)"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, event FROM vision_job_events WHERE job_id = ? AND seq > ? ORDER BY seq",
+                (job_id, after_seq)
+            ).fetchall()
+        events = []
+        for seq, event_json in rows:
+            event = json.loads(event_json)
+            event["seq"] = seq
+            events.append(event)
+        return events
+
+    def subscribe(self, job_id: str, loop: asyncio.AbstractEventLoop) -> asyncio.Queue:
+        """Register an asyncio queue that receives (seq, event) for every new event of the job"""
+        queue = asyncio.Queue()
+        with self._lock:
+            self._subscribers.setdefault(job_id, []).append((loop, queue))
+        return queue
+
+    def unsubscribe(self, job_id: str, queue: asyncio.Queue):
+        with self._lock:
+            subscribers = [entry for entry in self._subscribers.get(job_id, []) if entry[1] is not queue]
+            if subscribers:
+                self._subscribers[job_id] = subscribers
+            else:
+                self._subscribers.pop(job_id, None)
+
+    def _run_job(self, job_id: str):
+        with self._lock:
+            if job_id in self._active_jobs:
+                return
+            self._active_jobs.add(job_id)
+        try:
+            self._execute_job(job_id)
+        finally:
+            with self._lock:
+                self._active_jobs.discard(job_id)
+
+    def _execute_job(self, job_id: str):
+        job = self.get_job(job_id)
+        if not job or job["status"] in TERMINAL_JOB_STATUSES:
+            return
+
+        with self._lock:
+            now = time.time()
+            self._conn.execute(
+                """
+                UPDATE vision_jobs
+                SET status = ?, attempts = attempts + 1, started_at = COALESCE(started_at, ?), updated_at = ?
+                WHERE job_id = ?
+                """,
+                (JOB_RUNNING, now, now, job_id)
+            )
+            pdf_path = self._conn.execute("SELECT pdf_path FROM vision_jobs WHERE job_id = ?", (job_id,)).fetchone()[0]
+            checkpoints = {
+                page_number: json.loads(result)
+                for page_number, result in self._conn.execute(
+                    "SELECT page_number, result FROM vision_job_pages WHERE job_id = ?", (job_id,)
+                ).fetchall()
+            }
+            self._conn.commit()
+
+        logger.info(f"Running vision job {job_id} ({len(checkpoints)} checkpointed pages)")
+
+        # A fresh analysis supersedes provisional rows from earlier runs; a resumed one keeps its pages
+        if self.component_writer and job["attempts"] == 0:
+            self.component_writer.clear(job["node_id"], job["session_id"])
+
+        def progress_callback(update):
+            if update.get("status") == "page_components" and self.component_writer:
+                # Store before publishing so an editor save triggered by the event replaces these rows
+                update["persisted"] = self.component_writer.save_page(
+                    job["node_id"], job["session_id"], update["current_page"], update["component_sequence"]
+                )
+            self._append_event(job_id, update)
+            if update.get("total_pages"):
+                # Progress counts the pages in the job's range, not the whole document
+                total_pages = update["total_pages"]
+                range_pages = min(job["last_page"] or total_pages, total_pages) - (job["first_page"] or 1) + 1
+                self._update_progress(job_id, max(0, range_pages))
+
+        def page_result_callback(page_number, page_result):
+            self._save_checkpoint(job_id, page_number, page_result)
+
+        try:
+            result = self.vision_processor.analyze_pdf_for_components(
+                pdf_path=pdf_path,
+                context=job["context"] or None,
+                progress_callback=progress_callback,
+                resume_pages=checkpoints,
+                page_result_callback=page_result_callback,
+                call_tags={"job_id": job_id, "node_id": job["node_id"], "session_id": job["session_id"]},
+                first_page=job["first_page"],
+                last_page=job["last_page"]
+            )
+            if result.get("failed"):
+                # Whole-job errors come back as a placeholder result; keep the checkpoints for a retry
+                logger.error(f"Vision job {job_id} failed: {result.get('error')}")
+                self._finish_job(job_id, JOB_FAILED, error=result.get("error") or "Vision analysis failed")
+            else:
+                self._finish_job(job_id, JOB_COMPLETED, result=result)
+        except Exception as e:
+            logger.error(f"Vision job {job_id} failed: {str(e)}")
+            traceback.print_exc()
+            self._finish_job(job_id, JOB_FAILED, error=str(e))
+
+    def _append_event(self, job_id: str, event: Dict[str, Any]):
+        with self._lock:
+            seq = self._insert_event(job_id, event)
+            self._conn.commit()
+        self._publish(job_id, seq, event)
+
+    def _insert_event(self, job_id: str, event: Dict[str, Any]) -> int:
+        """Record an event under the next seq for the job (caller holds the lock and commits)"""
+        seq = self._conn.execute(
+            "SELECT COALESCE(MAX(seq), 0) + 1 FROM vision_job_events WHERE job_id = ?", (job_id,)
+        ).fetchone()[0]
+        self._conn.execute(
+            "INSERT INTO vision_job_events (job_id, seq, event, created_at) VALUES (?, ?, ?, ?)",
+            (job_id, seq, json.dumps(event), time.time())
+        )
+        return seq
+
+    def _publish(self, job_id: str, seq: int, event: Dict[str, Any]):
+        """Hand an event to every subscribed stream on its own event loop (called from worker threads)"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(job_id, []))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, (seq, event))
+            except RuntimeError:
+                # Loop already closed - the stream is gone
+                self.unsubscribe(job_id, queue)
+
+    def _update_progress(self, job_id: str, total_pages: int):
+        with self._lock:
+            self._conn.execute(
+                """
+                UPDATE vision_jobs
+                SET total_pages = ?,
+                    completed_pages = (SELECT COUNT(*) FROM vision_job_pages WHERE job_id = ?),
+                    updated_at = ?
+                WHERE job_id = ?
+                """,
+                (total_pages, job_id, time.time(), job_id)
+            )
+            self._conn.commit()
+
+    def _save_checkpoint(self, job_id: str, page_number: int, page_result: Dict[str, Any]):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO vision_job_pages (job_id, page_number, result, created_at) VALUES (?, ?, ?, ?)",
+                (job_id, page_number, json.dumps(page_result), time.time())
+            )
+            self._conn.commit()
+
+    def _finish_job(self, job_id: str, status: str, result: Dict[str, Any] = None, error: str = None):
+        now = time.time()
+        with self._lock:
+            pdf_path = self._conn.execute("SELECT pdf_path FROM vision_jobs WHERE job_id = ?", (job_id,)).fetchone()[0]
+            self._conn.execute(
+                """
+                UPDATE vision_jobs
+                SET status = ?, result = ?, error = ?, finished_at = ?, updated_at = ?,
+                    completed_pages = CASE WHEN ? = ? THEN COALESCE(total_pages, completed_pages) ELSE completed_pages END
+                WHERE job_id = ?
+                """,
+                (status, json.dumps(result) if result is not None else None, error, now, now, status, JOB_COMPLETED, job_id)
+            )
+            # Checkpoints only matter until the job has a final result
+            if status == JOB_COMPLETED:
+                self._conn.execute("DELETE FROM vision_job_pages WHERE job_id = ?", (job_id,))
+
+            # Recorded in the same transaction as the status, so a finished job always has its terminal event
+            if status == JOB_COMPLETED:
+                event = {"status": "job_completed", "job_id": job_id, "message": "Analysis finished"}
+            else:
+                event = {"status": "job_failed", "job_id": job_id, "error": error}
+            seq = self._insert_event(job_id, event)
+            self._conn.commit()
+
+        # A failed job keeps its upload (like its checkpoints) for retry() until it is purged
+        if status == JOB_COMPLETED:
+            self._remove_upload(pdf_path)
+        self._publish(job_id, seq, event)
+
+    def _purge_old_jobs(self):
+        """Drop finished jobs (and their events/checkpoints) older than the retention window"""
+        cutoff = time.time() - self.retention_seconds
+        with self._lock:
+            old_jobs = self._conn.execute(
+                "SELECT job_id, pdf_path FROM vision_jobs WHERE status IN (?, ?) AND finished_at < ?",
+                (JOB_COMPLETED, JOB_FAILED, cutoff)
+            ).fetchall()
+            for job_id, pdf_path in old_jobs:
+                self._remove_upload(pdf_path)
+                self._conn.execute("DELETE FROM vision_job_events WHERE job_id = ?", (job_id,))
+                self._conn.execute("DELETE FROM vision_job_pages WHERE job_id = ?", (job_id,))
+                self._conn.execute("DELETE FROM vision_jobs WHERE job_id = ?", (job_id,))
+            self._conn.commit()
+        if old_jobs:
+            logger.info(f"Purged {len(old_jobs)} vision jobs older than the retention window")
+
+    def _remove_upload(self, pdf_path: str):
+        """Delete a job's uploaded PDF (each job has its own copy)"""
+        try:
+            if pdf_path and os.path.exists(pdf_path):
+                os.remove(pdf_path)
+        except OSError as e:
+            logger.warning(f"Could not delete vision upload {pdf_path}: {e}")
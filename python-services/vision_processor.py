@@ -1,9 +1,16 @@
 import os
 import base64
+import copy
+import gc
+import hashlib
 import io
 import json
 import logging
-from typing import Dict, Any, Optional
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from typing import Dict, Any, Optional, Tuple
 from openai import OpenAI
 
 logger = logging.getLogger(__name__)
@@ -20,22 +27,49 @@ except ImportError:
     PIL_AVAILABLE = False
     print("Warning: PIL not available. Image processing will be limited.")
 try:
-    from pdf2image import convert_from_path
+    from pdf2image import convert_from_path, pdfinfo_from_path
     PDF2IMAGE_AVAILABLE = True
 except ImportError:
     PDF2IMAGE_AVAILABLE = False
     print("Warning: pdf2image not available. PDF processing will be limited.")
-from component_schemas import build_component_prompt_section, validate_component_parameters
+from component_schemas import (
+    build_batch_response_schema, build_component_prompt_section, build_component_response_schema,
+    drop_null_parameters, validate_component_parameters
+)
+from page_raster_cache import PageRasterCache, pixmap_to_image
+from pdf_probe import probe_pdf, resolve_page_range
+from page_analysis_cache import PageAnalysisCache
+from page_dedupe import NUMPY_AVAILABLE, page_fingerprint, find_blank_and_duplicate_pages
+from api_retry_policy import (
+    RATE_LIMIT, TIMEOUT, PAYLOAD_ERROR, VALIDATION_ERROR, RETRY_POLICIES, ResponseParseError,
+    ResponseValidationError, classify_api_error, get_rate_limit_delay, get_retry_policy
+)
+from response_repair import looks_truncated, repair_json_text, salvage_component_sequence
+from latency_tracker import LatencyTracker
+from provider_rate_limiter import IMAGE_TOKENS, estimate_text_tokens, get_rate_limiter
+from call_metrics import record_call
+from provider_replay import create_replay_client, get_replay_mode
+from page_image_encoder import PageImageEncoder
 
 
 class VisionProcessor:
     def __init__(self):
+        replay_mode = get_replay_mode()
         openai_api_key = os.getenv('OPENAI_API_KEY')
-        if not openai_api_key:
+        if not openai_api_key and replay_mode != 'replay':
             raise ValueError("OPENAI_API_KEY environment variable is required")
-        self.client = OpenAI(api_key=openai_api_key)
+        if replay_mode == 'replay':
+            # Offline stand-in answering from recorded replies (benchmarks, development without keys)
+            self.client = create_replay_client("openai")
+        else:
+            # SDK-level retries are off: _call_model_with_retry applies per-error-class policies itself
+            self.client = OpenAI(api_key=openai_api_key, max_retries=0)
+            if replay_mode == 'record':
+                self.client = create_replay_client("openai", live_client=self.client)
         self.vision_model = 'gpt-4o'
         self.max_image_size = 4000000  # 4MB default
+        # Process-wide RPM/TPM buckets shared by every job, page worker and hedge for this model
+        self.rate_limiter = get_rate_limiter("openai", self.vision_model)
 
         # PHASE 1: Enhanced Timeout Configuration
         self.base_timeout = 90  # Increased from 30 to 90 seconds base timeout
@@ -43,22 +77,93 @@ class VisionProcessor:
         self.early_pages_timeout_multiplier = 1.2  # Pages 2-5 get 108 seconds (90 * 1.2)
         self.vision_timeout = self.base_timeout  # Default timeout
 
-        # PHASE 1: Retry Configuration with Exponential Backoff
-        self.max_retry_attempts = 4  # Total of 4 attempts (1 initial + 3 retries)
-        self.retry_delays = [0, 3, 10, 30]  # Exponential backoff delays in seconds
+        # Adaptive timeouts: p99 of recent latencies for the same model and payload size, times a
+        # safety factor. The page-number timeouts above stay as the fallback until a bucket has data
+        self.latency_tracker = LatencyTracker(
+            min_samples=int(os.getenv('VISION_LATENCY_MIN_SAMPLES', '20')),
+            safety_factor=float(os.getenv('VISION_TIMEOUT_SAFETY_FACTOR', '1.5'))
+        )
+
+        # Request hedging: a call still running at the bucket's p95 gets a duplicate, first reply wins.
+        # At most hedge_max_ratio of all calls are hedged; needs a warm latency bucket
+        self.hedging_enabled = os.getenv('VISION_HEDGE_REQUESTS', 'false').lower() == 'true'
+        self.hedge_max_ratio = float(os.getenv('VISION_HEDGE_MAX_PERCENT', '5')) / 100
+        self._hedge_executor = None
+        self._hedge_stats = {"requests": 0, "hedged": 0, "hedge_wins": 0}
+        self._hedge_lock = threading.Lock()
+
+        # Multi-page requests: up to this many adjacent image pages share one completion (and one copy
+        # of the system prompt). 1 = one page per request; batch failures fall back to single pages
+        self.pages_per_request = min(4, max(1, int(os.getenv('VISION_PAGES_PER_REQUEST', '1'))))
+        self._usage_local = threading.local()  # Usage trackers (page, call) open on this thread
+        self._call_context = threading.local()  # job_id/node_id/session_id tags for call metrics on this thread
+
+        # PHASE 1: Retry Configuration - per-error-class limits live in api_retry_policy.RETRY_POLICIES
+        # Hard cap on attempts per page across all failure classes: one more than the largest
+        # per-class budget (rate limits' 5 retries), so mixed failures can't chain the class
+        # budgets into a dozen calls for one page
+        self.max_retry_attempts = 1 + max(policy["max_retries"] for policy in RETRY_POLICIES.values())
+        self.retry_delays = [0, 3, 10, 30]  # Backoff delays in seconds for timeouts/server errors
+
+        # Output shaping: 'json_schema' = strict structured output built from COMPONENT_SCHEMAS,
+        # 'json_object' = JSON mode (always parseable, no schema), 'off' = plain text replies
+        self.structured_output_mode = os.getenv('VISION_STRUCTURED_OUTPUT', 'json_object').lower()
+        self.max_tokens = 2000
+        self.max_continuations = 2  # Follow-up calls for replies cut off at max_tokens
 
         # PHASE 2: Progressive Image Quality Degradation
         self.quality_levels = [75, 65, 50, 40]  # Quality decreases with each retry
         self.resolution_matrices = [2.0, 1.5, 1.2, 1.0]  # Resolution scales down with retries
         self.max_dimension = 2000  # Cap image dimensions to 2000px max width/height
 
+        # Budget-driven page encoding: crop margins, grayscale for monochrome pages, downscale while body
+        # text stays legible, then the highest JPEG quality that fits the byte budget. The ladders above
+        # become upper bounds per retry step; 'fixed' keeps the plain ladder encode
+        self.adaptive_encoding = os.getenv('VISION_IMAGE_ENCODER', 'adaptive').lower() == 'adaptive'
+        self.image_encoder = PageImageEncoder(
+            byte_budget=int(os.getenv('VISION_IMAGE_BYTE_BUDGET', '400000')),
+            pixel_budget=int(os.getenv('VISION_IMAGE_PIXEL_BUDGET', '1200000')),
+            min_text_px=float(os.getenv('VISION_IMAGE_MIN_TEXT_PX', '18')),
+            max_dimension=self.max_dimension
+        )
+
         # Batch processing settings for large PDFs
-        self.max_pages_per_batch = 5  # Process 5 pages at a time max
-        self.max_total_pages = 50     # Limit total pages to prevent memory issues
-        self.batch_delay = 0.5        # Delay between batches to prevent API rate limits
+        self.max_pages_per_batch = 5  # Memory report (and gc) every 5 completed pages
+
+        # Concurrent page analysis (1 = sequential). Default of 4 keeps well under typical gpt-4o RPM limits
+        self.max_concurrent_pages = max(1, int(os.getenv('VISION_MAX_CONCURRENT_PAGES', '4')))
+
+        # Streaming page window: at most this many pages are rasterized or in flight at once, and each
+        # raster is dropped as soon as it is encoded, so memory stays flat for any page count
+        self.page_window = max(self.max_concurrent_pages * self.pages_per_request,
+                               int(os.getenv('VISION_PAGE_WINDOW', '8')))
 
         # Build static system prompt with component schemas (done once for efficiency)
         self.component_system_prompt = self._build_enhanced_system_prompt()
+        self.component_response_schema = build_component_response_schema()
+
+        # Persistent per-page result cache keyed on page content + prompt version + model + context
+        self.system_prompt_version = hashlib.sha256(self.component_system_prompt.encode('utf-8')).hexdigest()[:16]
+        self.page_cache = None
+        if os.getenv('VISION_CACHE_ENABLED', 'true').lower() == 'true':
+            try:
+                self.page_cache = PageAnalysisCache()
+            except Exception as e:
+                logger.warning(f"Page analysis cache disabled: {e}")
+        self._job_stats_lock = threading.Lock()
+
+        # Text-layer fast path for text-dominant pages:
+        # 'text_prompt' sends the extracted text without an image, 'local' builds components
+        # from the text layer with no model call, 'off' sends every page through the image path
+        self.text_page_mode = os.getenv('VISION_TEXT_PAGE_MODE', 'text_prompt').lower()
+        self.text_page_min_chars = 200      # Enough running text to stand without the image
+        self.text_page_max_drawings = 10    # Rules/underlines are fine, diagrams are not
+
+        # Blank/duplicate page pre-pass (requires NumPy)
+        self.page_dedupe_enabled = os.getenv('VISION_PAGE_DEDUPE', 'true').lower() == 'true'
+        self.blank_page_ink_ratio = 0.003       # Under 0.3% ink = blank separator page
+        self.duplicate_max_hash_distance = 10   # Out of 256 dHash bits
+        self.duplicate_max_changed_ratio = 0.0002  # Share of thumbnail pixels allowed to differ
 
     def _build_enhanced_system_prompt(self) -> str:
         """Build comprehensive system prompt with detailed component schemas"""
@@ -594,7 +699,7 @@ Make math engaging for students!
         return system_prompt
 
     def _get_page_timeout(self, page_number: int) -> int:
-        """Calculate timeout for specific page number (Phase 1)"""
+        """Static timeout for a page number - used until the latency tracker has data for a request's bucket"""
         if page_number == 1:
             # First page gets longest timeout (title pages are complex)
             return int(self.base_timeout * self.first_page_timeout_multiplier)
@@ -605,87 +710,632 @@ Make math engaging for students!
             # Later pages use base timeout
             return self.base_timeout
 
-    def _call_vision_api_with_retry(self, pdf_path: str, page_number: int, system_prompt: str, user_prompt: str) -> Dict[str, Any]:
+    def _call_vision_api_with_retry(self, pdf_path: str, page_number: int, system_prompt: str, user_prompt: str,
+                                    raster_cache: Optional[PageRasterCache] = None) -> Dict[str, Any]:
         """
-        Call vision API with retry logic and progressive quality degradation (Phase 1 & 2)
+        Call vision API with error-class-aware retries (Phase 1 & 2)
 
         Implements:
-        - Exponential backoff retries
-        - Progressive image quality reduction
-        - Progressive resolution reduction
-        - Detailed logging for debugging
+        - Rate limits wait for the server's Retry-After without touching the image
+        - Timeouts and payload errors step down the quality/resolution ladder
+        - Server errors retry at the same quality with backoff
+        - Parse/validation errors are repaired locally or re-asked as text, without re-uploading the image
+        - Client errors (auth, bad request, quota) fail immediately
         """
-        import time
+        def build_image_content(ladder_step: int) -> Dict[str, Any]:
+            return self._build_page_image_content(pdf_path, page_number, ladder_step, raster_cache)
 
-        last_error = None
-        page_timeout = self._get_page_timeout(page_number)
+        return self._call_model_with_retry(page_number, system_prompt, user_prompt, build_image_content, "Vision")
 
-        for attempt in range(self.max_retry_attempts):
-            try:
-                # PHASE 2: Get quality and resolution for this attempt
-                quality = self.quality_levels[attempt]
-                resolution_matrix = self.resolution_matrices[attempt]
-
-                logger.info(f"Vision API attempt {attempt + 1}/{self.max_retry_attempts} for page {page_number}")
-                logger.info(f"Using quality={quality}, resolution={resolution_matrix}, timeout={page_timeout}s")
-
-                # Convert PDF page to image with progressive quality/resolution
-                image, _ = self.convert_pdf_page_to_image(
-                    pdf_path,
-                    page_number,
-                    resolution_matrix=resolution_matrix,
-                    quality=quality
-                )
+    def _build_page_image_content(self, pdf_path: str, page_number: int, ladder_step: int,
+                                  raster_cache: Optional[PageRasterCache] = None) -> Dict[str, Any]:
+        """image_url message part for a page at one step of the quality/resolution ladder"""
+        quality = self.quality_levels[ladder_step]
+        resolution_matrix = self.resolution_matrices[ladder_step]
+        logger.info(f"Using quality={quality}, resolution={resolution_matrix} for page {page_number}")
+
+        if self.adaptive_encoding:
+            return self._encode_page_within_budget(pdf_path, page_number, ladder_step, raster_cache)
+
+        # Convert PDF page to image at this ladder step's quality/resolution
+        if raster_cache:
+            image = self._optimize_image_size(raster_cache.get_page_image(page_number, resolution_matrix))
+        else:
+            image, _ = self.convert_pdf_page_to_image(
+                pdf_path,
+                page_number,
+                resolution_matrix=resolution_matrix,
+                quality=quality
+            )
+
+        # Encode to base64 with quality setting (single encode within the byte budget)
+        base64_image = self._encode_image_to_base64(image, quality=quality)
+        return {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}}
 
-                # Encode to base64 with quality setting
-                base64_image = self._encode_image_to_base64(image, quality=quality)
+    def _encode_page_within_budget(self, pdf_path: str, page_number: int, ladder_step: int,
+                                   raster_cache: Optional[PageRasterCache] = None) -> Dict[str, Any]:
+        """
+        image_url part from the budget-driven encoder
 
-                # Make vision API call with timeout
-                response = self.client.chat.completions.create(
-                    model=self.vision_model,
-                    messages=[
+        The ladder step's quality is the upper bound of the quality search and its
+        resolution the raster resolution; both budgets shrink with the step's pixel count.
+        """
+        quality = self.quality_levels[ladder_step]
+        resolution_matrix = self.resolution_matrices[ladder_step]
+        budget_factor = (resolution_matrix / self.resolution_matrices[0]) ** 2
+
+        # Body text size in raster pixels from the text layer; scanned pages are measured on the raster
+        text_px = None
+        if raster_cache:
+            image = raster_cache.get_page_image(page_number, resolution_matrix)
+            layout = raster_cache.get_page_layout(page_number)
+            body_size = self._body_font_size(layout["blocks"]) if layout else 0
+            if body_size:
+                text_px = body_size * resolution_matrix
+        else:
+            image, _ = self.convert_pdf_page_to_image(pdf_path, page_number, resolution_matrix=resolution_matrix)
+
+        data, info = self.image_encoder.encode(image, max_quality=quality, text_px=text_px,
+                                               budget_factor=budget_factor)
+        del image
+        logger.info(
+            f"Page {page_number} image: {info['original_size']} -> {info['size']}, quality={info['quality']}, "
+            f"{info['bytes'] / 1024:.0f}KB (cropped={info['cropped']}, grayscale={info['grayscale']}, "
+            f"text={info['text_px']}px, step={ladder_step}, {info['encode_ms']}ms)"
+        )
+        base64_image = base64.b64encode(data).decode('ascii')
+        return {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}}
+
+    def _call_text_api_with_retry(self, page_number: int, system_prompt: str, user_prompt: str) -> Dict[str, Any]:
+        """Text-only counterpart of _call_vision_api_with_retry for pages routed to the text-layer path"""
+        return self._call_model_with_retry(page_number, system_prompt, user_prompt, None, "Text-layer")
+
+    def _call_model_with_retry(self, page_number: int, system_prompt: str, user_prompt: str,
+                               build_image_content: Optional[callable], label: str) -> Dict[str, Any]:
+        """Run the retry loop for one page and record the call's tokens, payload, attempts and wall time"""
+        usage = self._begin_usage_tracking()
+        call_state = {"attempts": 0}
+        start_time = time.time()
+        status, error_class = "success", None
+        try:
+            return self._run_retry_loop(page_number, system_prompt, user_prompt, build_image_content, label, call_state)
+        except Exception as e:
+            status, error_class = "error", classify_api_error(e)
+            raise
+        finally:
+            self._end_usage_tracking(usage)
+            self._record_call_metrics(
+                "vision_page" if build_image_content else "text_page", [page_number], usage,
+                time.time() - start_time, call_state["attempts"], status, error_class
+            )
+
+    def _record_call_metrics(self, operation: str, pages: list, usage: Dict[str, Any], wall_time: float,
+                             attempts: int, status: str, error_class: Optional[str]):
+        tags = dict(getattr(self._call_context, "tags", None) or {})
+        tags["pages"] = pages
+        record_call(
+            "openai", self.vision_model, operation, wall_time,
+            status=status,
+            error_class=error_class,
+            prompt_tokens=usage["prompt_tokens"],
+            completion_tokens=usage["completion_tokens"],
+            total_tokens=usage["total_tokens"],
+            payload_bytes=usage["payload_bytes"],
+            attempts=attempts,
+            tags=tags
+        )
+
+    def _run_retry_loop(self, page_number: int, system_prompt: str, user_prompt: str,
+                        build_image_content: Optional[callable], label: str,
+                        call_state: Dict[str, int]) -> Dict[str, Any]:
+        """Shared retry loop: classify each failure and apply that class's policy from api_retry_policy"""
+        page_timeout = self._get_page_timeout(page_number)
+        ladder_step = 0          # Only advanced by timeouts and payload errors
+        retries_by_class = {}
+        reask = None             # (previous reply, problem) when the reply needs fixing rather than a new image
+        attempt = 0
+
+        while True:
+            attempt += 1
+            call_state["attempts"] = attempt
+            try:
+                if reask:
+                    logger.info(f"{label} attempt {attempt} for page {page_number}: re-asking for valid JSON (no image)")
+                    messages = self._build_reask_messages(system_prompt, user_prompt, *reask)
+                elif build_image_content:
+                    logger.info(f"{label} attempt {attempt} for page {page_number}")
+                    messages = [
                         {"role": "system", "content": system_prompt},
                         {
                             "role": "user",
                             "content": [
                                 {"type": "text", "text": user_prompt},
-                                {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}}
+                                build_image_content(ladder_step)
                             ]
                         }
-                    ],
-                    max_tokens=2000,
-                    timeout=page_timeout
-                )
-
-                # Success! Parse and return response
-                logger.info(f"Vision API call successful on attempt {attempt + 1}")
-                result_text = response.choices[0].message.content.strip()
+                    ]
+                else:
+                    logger.info(f"{label} attempt {attempt} for page {page_number}")
+                    messages = [
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": user_prompt}
+                    ]
 
-                # Remove markdown code blocks if present
-                if result_text.startswith('```json'):
-                    result_text = result_text[7:]
-                if result_text.endswith('```'):
-                    result_text = result_text[:-3]
-                result_text = result_text.strip()
+                response = self._create_completion(messages, page_timeout)
+                raw_text = response.choices[0].message.content or ""
 
-                return json.loads(result_text)
+                if self._is_truncated(response, raw_text):
+                    # Keep what was produced and ask for the rest instead of restarting the page
+                    result = self._continue_truncated_response(messages, raw_text, page_number, page_timeout)
+                else:
+                    result = self._parse_and_check_response(raw_text)
+                logger.info(f"{label} API call successful on attempt {attempt}")
+                return result
 
             except Exception as e:
-                last_error = e
-                error_type = type(e).__name__
-                logger.warning(f"Attempt {attempt + 1} failed with {error_type}: {str(e)}")
-
-                # If this wasn't the last attempt, wait before retrying
-                if attempt < self.max_retry_attempts - 1:
-                    delay = self.retry_delays[attempt + 1]
-                    logger.info(f"Waiting {delay}s before retry (will use lower quality/resolution)...")
-                    time.sleep(delay)
+                error_class = classify_api_error(e)
+                if self.structured_output_mode != 'off' and "response_format" in str(e):
+                    # Model/provider doesn't support this output mode - fall back to plain replies for good
+                    logger.warning(f"Structured output '{self.structured_output_mode}' rejected, disabling it: {e}")
+                    self.structured_output_mode = 'off'
+                    continue
+                retries_by_class[error_class] = retries_by_class.get(error_class, 0) + 1
+                policy = get_retry_policy(error_class)
+                logger.warning(f"{label} attempt {attempt} for page {page_number} failed ({error_class}) "
+                               f"with {type(e).__name__}: {str(e)[:200]}")
+
+                if retries_by_class[error_class] > policy["max_retries"] or attempt >= self.max_retry_attempts:
+                    if error_class == VALIDATION_ERROR and isinstance(getattr(e, "parsed", None), dict):
+                        # Structure is still off after re-asking - let the page-level defaults fill the gaps
+                        logger.warning(f"Using partially valid response for page {page_number}: {e}")
+                        return e.parsed
+                    logger.error(f"Giving up on page {page_number} after {attempt} attempts "
+                                 f"({error_class} retries exhausted: {retries_by_class})")
+                    raise
+
+                if policy["reask"]:
+                    reask = (e.raw_text, str(e))
+                    delay = 0
+                elif error_class == RATE_LIMIT:
+                    # Pause the shared limiter so every worker backs off, not just this page;
+                    # the retry then waits for its slot in _timed_completion
+                    self.rate_limiter.pause(get_rate_limit_delay(e, retries_by_class[error_class]))
+                    delay = 0
+                elif policy["degrade"]:
+                    if ladder_step < len(self.quality_levels) - 1:
+                        ladder_step += 1
+                    # An oversized payload is rejected immediately - the smaller image can go out right away
+                    delay = 0 if error_class == PAYLOAD_ERROR else self.retry_delays[min(ladder_step, len(self.retry_delays) - 1)]
                 else:
-                    # Last attempt failed
-                    logger.error(f"All {self.max_retry_attempts} attempts failed for page {page_number}")
+                    delay = self.retry_delays[min(retries_by_class[error_class], len(self.retry_delays) - 1)]
+
+                if delay:
+                    logger.info(f"Waiting {delay:.1f}s before retrying page {page_number} ({error_class})")
+                    time.sleep(delay)
+
+    def _create_completion(self, messages: list, page_timeout: int, max_tokens: Optional[int] = None,
+                           response_schema: Optional[Dict[str, Any]] = None):
+        """
+        Single chat completion call with the configured output mode
+
+        page_timeout is the static fallback; once the latency tracker has enough
+        samples for this model and payload size the timeout comes from there,
+        and every call's latency is recorded back into it.
+        """
+        payload_bytes = self._request_payload_size(messages)
+        timeout = self.latency_tracker.get_timeout(self.vision_model, payload_bytes, page_timeout)
+        if timeout != page_timeout:
+            logger.info(f"Adaptive timeout {timeout}s (static {page_timeout}s) for {payload_bytes // 1024}KB request")
+
+        request = {
+            "model": self.vision_model,
+            "messages": messages,
+            "max_tokens": max_tokens or self.max_tokens,
+            "timeout": timeout
+        }
+        if self.structured_output_mode == 'json_schema':
+            request["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {
+                    "name": "page_batch" if response_schema else "page_components",
+                    "strict": True,
+                    "schema": response_schema or self.component_response_schema
+                }
+            }
+        elif self.structured_output_mode == 'json_object':
+            request["response_format"] = {"type": "json_object"}
 
-        # All retries exhausted, raise the last error
-        raise last_error
+        # Failed attempts still count as a call with their payload (response stays None)
+        response = None
+        try:
+            if self.hedging_enabled:
+                percentiles = self.latency_tracker.get_percentiles(self.vision_model, payload_bytes)
+                with self._hedge_lock:
+                    self._hedge_stats["requests"] += 1
+                if percentiles:
+                    response = self._hedged_completion(request, payload_bytes, percentiles["p95"])
+                    return response
+            response = self._timed_completion(request, payload_bytes)
+            return response
+        finally:
+            self._add_call_usage(response, payload_bytes)
+
+    def _begin_usage_tracking(self, initial: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Start summing usage of every completion this thread makes (retries and continuations included)
+
+        Trackers nest: a page's tracker and the call-metrics tracker inside it both see each completion.
+        """
+        usage = self._empty_token_usage()
+        if initial:
+            for key in usage:
+                usage[key] += initial.get(key, 0)
+        if not hasattr(self._usage_local, "trackers"):
+            self._usage_local.trackers = []
+        self._usage_local.trackers.append(usage)
+        return usage
+
+    def _end_usage_tracking(self, usage: Dict[str, Any]):
+        trackers = getattr(self._usage_local, "trackers", [])
+        if any(tracker is usage for tracker in trackers):
+            trackers.remove(usage)
+
+    def _add_call_usage(self, response, payload_bytes: int = 0):
+        response_usage = getattr(response, "usage", None)
+        for usage in getattr(self._usage_local, "trackers", []):
+            usage["calls"] += 1
+            usage["payload_bytes"] += payload_bytes
+            for key in ("prompt_tokens", "completion_tokens", "total_tokens"):
+                usage[key] += getattr(response_usage, key, 0) or 0
+
+    def _empty_token_usage(self, source: Optional[str] = None) -> Dict[str, Any]:
+        usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "calls": 0, "payload_bytes": 0}
+        if source:
+            usage["source"] = source
+        return usage
+
+    def _timed_completion(self, request: Dict[str, Any], payload_bytes: int):
+        """Run one completion request once the rate limiter has room for it, and record its latency"""
+        estimated_tokens = self._estimate_request_tokens(request)
+        waited = self.rate_limiter.acquire(estimated_tokens)
+        if waited:
+            logger.info(f"Waited {waited:.1f}s for a {self.rate_limiter.name} rate limit slot")
+
+        start_time = time.time()
+        try:
+            response = self.client.chat.completions.create(**request)
+        except Exception as e:
+            if classify_api_error(e) == TIMEOUT:
+                # Censored sample: the real latency was at least the timeout
+                self.latency_tracker.record(self.vision_model, payload_bytes,
+                                            max(request["timeout"], time.time() - start_time), timed_out=True)
+            raise
+        self.latency_tracker.record(self.vision_model, payload_bytes, time.time() - start_time)
+        usage = getattr(response, "usage", None)
+        self.rate_limiter.settle(estimated_tokens, getattr(usage, "total_tokens", None))
+        return response
+
+    def _estimate_request_tokens(self, request: Dict[str, Any]) -> int:
+        """Prompt tokens (text + images) plus max_tokens, as providers count a request against TPM"""
+        tokens = request.get("max_tokens", 0)
+        for message in request["messages"]:
+            content = message.get("content")
+            if isinstance(content, str):
+                tokens += estimate_text_tokens(content)
+                continue
+            for part in content or []:
+                if part.get("type") == "text":
+                    tokens += estimate_text_tokens(part.get("text", ""))
+                elif part.get("type") == "image_url":
+                    tokens += IMAGE_TOKENS
+        return tokens
+
+    def _hedged_completion(self, request: Dict[str, Any], payload_bytes: int, hedge_delay: float):
+        """
+        Send the request; if it hasn't returned after hedge_delay (the bucket's p95), send a
+        duplicate and return whichever succeeds first
+
+        The synchronous client can't abort a request in flight, so the loser is
+        cancelled only if it hasn't started yet; otherwise its reply is dropped.
+        Both attempts still record their latency.
+        """
+        if self._hedge_executor is None:
+            with self._hedge_lock:
+                if self._hedge_executor is None:
+                    self._hedge_executor = ThreadPoolExecutor(
+                        max_workers=self.max_concurrent_pages * 2, thread_name_prefix="vision-hedge"
+                    )
+
+        primary = self._hedge_executor.submit(self._timed_completion, request, payload_bytes)
+        done, _ = wait([primary], timeout=hedge_delay)
+        if done or not self._reserve_hedge():
+            return primary.result()
+
+        hedge = self._hedge_executor.submit(self._timed_completion, request, payload_bytes)
+        logger.info(f"Hedging request still running after p95 ({hedge_delay:.1f}s)")
+
+        pending = {primary, hedge}
+        first_error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    first_error = first_error or future.exception()
+                    continue
+                for other in pending:
+                    other.cancel()
+                self._record_hedge_outcome(hedge_won=future is hedge)
+                return future.result()
+
+        self._record_hedge_outcome(hedge_won=False)
+        raise first_error
+
+    def _reserve_hedge(self) -> bool:
+        """Claim a hedge if that keeps hedged calls within hedge_max_ratio of all calls"""
+        with self._hedge_lock:
+            stats = self._hedge_stats
+            if stats["hedged"] + 1 > stats["requests"] * self.hedge_max_ratio:
+                return False
+            stats["hedged"] += 1
+            return True
+
+    def _record_hedge_outcome(self, hedge_won: bool):
+        with self._hedge_lock:
+            if hedge_won:
+                self._hedge_stats["hedge_wins"] += 1
+            stats = self._hedge_stats_snapshot()
+        logger.info(f"Hedge {'won' if hedge_won else 'lost'} - hedge rate {stats['hedge_rate']:.1%}, "
+                    f"win rate {stats['win_rate']:.1%} ({stats['hedged']}/{stats['requests']} requests hedged)")
+
+    def get_hedge_stats(self) -> Dict[str, Any]:
+        """Counts and rates for tuning VISION_HEDGE_MAX_PERCENT"""
+        with self._hedge_lock:
+            return self._hedge_stats_snapshot()
+
+    def _hedge_stats_snapshot(self) -> Dict[str, Any]:
+        stats = dict(self._hedge_stats)
+        stats["enabled"] = self.hedging_enabled
+        stats["max_ratio"] = self.hedge_max_ratio
+        stats["hedge_rate"] = stats["hedged"] / stats["requests"] if stats["requests"] else 0.0
+        stats["win_rate"] = stats["hedge_wins"] / stats["hedged"] if stats["hedged"] else 0.0
+        return stats
+
+    def _request_payload_size(self, messages: list) -> int:
+        """Approximate request size in bytes (text plus base64 image data)"""
+        size = 0
+        for message in messages:
+            content = message.get("content")
+            if isinstance(content, str):
+                size += len(content)
+                continue
+            for part in content or []:
+                if part.get("type") == "text":
+                    size += len(part.get("text", ""))
+                elif part.get("type") == "image_url":
+                    size += len(part["image_url"]["url"])
+        return size
+
+    def _is_truncated(self, response, raw_text: str) -> bool:
+        """Reply hit max_tokens (finish_reason) or visibly stops mid-JSON"""
+        finish_reason = getattr(response.choices[0], "finish_reason", None)
+        return finish_reason == "length" or looks_truncated(raw_text)
+
+    def _continue_truncated_response(self, messages: list, raw_text: str, page_number: int,
+                                     page_timeout: int) -> Dict[str, Any]:
+        """
+        Recover a reply cut off at max_tokens
+
+        Complete components are salvaged from the partial reply and the model is
+        asked only for the remaining ones, continuing the same conversation (the
+        already-encoded image is reused, nothing is re-rendered or degraded).
+        """
+        components = salvage_component_sequence(raw_text)
+        conversation = list(messages)
+        partial_text = raw_text
+        logger.warning(f"Page {page_number} reply truncated - salvaged {len(components)} complete components")
+
+        for continuation in range(1, self.max_continuations + 1):
+            last = components[-1] if components else None
+            resume_point = (
+                f"after component order {last.get('order', len(components))} ({last.get('type')})"
+                if last else "before the first component"
+            )
+            conversation += [
+                {"role": "assistant", "content": partial_text},
+                {
+                    "role": "user",
+                    "content": (
+                        f"Your reply was cut off {resume_point}. Do not repeat earlier components. "
+                        "Return a complete JSON object with the same fields, where component_sequence holds only "
+                        "the remaining components. Keep text concise so the reply fits."
+                    )
+                }
+            ]
+            response = self._create_completion(conversation, page_timeout)
+            partial_text = response.choices[0].message.content or ""
+
+            if self._is_truncated(response, partial_text):
+                new_components = salvage_component_sequence(partial_text)
+                components.extend(new_components)
+                logger.warning(f"Page {page_number} continuation {continuation} also truncated "
+                               f"(+{len(new_components)} components)")
+                continue
+
+            result = self._parse_and_check_response(partial_text)
+            result["component_sequence"] = components + result["component_sequence"]
+            logger.info(f"Page {page_number} completed with {continuation} continuation call(s)")
+            break
+        else:
+            if not components:
+                raise ResponseParseError("reply truncated and no complete components could be recovered", raw_text)
+            result = {
+                "component_sequence": components,
+                "processing_notes": f"Reply truncated; kept {len(components)} complete components"
+            }
+
+        for order, component in enumerate(result["component_sequence"], 1):
+            component["order"] = order
+            drop_null_parameters(component)
+        return result
+
+    def _build_reask_messages(self, system_prompt: str, user_prompt: str, previous_reply: str, problem: str) -> list:
+        """Text-only follow-up asking the model to fix its own reply - the image is not re-sent"""
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+            {"role": "assistant", "content": previous_reply},
+            {
+                "role": "user",
+                "content": (
+                    f"Your previous reply could not be used: {problem}. "
+                    "Return the same analysis as a single valid JSON object with a component_sequence array, "
+                    "and nothing else."
+                )
+            }
+        ]
+
+    def _parse_and_check_response(self, raw_text: str) -> Dict[str, Any]:
+        """Parse (with local repair) and structurally check a reply, raising a classified error on failure"""
+        try:
+            result = self._parse_json_response(raw_text)
+        except json.JSONDecodeError as e:
+            raise ResponseParseError(f"invalid JSON ({e})", raw_text)
+
+        return self._check_page_result(result, raw_text)
+
+    def _check_page_result(self, result: Any, raw_text: str) -> Dict[str, Any]:
+        """Structural check of one page's analysis object"""
+        if not isinstance(result, dict):
+            raise ResponseValidationError("page result is not a JSON object", raw_text)
+        components = result.get("component_sequence")
+        if not isinstance(components, list):
+            raise ResponseValidationError("component_sequence is missing or not an array", raw_text, result)
+        if any(not isinstance(component, dict) or not component.get("type") for component in components):
+            raise ResponseValidationError("every component needs an object with a type", raw_text, result)
+        for component in components:
+            drop_null_parameters(component)
+        return result
+
+    def _parse_json_response(self, result_text: str) -> Dict[str, Any]:
+        """Strip markdown code fences from a model response and parse the JSON body"""
+        result_text = result_text.strip()
+
+        # Remove markdown code blocks if present
+        if result_text.startswith('```json'):
+            result_text = result_text[7:]
+        if result_text.endswith('```'):
+            result_text = result_text[:-3]
+        result_text = result_text.strip()
+
+        try:
+            return json.loads(result_text)
+        except json.JSONDecodeError:
+            repaired = repair_json_text(result_text)
+            if repaired == result_text:
+                raise
+            logger.info("Parsed model response after local JSON repair")
+            return json.loads(repaired)
+
+    def _classify_page(self, layout: Optional[Dict[str, Any]]) -> Tuple[str, str]:
+        """Route a page to the 'text' or 'vision' path from its PDF structure"""
+        if self.text_page_mode not in ("text_prompt", "local"):
+            return "vision", "text-layer routing disabled"
+        if layout is None:
+            return "vision", "no structural page data"
+
+        text_chars = layout["text_chars"]
+        image_count = layout["image_count"]
+        drawing_count = layout["drawing_count"]
+
+        if image_count > 0:
+            return "vision", f"{image_count} image(s)"
+        if drawing_count > self.text_page_max_drawings:
+            return "vision", f"{drawing_count} vector drawings"
+        if text_chars < self.text_page_min_chars:
+            return "vision", f"sparse text ({text_chars} chars)"
+
+        return "text", f"{text_chars} chars, {layout['text_area_ratio']:.0%} text coverage, {drawing_count} drawings"
+
+    def _record_page_route(self, job_stats: Optional[Dict[str, Any]], page_number: int, route: str):
+        """Remember which path a page took so the merged result can report it"""
+        if job_stats is None:
+            return
+        with self._job_stats_lock:
+            job_stats.setdefault("page_routes", {})[page_number] = route
+
+    def _body_font_size(self, blocks: list) -> float:
+        """Most common font size weighted by characters - the running-text size"""
+        size_chars = {}
+        for block in blocks:
+            size = round(block["font_size"])
+            size_chars[size] = size_chars.get(size, 0) + block["chars"]
+        return max(size_chars, key=size_chars.get) if size_chars else 0
+
+    def _is_heading_block(self, block: Dict[str, Any], body_size: float) -> bool:
+        if len(block["text"]) > 100 or block["text"].endswith("."):
+            return False
+        return block["font_size"] >= body_size * 1.2 or (block["bold"] and len(block["lines"]) == 1)
+
+    def _format_text_layout(self, layout: Dict[str, Any]) -> str:
+        """Render the text layer as lightweight markdown (headings marked) for a text-only prompt"""
+        body_size = self._body_font_size(layout["blocks"])
+        parts = []
+        for block in layout["blocks"]:
+            if self._is_heading_block(block, body_size):
+                parts.append(f"## {block['text']}")
+            else:
+                parts.append("\n".join(block["lines"]))
+        return "\n\n".join(parts)
+
+    CALLOUT_PATTERN = re.compile(r'^(Tip|Warning|Important|Remember|Note|Common Mistake|Be Careful)\s*:\s*(.+)$', re.IGNORECASE | re.DOTALL)
+    CALLOUT_STYLES = {"tip": "tip", "warning": "warning", "common mistake": "warning", "be careful": "warning",
+                      "important": "important", "remember": "important", "note": "info"}
+    # Only an explicit "Definition: term: ..." label or the "term is defined as ..." form counts;
+    # a bare early colon is just as often "For example:", "Step 1:" or "Solution:"
+    DEFINITION_PATTERN = re.compile(
+        r'^(?:Definition\s*:\s*([A-Za-z][\w \-\']{0,40}?)\s*(?::|\u2014| is defined as )'
+        r'|([A-Za-z][\w \-\']{0,40}?) is defined as )\s*(.{10,})$',
+        re.DOTALL
+    )
+
+    def _build_components_from_text_layout(self, layout: Dict[str, Any], page_number: int) -> Dict[str, Any]:
+        """Build heading/paragraph/definition/callout components straight from the text layer (no model call)"""
+        body_size = self._body_font_size(layout["blocks"])
+        components = []
+
+        for block in layout["blocks"]:
+            text = block["text"].strip()
+            if not text:
+                continue
+
+            callout_match = self.CALLOUT_PATTERN.match(text)
+            definition_match = self.DEFINITION_PATTERN.match(text)
+            if self._is_heading_block(block, body_size):
+                components.append({"type": "heading", "parameters": {"text": text}, "confidence": 0.7})
+            elif callout_match:
+                style = self.CALLOUT_STYLES.get(callout_match.group(1).lower(), "info")
+                components.append({"type": "callout-box", "parameters": {"text": text, "style": style}, "confidence": 0.65})
+            elif definition_match:
+                components.append({
+                    "type": "definition",
+                    "parameters": {
+                        "term": (definition_match.group(1) or definition_match.group(2)).strip(),
+                        "definition": definition_match.group(3).strip()
+                    },
+                    "confidence": 0.6
+                })
+            else:
+                components.append({"type": "paragraph", "parameters": {"text": text}, "confidence": 0.6})
+
+        for order, component in enumerate(components, 1):
+            component["order"] = order
+
+        return {
+            "component_sequence": components,
+            "suggested_template": "text-heavy",
+            "overall_confidence": 0.6,
+            "processing_notes": f"Built {len(components)} components for page {page_number} from the PDF text layer (no model call)"
+        }
 
     def _merge_page_responses(self, page_responses: list) -> Dict[str, Any]:
         """Merge multiple page analysis responses into single unified response"""
@@ -734,23 +1384,38 @@ Make math engaging for students!
         }
 
     def _encode_image_to_base64(self, image, quality: int = 75) -> str:
-        """Convert PIL Image to base64 string for API (Phase 2: quality parameter added)"""
+        """Convert PIL Image to base64 string for API (Phase 2: quality parameter added)
+
+        Encodes once; only re-encodes (after a budget-derived downscale) in the rare
+        case the JPEG exceeds max_image_size. Base64 is taken straight from the buffer.
+        """
+        start_time = time.perf_counter()
         buffer = io.BytesIO()
         image.save(buffer, format="JPEG", quality=quality)
-        image_bytes = buffer.getvalue()
+
+        if buffer.tell() > self.max_image_size:
+            # JPEG size scales roughly with pixel count - shrink just enough to fit
+            scale = min(0.9, (self.max_image_size / buffer.tell()) ** 0.5 * 0.95)
+            width, height = image.size
+            new_size = (max(1, int(width * scale)), max(1, int(height * scale)))
+            logger.info(f"Image over {self.max_image_size} byte budget, reducing to: {new_size}")
+            image = image.resize(new_size, Image.Resampling.LANCZOS)
+            buffer = io.BytesIO()
+            image.save(buffer, format="JPEG", quality=quality)
 
         # PHASE 2: Log payload size for monitoring
-        size_kb = len(image_bytes) / 1024
+        size_kb = buffer.tell() / 1024
         size_mb = size_kb / 1024
-        logger.info(f"Image payload size: {size_mb:.2f}MB (quality={quality})")
+        encode_ms = (time.perf_counter() - start_time) * 1000
+        logger.info(f"Image payload size: {size_mb:.2f}MB (quality={quality}, encoded in {encode_ms:.0f}ms)")
 
         if size_mb > 15:  # Warning threshold
             logger.warning(f"Large image payload detected: {size_mb:.2f}MB - this may cause timeout")
 
-        return base64.b64encode(image_bytes).decode('utf-8')
+        return base64.b64encode(buffer.getbuffer()).decode('ascii')
 
-    def _optimize_image_size(self, image, quality: int = 75, max_dimension: int = None):
-        """Resize image if too large for API limits (Phase 2: enhanced compression)"""
+    def _optimize_image_size(self, image, max_dimension: int = None):
+        """Cap image dimensions for API limits (byte budget is enforced by the final encode)"""
         if max_dimension is None:
             max_dimension = self.max_dimension
 
@@ -766,17 +1431,6 @@ Make math engaging for students!
             logger.info(f"Capping dimensions to: {new_width}x{new_height}")
             image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
 
-        # Check if further compression needed based on file size
-        buffer = io.BytesIO()
-        image.save(buffer, format="JPEG", quality=quality)
-
-        if len(buffer.getvalue()) > self.max_image_size:
-            # Reduce size by 75% if still too large
-            width, height = image.size
-            new_size = (int(width * 0.75), int(height * 0.75))
-            logger.info(f"Image still too large, reducing to: {new_size}")
-            image = image.resize(new_size, Image.Resampling.LANCZOS)
-
         return image
 
     def convert_pdf_page_to_image(self, pdf_path: str, page_number: int = 1, resolution_matrix: float = 2.0, quality: int = 75):
@@ -798,12 +1452,11 @@ Make math engaging for students!
                 mat = fitz.Matrix(resolution_matrix, resolution_matrix)
                 logger.info(f"Converting page {page_number} with resolution matrix: {resolution_matrix}")
                 pix = page.get_pixmap(matrix=mat)
-                img_data = pix.tobytes("ppm")
-                image = Image.open(io.BytesIO(img_data))
+                image = pixmap_to_image(pix)
                 doc.close()
 
-                # PHASE 2: Pass quality parameter to optimization
-                optimized_image = self._optimize_image_size(image, quality=quality)
+                # Quality is applied at the final encode, only dimensions are capped here
+                optimized_image = self._optimize_image_size(image)
                 return optimized_image, total_pages
 
             except Exception as e:
@@ -824,12 +1477,11 @@ Make math engaging for students!
 
                 image = images[0]
 
-                # Get total page count
-                all_images = convert_from_path(pdf_path, dpi=72)
-                total_pages = len(all_images)
+                # pdfinfo reads the page count from the document structure, no rendering
+                total_pages = int(pdfinfo_from_path(pdf_path)["Pages"])
 
-                # PHASE 2: Pass quality parameter to optimization
-                optimized_image = self._optimize_image_size(image, quality=quality)
+                # Quality is applied at the final encode, only dimensions are capped here
+                optimized_image = self._optimize_image_size(image)
                 return optimized_image, total_pages
 
             except Exception as e:
@@ -894,17 +1546,8 @@ Return ONLY valid JSON with this exact structure:
                 timeout=self.vision_timeout
             )
 
-            # Parse response
-            result_text = response.choices[0].message.content.strip()
-
-            # Remove markdown code blocks if present
-            if result_text.startswith('```json'):
-                result_text = result_text[7:]  # Remove ```json
-            if result_text.endswith('```'):
-                result_text = result_text[:-3]  # Remove ```
-            result_text = result_text.strip()
-
-            result = json.loads(result_text)
+            # Parse response (strips code fences, repairs prose/trailing commas)
+            result = self._parse_json_response(response.choices[0].message.content)
 
             # Validate required fields
             required_fields = ["explanation", "real_world_example", "textbook_content", "memory_trick", "suggested_template"]
@@ -942,216 +1585,692 @@ Return ONLY valid JSON with this exact structure:
                 "processing_notes": f"Vision error: {str(e)}"
             }
 
-    def analyze_pdf_for_components(self, pdf_path: str, page_number: int = 1, context: Optional[str] = None, progress_callback: Optional[callable] = None) -> Dict[str, Any]:
-        """Analyze PDF with vision AI to generate component sequence suggestions for all pages"""
-        logger.info(f"Starting analyze_pdf_for_components for: {pdf_path}")
+    def _run_batch_cleanup(self, current_page: int, total_pages: int, progress_callback: Optional[callable] = None):
+        """Force garbage collection and report memory usage between page batches"""
+        gc.collect()  # Force garbage collection to free memory
+
         try:
-            # Get total page count first
-            logger.info("Getting total page count...")
-            _, total_pages = self.convert_pdf_page_to_image(pdf_path, 1)
-            logger.info(f"Processing PDF with {total_pages} pages")
-            
-            # Limit total pages for memory management
-            if total_pages > self.max_total_pages:
-                print(f"Warning: PDF has {total_pages} pages, limiting to {self.max_total_pages} for memory safety")
-                total_pages = self.max_total_pages
+            import psutil
+        except ImportError:
+            logger.warning("psutil not available - memory monitoring disabled")
+            return
+
+        # Monitor memory usage if psutil is available
+        try:
+            process = psutil.Process(os.getpid())
+            memory_mb = process.memory_info().rss / 1024 / 1024
+            memory_percent = process.memory_percent()
+
+            if progress_callback:
+                progress_callback({
+                    "status": "batch_cleanup",
+                    "current_page": current_page,
+                    "total_pages": total_pages,
+                    "memory_usage_mb": round(memory_mb, 1),
+                    "memory_percent": round(memory_percent, 1),
+                    "message": f"Memory cleanup: {memory_mb:.1f}MB used ({memory_percent:.1f}%)"
+                })
+
+            # Warning if memory usage is high
+            if memory_percent > 80:
                 if progress_callback:
                     progress_callback({
-                        "status": "warning",
-                        "current_page": 0,
+                        "status": "memory_warning",
+                        "current_page": current_page,
                         "total_pages": total_pages,
-                        "message": f"Large PDF detected - processing first {total_pages} pages only"
+                        "message": f"High memory usage detected: {memory_percent:.1f}%"
                     })
-            
+        except Exception as mem_error:
+            logger.warning(f"Memory monitoring error: {mem_error}")
+
+    def _group_adjacent_pages(self, pages: list, group_size: int) -> list:
+        """Split page numbers into runs of at most group_size consecutive pages"""
+        groups = []
+        for page in pages:
+            if groups and len(groups[-1]) < group_size and groups[-1][-1] == page - 1:
+                groups[-1].append(page)
+            else:
+                groups.append([page])
+        return groups
+
+    def _summarize_token_usage(self, responses_by_page: Dict[int, Dict[str, Any]]) -> Dict[str, Any]:
+        """Job totals plus each page's usage (batched pages carry their share of the batch)"""
+        per_page = {
+            page: response.get("token_usage") or self._empty_token_usage("unknown")
+            for page, response in sorted(responses_by_page.items())
+        }
+        totals = self._empty_token_usage()
+        for usage in per_page.values():
+            for key in totals:
+                totals[key] += usage.get(key, 0)
+        analyzed_pages = sum(1 for usage in per_page.values() if usage.get("calls"))
+        totals["calls"] = round(totals["calls"], 2)
+        totals.update({
+            "pages_per_request": self.pages_per_request,
+            "analyzed_pages": analyzed_pages,
+            "tokens_per_analyzed_page": round(totals["total_tokens"] / analyzed_pages) if analyzed_pages else 0,
+            "per_page": per_page
+        })
+        return totals
+
+    def _find_skippable_pages(self, raster_cache: PageRasterCache, pages: list) -> Dict[int, Dict[str, Any]]:
+        """Pre-pass: fingerprint every page at thumbnail resolution and map blank/duplicate pages"""
+        if not self.page_dedupe_enabled or not NUMPY_AVAILABLE:
+            return {}
+
+        try:
+            start_time = time.perf_counter()
+            fingerprints = {}
+            for page_number in pages:
+                layout = raster_cache.get_page_layout(page_number)
+                page_text = "\n".join(block["text"] for block in layout["blocks"]) if layout else None
+                fingerprints[page_number] = page_fingerprint(raster_cache.get_page_thumbnail(page_number), page_text)
+            page_map = find_blank_and_duplicate_pages(
+                fingerprints,
+                blank_ink_ratio=self.blank_page_ink_ratio,
+                max_hash_distance=self.duplicate_max_hash_distance,
+                max_changed_ratio=self.duplicate_max_changed_ratio
+            )
+            elapsed_ms = (time.perf_counter() - start_time) * 1000
+            logger.info(f"Blank/duplicate pre-pass over {len(pages)} pages took {elapsed_ms:.0f}ms: {page_map}")
+            return page_map
+        except Exception as e:
+            logger.warning(f"Blank/duplicate pre-pass failed, analyzing every page: {e}")
+            return {}
+
+    def _emit_page_components(self, progress_callback: Optional[callable], page_number: int, total_pages: int,
+                              page_result: Dict[str, Any]):
+        """Stream one page's validated components as soon as the page is done (provisional until merged)"""
+        if not progress_callback:
+            return
+        progress_callback({
+            "status": "page_components",
+            "current_page": page_number,
+            "total_pages": total_pages,
+            "provisional": True,
+            "component_sequence": page_result.get("component_sequence", []),
+            "suggested_template": page_result.get("suggested_template"),
+            "overall_confidence": page_result.get("overall_confidence"),
+            "failed": "error_info" in page_result
+        })
+
+    def _emit_page_skipped(self, progress_callback: Optional[callable], page_number: int, total_pages: int,
+                           entry: Dict[str, Any]):
+        if not progress_callback:
+            return
+        if entry["action"] == "reused":
+            message = f"Page {page_number} duplicates page {entry['source_page']} - reusing its result"
+        else:
+            message = f"Page {page_number} is blank - skipped"
+        progress_callback({
+            "status": "page_skipped",
+            "current_page": page_number,
+            "total_pages": total_pages,
+            "reason": entry["reason"],
+            "message": message
+        })
+
+    def _checkpoint_page(self, page_result_callback: Optional[callable], page_number: int, page_result: Dict[str, Any]):
+        """Hand a successfully analyzed page to the caller's checkpoint hook (failed pages are retried on resume)"""
+        if not page_result_callback or "error_info" in page_result:
+            return
+        try:
+            page_result_callback(page_number, page_result)
+        except Exception as e:
+            logger.warning(f"Checkpoint callback failed for page {page_number}: {e}")
+
+    def _increment_job_stat(self, job_stats: Optional[Dict[str, int]], key: str, amount: int = 1):
+        """Thread-safe counter update for per-job statistics"""
+        if job_stats is None:
+            return
+        with self._job_stats_lock:
+            job_stats[key] = job_stats.get(key, 0) + amount
+
+    def _get_cached_page_result(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        """Look up a page result, treating cache failures as misses"""
+        try:
+            return self.page_cache.get(cache_key)
+        except Exception as e:
+            logger.warning(f"Page cache lookup failed: {e}")
+            return None
+
+    def _prepare_page(self, current_page: int, user_prompt: str, raster_cache: Optional[PageRasterCache],
+                      job_stats: Optional[Dict[str, int]]) -> Dict[str, Any]:
+        """
+        Route a page and look it up in the page cache before any model call
+
+        Returns the route, the page's user prompt and cache key, and page_result
+        when the page needs no model call (cache hit or built from the text layer).
+        """
+        # Route the page from its PDF structure: text-dominant pages skip the image path
+        layout = None
+        if raster_cache and self.text_page_mode in ("text_prompt", "local"):
+            layout = raster_cache.get_page_layout(current_page)
+        route, route_reason = self._classify_page(layout)
+        self._record_page_route(job_stats, current_page, route)
+        logger.info(f"Page {current_page} routed to {route} path ({route_reason})")
+
+        if route == "text":
+            page_text = self._format_text_layout(layout)
+            user_prompt = (
+                f"{user_prompt}\n\nThis page contains no figures, so its extracted text layer is provided "
+                f"instead of an image (lines starting with ## are headings):\n\n{page_text}"
+            )
+
+        # Check the persistent page cache before calling the vision API
+        cache_key = None
+        page_result = None
+        if route == "text" and self.text_page_mode == "local":
+            page_result = self._build_components_from_text_layout(layout, current_page)
+        elif self.page_cache and raster_cache:
+            # Text-routed prompts already embed the page text, so they don't need the raster hash
+            page_hash = "text-layer" if route == "text" else raster_cache.get_page_hash(current_page)
+            cache_key = PageAnalysisCache.make_key(
+                page_hash,
+                self.system_prompt_version,
+                self.vision_model,
+                user_prompt
+            )
+            page_result = self._get_cached_page_result(cache_key)
+            self._increment_job_stat(job_stats, "cache_hits" if page_result is not None else "cache_misses")
+
+        return {
+            "route": route,
+            "route_reason": route_reason,
+            "user_prompt": user_prompt,
+            "cache_key": cache_key,
+            "cache_hit": cache_key is not None and page_result is not None,
+            "page_result": page_result
+        }
+
+    def _finalize_page_result(self, current_page: int, total_pages: int, page_result: Dict[str, Any],
+                              prepared: Dict[str, Any], token_usage: Dict[str, Any],
+                              progress_callback: Optional[callable] = None,
+                              job_stats: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+        """Validate and default a page's response, store it in the page cache and report the page as done"""
+        cache_key = prepared["cache_key"]
+        cache_hit = prepared["cache_hit"]
+
+        # Validate component sequence structure and parameters
+        if "component_sequence" not in page_result:
+            page_result["component_sequence"] = [{
+                "type": "paragraph",
+                "order": 1,
+                "parameters": {"text": f"Unable to analyze page {current_page} content structure"},
+                "confidence": 0.1
+            }]
+
+        # Validate each component against schemas
+        validated_components = []
+        for component in page_result["component_sequence"]:
+            component_type = component.get("type")
+            parameters = component.get("parameters", {})
+
+            is_valid, error_msg = validate_component_parameters(component_type, parameters)
+            if is_valid:
+                validated_components.append(component)
+            else:
+                # Log validation error and provide fallback
+                print(f"Page {current_page} component validation failed: {error_msg}")
+                # Keep component but note validation issue
+                component["validation_error"] = error_msg
+                validated_components.append(component)
+
+        page_result["component_sequence"] = validated_components
+
+        if "suggested_template" not in page_result:
+            page_result["suggested_template"] = "text-heavy"
+
+        if "overall_confidence" not in page_result:
+            page_result["overall_confidence"] = 0.3
+
+        if "processing_notes" not in page_result:
+            page_result["processing_notes"] = f"Component sequence analysis completed for page {current_page}"
+
+        # Usage belongs to this run, not to the cached analysis
+        page_result.pop("token_usage", None)
+        if cache_key and not cache_hit:
+            try:
+                self.page_cache.put(cache_key, page_result)
+            except Exception as e:
+                logger.warning(f"Page cache store failed for page {current_page}: {e}")
+
+        route_label = "text-layer" if prepared["route"] == "text" else "vision"
+        page_result["processing_notes"] = f"[{route_label} route: {prepared['route_reason']}] {page_result['processing_notes']}"
+        page_result["token_usage"] = token_usage
+
+        # Send page completion progress update
+        if progress_callback:
+            update = {
+                "status": "page_completed",
+                "current_page": current_page,
+                "total_pages": total_pages,
+                "token_usage": token_usage,
+                "message": f"Completed page {current_page} of {total_pages}"
+            }
+            if cache_key:
+                update["cache_hit"] = cache_hit
+                update["cache_hits"] = job_stats.get("cache_hits", 0) if job_stats else 0
+                update["cache_misses"] = job_stats.get("cache_misses", 0) if job_stats else 0
+            progress_callback(update)
+
+        return page_result
+
+    def _emit_page_processing(self, progress_callback: Optional[callable], current_page: int, total_pages: int):
+        if progress_callback:
+            progress_callback({
+                "status": "processing",
+                "current_page": current_page,
+                "total_pages": total_pages,
+                "message": f"Processing page {current_page} of {total_pages}"
+            })
+
+    def _analyze_single_page(self, pdf_path: str, current_page: int, total_pages: int, system_prompt: str,
+                             user_prompt: str, progress_callback: Optional[callable] = None,
+                             raster_cache: Optional[PageRasterCache] = None,
+                             job_stats: Optional[Dict[str, int]] = None,
+                             prepared: Optional[Dict[str, Any]] = None,
+                             prior_usage: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Analyze one page and return its validated response (or a fallback carrying error_info)
+
+        prepared/prior_usage are passed when the page comes back from a failed
+        multi-page request: routing and the cache lookup are reused and the
+        page's share of the batch tokens is added to its usage.
+        """
+        if prepared is None:
+            self._emit_page_processing(progress_callback, current_page, total_pages)
+        token_usage = self._empty_token_usage()
+
+        try:
+            if prepared is None:
+                prepared = self._prepare_page(current_page, user_prompt, raster_cache, job_stats)
+            route = prepared["route"]
+            page_result = prepared["page_result"]
+
+            if prepared["cache_hit"]:
+                logger.info(f"Page cache hit for page {current_page} - skipping vision API")
+                token_usage = self._empty_token_usage("cache")
+            elif page_result is not None:
+                logger.info(f"Page {current_page} built locally from the text layer")
+                token_usage = self._empty_token_usage("text_layer")
+            else:
+                token_usage = self._begin_usage_tracking(prior_usage)
+                try:
+                    if route == "text":
+                        logger.info(f"Calling text-only API for page {current_page}...")
+                        page_result = self._call_text_api_with_retry(current_page, system_prompt, prepared["user_prompt"])
+                    else:
+                        # PHASE 1 & 2: Use retry wrapper with progressive degradation
+                        # Call vision API with automatic retry, timeout scaling, and quality degradation
+                        logger.info(f"Calling vision API with retry logic for page {current_page}...")
+                        page_result = self._call_vision_api_with_retry(
+                            pdf_path=pdf_path,
+                            page_number=current_page,
+                            system_prompt=system_prompt,
+                            user_prompt=prepared["user_prompt"],
+                            raster_cache=raster_cache
+                        )
+                finally:
+                    self._end_usage_tracking(token_usage)
+
+            return self._finalize_page_result(
+                current_page, total_pages, page_result, prepared, token_usage, progress_callback, job_stats
+            )
+
+        except Exception as page_error:
+            logger.error(f"Error processing page {current_page}: {str(page_error)}")
+            logger.error(f"Full traceback:", exc_info=True)
+
+            # Send error progress update
+            if progress_callback:
+                progress_callback({
+                    "status": "page_error",
+                    "current_page": current_page,
+                    "total_pages": total_pages,
+                    "message": f"Page {current_page} failed - continuing with remaining pages"
+                })
+
+            # Add fallback response for failed page with detailed error info
+            error_type = type(page_error).__name__
+            return {
+                "component_sequence": [{
+                    "type": "paragraph",
+                    "order": 1,
+                    "parameters": {"text": f"Page {current_page} processing failed ({error_type})"},
+                    "confidence": 0.0
+                }],
+                "suggested_template": "text-heavy",
+                "overall_confidence": 0.0,
+                "processing_notes": f"Page {current_page} failed: {error_type} - {str(page_error)[:100]}",
+                "token_usage": token_usage,
+                "error_info": {
+                    "page_number": current_page,
+                    "error_type": error_type,
+                    "error_class": classify_api_error(page_error),
+                    "error_message": str(page_error)
+                }
+            }
+
+        finally:
+            # Page is done (success or not) - free its raster
+            if raster_cache:
+                raster_cache.release(current_page)
+
+    def _analyze_page_group(self, pdf_path: str, pages: list, total_pages: int, system_prompt: str,
+                            user_prompt: str, progress_callback: Optional[callable] = None,
+                            raster_cache: Optional[PageRasterCache] = None,
+                            job_stats: Optional[Dict[str, int]] = None) -> Dict[int, Dict[str, Any]]:
+        """
+        Analyze adjacent pages, sending the image pages among them in one request
+
+        Cache hits and text-layer pages are handled on their own. Pages the
+        batched reply doesn't cover with a valid result (or all of them, if the
+        request fails) go through the single-page path.
+        """
+        # Tag every call made for these pages on this worker thread
+        self._call_context.tags = (job_stats or {}).get("call_tags") or {}
+
+        if len(pages) == 1:
+            return {pages[0]: self._analyze_single_page(
+                pdf_path, pages[0], total_pages, system_prompt, user_prompt, progress_callback, raster_cache, job_stats
+            )}
+
+        results = {}
+        prepared_pages = {}
+        batch_pages = []
+        for current_page in pages:
+            self._emit_page_processing(progress_callback, current_page, total_pages)
+            try:
+                prepared_pages[current_page] = self._prepare_page(current_page, user_prompt, raster_cache, job_stats)
+            except Exception as e:
+                # Let the single-page path redo (and report) the failing step
+                logger.warning(f"Could not prepare page {current_page} for a batched request: {e}")
+                results[current_page] = self._analyze_single_page(
+                    pdf_path, current_page, total_pages, system_prompt, user_prompt, progress_callback,
+                    raster_cache, job_stats
+                )
+                continue
+            if prepared_pages[current_page]["route"] != "text" and prepared_pages[current_page]["page_result"] is None:
+                batch_pages.append(current_page)
+
+        batch_results, batch_usage = {}, {}
+        if len(batch_pages) > 1:
+            batch_results, batch_usage = self._call_vision_batch(
+                pdf_path, batch_pages, system_prompt, user_prompt, raster_cache
+            )
+
+        for current_page, prepared in prepared_pages.items():
+            if current_page in batch_results:
+                try:
+                    results[current_page] = self._finalize_page_result(
+                        current_page, total_pages, batch_results[current_page], prepared,
+                        batch_usage[current_page], progress_callback, job_stats
+                    )
+                    if raster_cache:
+                        raster_cache.release(current_page)
+                    continue
+                except Exception as e:
+                    logger.warning(f"Batched result for page {current_page} unusable, retrying it alone: {e}")
+            results[current_page] = self._analyze_single_page(
+                pdf_path, current_page, total_pages, system_prompt, user_prompt, progress_callback,
+                raster_cache, job_stats, prepared=prepared, prior_usage=batch_usage.get(current_page)
+            )
+
+        return results
+
+    def _call_vision_batch(self, pdf_path: str, pages: list, system_prompt: str, user_prompt: str,
+                           raster_cache: Optional[PageRasterCache] = None):
+        """
+        One completion covering several page images, answered as {"page_<n>": page analysis}
+
+        Single attempt - the per-page retry policies live on the single-page path,
+        which takes over for every page this returns no result for. Returns
+        (results by page, token usage by page); the batch's usage is split evenly
+        across its pages.
+        """
+        page_keys = [f"page_{page}" for page in pages]
+        batch_prompt = (
+            f"{user_prompt}\n\nThis request contains {len(pages)} consecutive pages of the same document, "
+            f"each image preceded by its page label. Analyze every page separately, exactly as you would a "
+            f"single page. Return one JSON object with the keys {', '.join(page_keys)}; each value is that "
+            f"page's analysis object with component_sequence, suggested_template, overall_confidence and "
+            f"processing_notes."
+        )
+        content = [{"type": "text", "text": batch_prompt}]
+        for page in pages:
+            content.append({"type": "text", "text": f"page_{page}:"})
+            content.append(self._build_page_image_content(pdf_path, page, 0, raster_cache))
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": content}
+        ]
+        response_schema = None
+        if self.structured_output_mode == 'json_schema':
+            response_schema = build_batch_response_schema(page_keys, self.component_response_schema)
+
+        logger.info(f"Calling vision API for pages {pages} in one batched request")
+        usage = self._begin_usage_tracking()
+        results = {}
+        start_time = time.time()
+        status, error_class = "success", None
+        try:
+            response = self._create_completion(
+                messages,
+                max(self._get_page_timeout(page) for page in pages) * len(pages),
+                max_tokens=self.max_tokens * len(pages),
+                response_schema=response_schema
+            )
+            raw_text = response.choices[0].message.content or ""
+            if self._is_truncated(response, raw_text):
+                raise ResponseParseError("batched reply truncated", raw_text)
+            parsed = self._parse_json_response(raw_text)
+            for page, page_key in zip(pages, page_keys):
+                try:
+                    results[page] = self._check_page_result(parsed.get(page_key), raw_text)
+                except ResponseValidationError as e:
+                    logger.warning(f"Batched reply has no usable result for page {page}: {e}")
+        except Exception as e:
+            status, error_class = "error", classify_api_error(e)
+            logger.warning(f"Batched request for pages {pages} failed ({error_class}): {str(e)[:200]} "
+                           f"- falling back to single-page calls")
+        finally:
+            self._end_usage_tracking(usage)
+            self._record_call_metrics("vision_batch", pages, usage, time.time() - start_time, 1, status, error_class)
+
+        share = {
+            key: round(usage[key] / len(pages))
+            for key in ("prompt_tokens", "completion_tokens", "total_tokens", "payload_bytes")
+        }
+        page_usage = {
+            page: {**share, "calls": round(usage["calls"] / len(pages), 2), "batch_pages": pages}
+            for page in pages
+        }
+        logger.info(f"Batched request for pages {pages}: {len(results)}/{len(pages)} pages usable, "
+                    f"{usage['total_tokens']} tokens ({share['total_tokens']} per page)")
+        return results, page_usage
+
+    def analyze_pdf_for_components(self, pdf_path: str, page_number: int = 1, context: Optional[str] = None,
+                                   progress_callback: Optional[callable] = None,
+                                   resume_pages: Optional[Dict[int, Dict[str, Any]]] = None,
+                                   page_result_callback: Optional[callable] = None,
+                                   call_tags: Optional[Dict[str, Any]] = None,
+                                   first_page: Optional[int] = None,
+                                   last_page: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Analyze PDF with vision AI to generate component sequence suggestions for all pages
+
+        resume_pages maps page numbers to results checkpointed by an earlier run of the
+        same job - those pages are not analyzed again. page_result_callback(page_number, result)
+        is called for every successfully analyzed page so callers can checkpoint it.
+        call_tags (job_id, node_id, session_id) label this job's entries in the call metrics.
+        first_page/last_page (1-based, inclusive) limit the analysis to a page range; page
+        numbers in events and results stay those of the whole document.
+        A whole-job error (unreadable PDF, bad page range, ...) returns a placeholder
+        result with failed=True and the error message.
+        """
+        logger.info(f"Starting analyze_pdf_for_components for: {pdf_path}")
+        raster_cache = None
+        try:
+            # Get total page count first from a structural probe (no rendering)
+            logger.info("Getting total page count...")
+            pdf_info = probe_pdf(pdf_path)
+            if pdf_info["needs_password"]:
+                raise ValueError("PDF is password protected")
+            total_pages = pdf_info["page_count"]
+            logger.info(f"Processing PDF with {total_pages} pages (text layer: {pdf_info['has_text_layer']})")
+            first_page, last_page = resolve_page_range(total_pages, first_page, last_page)
+            selected_pages = list(range(first_page, last_page + 1))
+            page_count = len(selected_pages)
+            range_label = f"pages {first_page}-{last_page} of {total_pages}" if page_count < total_pages else f"{total_pages} pages"
+
+            # Open the PDF once for the whole job; only the page window's rasters are ever held
+            raster_cache = PageRasterCache(
+                pdf_path,
+                base_resolution=max(self.resolution_matrices),
+                max_cached_pages=self.page_window
+            )
+
             # Send initial progress update
             if progress_callback:
                 progress_callback({
                     "status": "started",
                     "current_page": 0,
                     "total_pages": total_pages,
-                    "message": f"Starting analysis of {total_pages} pages"
+                    "first_page": first_page,
+                    "last_page": last_page,
+                    "message": f"Starting analysis of {range_label}"
                 })
             
             # Process pages in batches for memory management
-            page_responses = []
-            failed_pages = []  # Track pages that failed processing
-
-            logger.info("Importing dependencies for batch processing...")
-            import time
-            import gc
-            try:
-                import psutil
-                psutil_available = True
-            except ImportError:
-                logger.warning("psutil not available - memory monitoring disabled")
-                psutil_available = False
-            import os
-            
-            for current_page in range(1, total_pages + 1):
-                print(f"Processing page {current_page} of {total_pages}")
-                
-                # Batch processing: monitor memory and force cleanup
-                if current_page % self.max_pages_per_batch == 0:
-                    gc.collect()  # Force garbage collection to free memory
-
-                    # Monitor memory usage if psutil is available
-                    if psutil_available:
-                        try:
-                            process = psutil.Process(os.getpid())
-                            memory_mb = process.memory_info().rss / 1024 / 1024
-                            memory_percent = process.memory_percent()
-
-                            if progress_callback:
-                                progress_callback({
-                                    "status": "batch_cleanup",
-                                    "current_page": current_page,
-                                    "total_pages": total_pages,
-                                    "memory_usage_mb": round(memory_mb, 1),
-                                    "memory_percent": round(memory_percent, 1),
-                                    "message": f"Memory cleanup: {memory_mb:.1f}MB used ({memory_percent:.1f}%)"
-                                })
-
-                            # Warning if memory usage is high
-                            if memory_percent > 80:
-                                if progress_callback:
-                                    progress_callback({
-                                        "status": "memory_warning",
-                                        "current_page": current_page,
-                                        "total_pages": total_pages,
-                                        "message": f"High memory usage detected: {memory_percent:.1f}%"
-                                    })
-                        except Exception as mem_error:
-                            logger.warning(f"Memory monitoring error: {mem_error}")
-                    
-                    time.sleep(self.batch_delay)  # Brief delay to prevent API rate limits
-                
-                # Send progress update for current page
-                if progress_callback:
+            job_stats = {"cache_hits": 0, "cache_misses": 0, "call_tags": call_tags or {}}
+            system_prompt = self.component_system_prompt
+            user_prompt = f"Analyze this educational content page and suggest the optimal component sequence to recreate it. Focus on the visual layout and content structure. {f'Context: {context}' if context else ''}"
+
+            # Blank pages are skipped and near-duplicates reuse an earlier page's result
+            page_map = self._find_skippable_pages(raster_cache, selected_pages)
+            pages_to_analyze = [page for page in selected_pages if page not in page_map]
+            responses_by_page = {}
+            duplicates_by_source = {}
+            for current_page, entry in sorted(page_map.items()):
+                if entry["action"] == "reused":
+                    duplicates_by_source.setdefault(entry["source_page"], []).append(current_page)
+
+            def record_page(current_page, page_response, emit=True):
+                """Store a finished page, stream its components and resolve pages that duplicate it"""
+                responses_by_page[current_page] = page_response
+                if emit:
+                    self._emit_page_components(progress_callback, current_page, total_pages, page_response)
+                for duplicate_page in duplicates_by_source.get(current_page, []):
+                    reused_response = copy.deepcopy(page_response)
+                    reused_response["processing_notes"] = f"[reused from page {current_page}] {reused_response.get('processing_notes', '')}"
+                    reused_response["token_usage"] = self._empty_token_usage("reused")
+                    if "error_info" in reused_response:
+                        reused_response["error_info"]["page_number"] = duplicate_page
+                    responses_by_page[duplicate_page] = reused_response
+                    if emit:
+                        self._emit_page_skipped(progress_callback, duplicate_page, total_pages, page_map[duplicate_page])
+                        self._emit_page_components(progress_callback, duplicate_page, total_pages, reused_response)
+
+            # Blank pages contribute nothing - report them up front
+            for current_page, entry in sorted(page_map.items()):
+                if entry["action"] == "skipped":
+                    self._emit_page_skipped(progress_callback, current_page, total_pages, entry)
+                    self._emit_page_components(progress_callback, current_page, total_pages, {"component_sequence": []})
+
+            # Restore pages a previous (interrupted) run of this job already finished (already streamed then)
+            if resume_pages:
+                restored = {page: result for page, result in resume_pages.items() if page in pages_to_analyze}
+                for current_page, page_response in sorted(restored.items()):
+                    record_page(current_page, page_response, emit=False)
+                pages_to_analyze = [page for page in pages_to_analyze if page not in restored]
+                if restored and progress_callback:
                     progress_callback({
-                        "status": "processing",
-                        "current_page": current_page,
+                        "status": "resumed",
+                        "current_page": len(restored),
                         "total_pages": total_pages,
-                        "message": f"Processing page {current_page} of {total_pages}"
+                        "restored_pages": sorted(restored),
+                        "message": f"Resuming analysis - {len(restored)} pages restored from checkpoint"
                     })
-                
-                try:
-                    # PHASE 1 & 2: Use retry wrapper with progressive degradation
-                    # Use cached system prompt with detailed component schemas
-                    system_prompt = self.component_system_prompt
-                    user_prompt = f"Analyze this educational content page and suggest the optimal component sequence to recreate it. Focus on the visual layout and content structure. {f'Context: {context}' if context else ''}"
-
-                    # Call vision API with automatic retry, timeout scaling, and quality degradation
-                    logger.info(f"Calling vision API with retry logic for page {current_page}...")
-                    page_result = self._call_vision_api_with_retry(
-                        pdf_path=pdf_path,
-                        page_number=current_page,
-                        system_prompt=system_prompt,
-                        user_prompt=user_prompt
-                    )
 
-                    # Validate component sequence structure and parameters
-                    if "component_sequence" not in page_result:
-                        page_result["component_sequence"] = [{
-                            "type": "paragraph",
-                            "order": 1,
-                            "parameters": {"text": f"Unable to analyze page {current_page} content structure"},
-                            "confidence": 0.1
-                        }]
-
-                    # Validate each component against schemas
-                    validated_components = []
-                    for component in page_result["component_sequence"]:
-                        component_type = component.get("type")
-                        parameters = component.get("parameters", {})
-
-                        is_valid, error_msg = validate_component_parameters(component_type, parameters)
-                        if is_valid:
-                            validated_components.append(component)
-                        else:
-                            # Log validation error and provide fallback
-                            print(f"Page {current_page} component validation failed: {error_msg}")
-                            # Keep component but note validation issue
-                            component["validation_error"] = error_msg
-                            validated_components.append(component)
-
-                    page_result["component_sequence"] = validated_components
-
-                    if "suggested_template" not in page_result:
-                        page_result["suggested_template"] = "text-heavy"
-
-                    if "overall_confidence" not in page_result:
-                        page_result["overall_confidence"] = 0.3
-
-                    if "processing_notes" not in page_result:
-                        page_result["processing_notes"] = f"Component sequence analysis completed for page {current_page}"
-
-                    page_responses.append(page_result)
-
-                    # Memory cleanup happens inside _call_vision_api_with_retry method
-                    
-                    # Send page completion progress update
-                    if progress_callback:
-                        progress_callback({
-                            "status": "page_completed",
-                            "current_page": current_page,
-                            "total_pages": total_pages,
-                            "message": f"Completed page {current_page} of {total_pages}"
-                        })
-                    
-                except Exception as page_error:
-                    logger.error(f"Error processing page {current_page}: {str(page_error)}")
-                    logger.error(f"Full traceback:", exc_info=True)
-                    failed_pages.append(current_page)
-                    
-                    # Send error progress update
-                    if progress_callback:
-                        progress_callback({
-                            "status": "page_error",
-                            "current_page": current_page,
-                            "total_pages": total_pages,
-                            "message": f"Page {current_page} failed - continuing with remaining pages"
-                        })
-                    
-                    # Add fallback response for failed page with detailed error info
-                    error_type = type(page_error).__name__
-                    page_responses.append({
-                        "component_sequence": [{
-                            "type": "paragraph",
-                            "order": 1,
-                            "parameters": {"text": f"Page {current_page} processing failed ({error_type})"},
-                            "confidence": 0.0
-                        }],
-                        "suggested_template": "text-heavy",
-                        "overall_confidence": 0.0,
-                        "processing_notes": f"Page {current_page} failed: {error_type} - {str(page_error)[:100]}",
-                        "error_info": {
-                            "page_number": current_page,
-                            "error_type": error_type,
-                            "error_message": str(page_error)
-                        }
-                    })
-                    
-                    # Continue processing remaining pages instead of stopping
-            
+            # Work units: single pages, or runs of up to pages_per_request adjacent pages per request
+            page_groups = self._group_adjacent_pages(pages_to_analyze, self.pages_per_request)
+
+            def record_group(group_results):
+                for current_page, page_response in sorted(group_results.items()):
+                    self._checkpoint_page(page_result_callback, current_page, page_response)
+                    record_page(current_page, page_response)
+
+            if self.max_concurrent_pages > 1 and len(page_groups) > 1:
+                # Keep up to max_concurrent_pages requests in flight; results land by page index. Groups are
+                # submitted as the window frees up, so pages are rasterized in order and never all at once
+                logger.info(f"Concurrent page analysis enabled ({self.max_concurrent_pages} requests in flight, "
+                            f"up to {self.pages_per_request} pages per request, {self.page_window}-page window)")
+                completed_count = 0
+                pending_groups = iter(page_groups)
+                in_flight = {}  # future -> number of pages
+                with ThreadPoolExecutor(max_workers=self.max_concurrent_pages) as executor:
+                    while True:
+                        while sum(in_flight.values()) < self.page_window:
+                            pages = next(pending_groups, None)
+                            if pages is None:
+                                break
+                            future = executor.submit(
+                                self._analyze_page_group, pdf_path, pages, total_pages,
+                                system_prompt, user_prompt, progress_callback, raster_cache, job_stats
+                            )
+                            in_flight[future] = len(pages)
+                        if not in_flight:
+                            break
+                        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            in_flight.pop(future)
+                            group_results = future.result()
+                            record_group(group_results)
+                            previous_count, completed_count = completed_count, completed_count + len(group_results)
+                            if completed_count // self.max_pages_per_batch > previous_count // self.max_pages_per_batch:
+                                self._run_batch_cleanup(completed_count, total_pages, progress_callback)
+            else:
+                for pages in page_groups:
+                    print(f"Processing page{'s' if len(pages) > 1 else ''} {', '.join(map(str, pages))} of {total_pages}")
+
+                    # Batch processing: monitor memory and force cleanup
+                    if any(current_page % self.max_pages_per_batch == 0 for current_page in pages):
+                        self._run_batch_cleanup(pages[-1], total_pages, progress_callback)
+
+                    record_group(self._analyze_page_group(
+                        pdf_path, pages, total_pages, system_prompt, user_prompt, progress_callback,
+                        raster_cache, job_stats
+                    ))
+
+            page_responses = [responses_by_page[page] for page in sorted(responses_by_page)]
+
+            # Track pages that failed processing (in page order)
+            failed_pages = [resp["error_info"]["page_number"] for resp in page_responses if "error_info" in resp]
+
             # Send final completion progress update with error summary
-            successful_pages = total_pages - len(failed_pages)
+            successful_pages = page_count - len(failed_pages)
             if progress_callback:
                 if failed_pages:
-                    message = f"Analysis completed - {successful_pages}/{total_pages} pages successful (pages {failed_pages} had errors)"
+                    message = f"Analysis completed - {successful_pages}/{page_count} pages successful (pages {failed_pages} had errors)"
                     progress_callback({
                         "status": "completed_with_errors",
-                        "current_page": total_pages,
+                        "current_page": last_page,
                         "total_pages": total_pages,
                         "successful_pages": successful_pages,
                         "failed_pages": failed_pages,
+                        "cache_hits": job_stats["cache_hits"],
+                        "cache_misses": job_stats["cache_misses"],
                         "message": message
                     })
                 else:
                     progress_callback({
                         "status": "completed",
-                        "current_page": total_pages,
+                        "current_page": last_page,
                         "total_pages": total_pages,
-                        "message": f"Analysis completed - processed {total_pages} pages successfully"
+                        "cache_hits": job_stats["cache_hits"],
+                        "cache_misses": job_stats["cache_misses"],
+                        "message": f"Analysis completed - processed {range_label} successfully"
                     })
             
             # Merge all page responses into single result
@@ -1160,12 +2279,42 @@ Return ONLY valid JSON with this exact structure:
             # Add error summary to final result
             if failed_pages:
                 merged_result["error_summary"] = {
-                    "total_pages": total_pages,
+                    "total_pages": page_count,
                     "successful_pages": successful_pages,
                     "failed_pages": failed_pages,
-                    "success_rate": f"{(successful_pages/total_pages)*100:.1f}%"
+                    "success_rate": f"{(successful_pages/page_count)*100:.1f}%"
                 }
                 merged_result["processing_notes"] += f" | {len(failed_pages)} pages had errors"
+
+            # Token usage per page and for the whole job, to compare single-page and batched requests
+            merged_result["token_usage"] = self._summarize_token_usage(responses_by_page)
+
+            # Pages that never reached the vision API
+            if page_map:
+                merged_result["page_skip_summary"] = {
+                    "total_pages": page_count,
+                    "analyzed_pages": len(pages_to_analyze),
+                    "skipped_pages": sorted(page for page, entry in page_map.items() if entry["action"] == "skipped"),
+                    "reused_pages": {
+                        page: entry["source_page"] for page, entry in sorted(page_map.items()) if entry["action"] == "reused"
+                    },
+                    "page_map": page_map
+                }
+                merged_result["processing_notes"] += (
+                    f" | {len(page_map)} blank/duplicate pages skipped without a vision call"
+                )
+
+            if page_count < total_pages:
+                merged_result["page_range"] = {"first_page": first_page, "last_page": last_page, "document_pages": total_pages}
+
+            # Per-page routing decisions (text-layer fast path vs image path)
+            page_routes = job_stats.get("page_routes", {})
+            text_route_pages = sorted(page for page, route in page_routes.items() if route == "text")
+            if text_route_pages and len(page_responses) > 1:
+                vision_route_pages = sorted(page for page, route in page_routes.items() if route != "text")
+                merged_result["processing_notes"] += (
+                    f" | Page routing: text-layer pages {text_route_pages}, vision pages {vision_route_pages}"
+                )
             
             return merged_result
 
@@ -1179,10 +2328,13 @@ Return ONLY valid JSON with this exact structure:
                 }],
                 "suggested_template": "text-heavy",
                 "overall_confidence": 0.0,
-                "processing_notes": f"JSON parsing error: {str(e)}"
+                "processing_notes": f"JSON parsing error: {str(e)}",
+                "failed": True,
+                "error": f"JSON parsing error: {str(e)}"
             }
 
         except Exception as e:
+            # failed/error let job runners record the failure instead of storing this placeholder as a result
             return {
                 "component_sequence": [{
                     "type": "paragraph",
@@ -1192,5 +2344,11 @@ Return ONLY valid JSON with this exact structure:
                 }],
                 "suggested_template": "text-heavy",
                 "overall_confidence": 0.0,
-                "processing_notes": f"Vision error: {str(e)}"
-            }
\ No newline at end of file
+                "processing_notes": f"Vision error: {str(e)}",
+                "failed": True,
+                "error": str(e)
+            }
+
+        finally:
+            if raster_cache:
+                raster_cache.close()